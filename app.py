@@ -1,6 +1,13 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT License.
 
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import time
 import traceback
 import uuid
 import logging
@@ -10,13 +17,20 @@ from http import HTTPStatus
 
 from aiohttp import web
 from aiohttp.web import Request, Response, json_response
-from botbuilder.core import TurnContext
+from botbuilder.core import TurnContext, serializer_helper
 from botbuilder.core.integration import aiohttp_error_middleware
-from botbuilder.integration.aiohttp import CloudAdapter, ConfigurationBotFrameworkAuthentication
-from botbuilder.schema import Activity, ActivityTypes, ConversationReference, Attachment, ErrorResponseException
-from botbuilder.core import MessageFactory
+from botbuilder.integration.aiohttp import CloudAdapter
+from botbuilder.schema import Activity, ActivityTypes, ConversationReference, ErrorResponseException
 
-from bots import ProactiveBot
+from bots import (AdaptiveRateLimiter, BroadcastEngine, CardRenderer, DeadLetterError, OutboundMessageQueue,
+                  PooledBotFrameworkAuthentication, ProactiveBot)
+from bots import metrics, reference_io
+from bots.coalescer import MessageCoalescer
+from bots.inbound import ActivityDeduplicator, InboundTurnExecutor, requires_inline_processing
+from bots.rate_limiter import get_status_code
+from bots.scheduler import MIN_RECURRENCE_INTERVAL, MessageScheduler
+from bots.redis_topology import parse_addresses
+from bots.reference_expiry import is_dead_conversation_error
 from config import DefaultConfig
 
 # 配置日志
@@ -30,8 +44,11 @@ CONFIG = DefaultConfig()
 
 API_KEY = CONFIG.API_KEY
 
-# Create adapter.
-ADAPTER = CloudAdapter(ConfigurationBotFrameworkAuthentication(CONFIG))
+# 适配器、机器人和发送组件由 create_app 在每个 worker 进程中创建
+ADAPTER = None
+
+# 出站认证：复用 ConnectorClient 连接并缓存访问令牌（由 create_app 创建）
+AUTHENTICATION = None
 
 # 添加认证装饰器
 def require_api_key(func):
@@ -76,6 +93,8 @@ async def on_error(context: TurnContext, error: Exception):
     # 检查是否是 Bot 不在对话列表中的错误
     if isinstance(error, ErrorResponseException) and "BotNotInConversationRoster" in str(error):
         logger.warning("Bot is not part of the conversation roster. The bot may have been removed from the team/chat.")
+        if CONFIG.REMOVE_DEAD_REFERENCES:
+            await BOT.remove_conversation_reference(context.activity.conversation.id)
         return
     
     # 其他错误的处理
@@ -101,32 +120,280 @@ async def on_error(context: TurnContext, error: Exception):
     except Exception as send_error:
         logger.error(f"Failed to send error message: {send_error}")
 
-ADAPTER.on_turn_error = on_error
-
 # App ID
 APP_ID = CONFIG.APP_ID if CONFIG.APP_ID else uuid.uuid4()
 
-# 创建机器人实例，配置Redis连接信息
-try:
-    BOT = ProactiveBot(
-        redis_host=CONFIG.REDIS_HOST,
-        redis_port=CONFIG.REDIS_PORT,
-        redis_db=CONFIG.REDIS_DB,
-        redis_password=CONFIG.REDIS_PASSWORD
-    )
-    logger.info("Bot initialized successfully with Redis storage")
-except Exception as e:
-    logger.error(f"Failed to initialize bot: {e}")
-    raise
+# 机器人实例（由 create_app 创建）
+BOT = None
+
+# 默认的广播消息
+DEFAULT_BROADCAST_MESSAGE = "proactive hello from Redis storage!"
+
+# 应用生命周期（cleanup_ctx）：按顺序启动，退出时按相反顺序清理；某一步启动失败时已启动的部分也会被清理
+
+# 出站认证：后台刷新访问令牌，退出时关闭复用的连接
+async def connector_context(app: web.Application):
+    AUTHENTICATION.start()
+    yield
+    await AUTHENTICATION.close()
+
+# 存储：在事件循环中异步连接Redis（导入和创建应用时不会连接），退出时刷新写缓冲并关闭连接池
+async def storage_context(app: web.Application):
+    await BOT.connect()
+    yield
+    await BOT.close()
+
+# 后台组件：入站执行器、出站队列、定时调度器；退出时先处理完已接收的工作，再关闭存储
+async def workers_context(app: web.Application):
+    event_loop_monitor = asyncio.create_task(metrics.monitor_event_loop_lag())
+    if INBOUND_EXECUTOR:
+        INBOUND_EXECUTOR.start()
+    if OUTBOUND_QUEUE:
+        await OUTBOUND_QUEUE.start()
+    if CONFIG.SCHEDULER_POLL_INTERVAL > 0:
+        SCHEDULER.start()
+    yield
+    event_loop_monitor.cancel()
+    if IMPORT_TASK and not IMPORT_TASK.done():
+        # 已提交的批次记录在检查点中，重启后再次导入会从检查点继续
+        IMPORT_TASK.cancel()
+    # 已确认的入站轮次在关闭Redis连接前执行完
+    if INBOUND_EXECUTOR:
+        await INBOUND_EXECUTOR.stop(CONFIG.SHUTDOWN_TIMEOUT)
+    await SCHEDULER.stop(CONFIG.SHUTDOWN_TIMEOUT)
+    if COALESCER:
+        await COALESCER.close()
+    # 此时已停止接收请求，等待仍在进行的发送完成后再关闭队列和Redis连接
+    await _wait_for_inflight_sends(CONFIG.SHUTDOWN_TIMEOUT)
+    if OUTBOUND_QUEUE:
+        await OUTBOUND_QUEUE.stop()
+
+# 预热：开始监听后在后台加载最近活跃的对话引用、创建对应 service_url 的连接并获取访问令牌，
+# 完成（或超过 WARMUP_TIMEOUT）后 /readyz 才返回就绪
+async def warmup_context(app: web.Application):
+    app["ready"] = False
+    task = asyncio.create_task(_warm_up(app))
+    yield
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+async def _warm_up(app: web.Application):
+    started = time.monotonic()
+    try:
+        if CONFIG.WARMUP_REFERENCES > 0:
+            references = await asyncio.wait_for(_load_warm_references(), CONFIG.WARMUP_TIMEOUT)
+            logger.info(f"Warm-up loaded {references} conversation references in "
+                        f"{time.monotonic() - started:.2f}s")
+    except asyncio.TimeoutError:
+        logger.warning(f"Warm-up did not finish within {CONFIG.WARMUP_TIMEOUT}s, serving cold")
+    except Exception as e:
+        logger.warning(f"Warm-up failed, serving cold: {e}")
+    app["ready"] = True
+
+async def _load_warm_references() -> int:
+    references = await BOT.redis_storage.warm_up(CONFIG.WARMUP_REFERENCES)
+    service_urls = {reference.service_url for reference in references.values() if reference.service_url}
+    await AUTHENTICATION.warm_up(APP_ID, service_urls)
+    return len(references)
+
+# 存活探针：事件循环能够响应即返回 200
+async def healthz(req: Request) -> Response:
+    return json_response({"status": "ok"})
+
+# 就绪探针：预热完成且Redis可用时返回 200，否则返回 503（负载均衡不应把流量发往该实例）
+async def readyz(req: Request) -> Response:
+    if not req.app.get("ready"):
+        return json_response({"status": "warming_up"}, status=HTTPStatus.SERVICE_UNAVAILABLE)
+    try:
+        await asyncio.wait_for(BOT.redis_storage.redis_client.ping(), CONFIG.READINESS_TIMEOUT)
+    except Exception as e:
+        return json_response({"status": "unavailable", "error": f"Redis ping failed: {e!r}"},
+                             status=HTTPStatus.SERVICE_UNAVAILABLE)
+    return json_response({"status": "ready"})
+
+# 判断请求是否使用队列模式发送（请求中的 enqueue 字段优先于配置）
+def _use_queue(data: dict) -> bool:
+    return bool(OUTBOUND_QUEUE) and bool(data.get("enqueue", CONFIG.OUTBOUND_QUEUE_DEFAULT))
+
+# 入队并返回 202
+async def _enqueue_message(job: dict) -> Response:
+    try:
+        message_id = await OUTBOUND_QUEUE.enqueue(job)
+    except Exception as e:
+        logger.error(f"Failed to enqueue message: {e}")
+        return json_response({"error": f"Failed to enqueue message: {e}"}, status=503)
+    return json_response({"status": "queued", "message_id": message_id}, status=HTTPStatus.ACCEPTED)
 
 # Listen for incoming requests on /api/messages.
+# 入站活动：完成认证后按活动 ID 去重；快速确认模式下立即返回 202，轮次交给后台执行器处理
+# （invoke/expectReplies 活动的结果要写在响应中，仍在请求内处理）
 async def messages(req: Request) -> Response:
-    return await ADAPTER.process(req, BOT)
+    if "application/json" not in req.headers.get("Content-Type", ""):
+        raise web.HTTPUnsupportedMediaType()
+    activity = Activity().deserialize(await req.json())
+    if not activity.type:
+        raise web.HTTPBadRequest()
+    
+    auth_result = await AUTHENTICATION.authenticate_request(activity, req.headers.get("Authorization", ""))
+    
+    if INBOUND_DEDUPLICATOR and not await INBOUND_DEDUPLICATOR.claim(activity):
+        metrics.INBOUND_ACTIVITIES.inc("duplicate")
+        logger.info(f"Ignoring redelivered activity {activity.id} in {activity.conversation.id}")
+        return Response(status=HTTPStatus.OK)
+    
+    if INBOUND_EXECUTOR and not requires_inline_processing(activity):
+        try:
+            INBOUND_EXECUTOR.submit(activity.conversation.id, auth_result, activity)
+        except asyncio.QueueFull:
+            if INBOUND_DEDUPLICATOR:
+                await INBOUND_DEDUPLICATOR.release(activity)
+            logger.warning(f"Inbound queue is full, rejecting activity {activity.id}")
+            return json_response({"error": "Inbound queue is full"}, status=HTTPStatus.SERVICE_UNAVAILABLE,
+                                 headers={"Retry-After": "1"})
+        return Response(status=HTTPStatus.ACCEPTED)
+    
+    metrics.INBOUND_ACTIVITIES.inc("inline")
+    try:
+        invoke_response = await _process_inbound_turn(auth_result, activity)
+    except Exception:
+        if INBOUND_DEDUPLICATOR:
+            await INBOUND_DEDUPLICATOR.release(activity)
+        raise
+    if invoke_response:
+        return json_response(data=serializer_helper(invoke_response.body), status=invoke_response.status)
+    return Response(status=HTTPStatus.CREATED)
+
+# 执行一个入站轮次（认证已在请求中完成）
+async def _process_inbound_turn(auth_result, activity: Activity):
+    return await ADAPTER.process_activity(auth_result, activity, BOT.on_turn)
+
+# 入站轮次的后台执行器，INBOUND_FAST_ACK 关闭时为 None（由 create_app 创建）
+INBOUND_EXECUTOR = None
+
+# 入站活动去重，INBOUND_DEDUPE_TTL 为 0 时为 None（由 create_app 创建）
+INBOUND_DEDUPLICATOR = None
 
 # Listen for requests on /api/notify, and send a messages to all conversation members.
+# audience 为受众表达式（如 "tag:oncall" 或 {"intersect": ["group", "tenant:<id>"]}），不填时发给所有对话
 async def notify(req: Request) -> Response:
-    await _send_proactive_message()
-    return Response(status=HTTPStatus.OK, text="Proactive messages have been sent")
+    message = req.query.get("message")
+    audience = req.query.get("audience")
+    if req.method == "POST" and req.can_read_body:
+        try:
+            data = await req.json()
+            message = data.get("message", message)
+            audience = data.get("audience", audience)
+        except Exception as e:
+            return json_response({"error": f"Invalid JSON payload: {e}"}, status=400)
+    
+    if audience is not None:
+        try:
+            BOT.redis_storage.validate_audience(audience)
+        except ValueError as e:
+            return json_response({"error": f"Invalid audience: {e}"}, status=400)
+    
+    summary = await _send_proactive_message(message or DEFAULT_BROADCAST_MESSAGE, audience)
+    return json_response(summary)
+
+# 查看受众表达式匹配的对话数量
+@require_api_key
+async def audience_count(req: Request) -> Response:
+    try:
+        data = await req.json()
+        audience = data["audience"]
+    except Exception as e:
+        return json_response({"error": f"Invalid JSON payload, 'audience' is required: {e}"}, status=400)
+    try:
+        return json_response({"audience": audience, "count": await BOT.redis_storage.count_audience(audience)})
+    except ValueError as e:
+        return json_response({"error": f"Invalid audience: {e}"}, status=400)
+
+# 列出所有标签及其对话数量
+@require_api_key
+async def list_tags(req: Request) -> Response:
+    return json_response(await BOT.redis_storage.list_tags())
+
+# 添加或移除标签：{"tags": [...], "conversation_ids": [...], "user_ids": [...], "tenant_id": ..., "action": "add" | "remove"}
+@require_api_key
+async def update_tags(req: Request) -> Response:
+    try:
+        data = await req.json()
+        tags = data.get("tags") or ([data["tag"]] if data.get("tag") else [])
+        action = data.get("action", "add")
+        conversation_ids = list(data.get("conversation_ids") or [])
+        user_ids = list(data.get("user_ids") or [])
+    except Exception as e:
+        return json_response({"error": f"Invalid JSON payload: {e}"}, status=400)
+    if not tags or action not in ("add", "remove") or not (conversation_ids or user_ids):
+        return json_response({"error": "'tags', 'action' (add/remove) and 'conversation_ids' or 'user_ids' are required"},
+                             status=400)
+    
+    # 用户ID通过用户索引解析为一对一对话ID
+    not_found = []
+    if user_ids:
+        resolved = await BOT.redis_storage.find_conversation_ids_by_users(
+            [(user_id, data.get("tenant_id")) for user_id in user_ids]
+        )
+        conversation_ids.extend(cid for cid in resolved if cid)
+        not_found.extend(user_id for user_id, cid in zip(user_ids, resolved) if not cid)
+    
+    try:
+        if action == "add":
+            tagged, missing = await BOT.redis_storage.add_tags(conversation_ids, tags)
+            not_found.extend(missing)
+        else:
+            await BOT.redis_storage.remove_tags(conversation_ids, tags)
+            tagged = conversation_ids
+    except ValueError as e:
+        return json_response({"error": str(e)}, status=400)
+    return json_response({"action": action, "tags": tags, "conversation_ids": tagged, "not_found": not_found})
+
+# 请求中包含 send_at / delay / recurrence 时定时发送
+def _is_scheduled(data: dict) -> bool:
+    return any(data.get(field) is not None for field in ("send_at", "delay", "recurrence"))
+
+# 解析定时参数，返回 (首次发送时间, 重复规则)
+# send_at 为 Unix 时间戳或 ISO 8601，delay 为延迟秒数（都不填则立即开始）；
+# recurrence 为 {"interval": 秒, "count": 总次数, "until": 截止时间}，interval 也可直接写成数字
+def _parse_schedule(data: dict):
+    send_at = data.get("send_at")
+    delay = data.get("delay")
+    if send_at is not None and delay is not None:
+        raise ValueError("Use either 'send_at' or 'delay', not both")
+    if send_at is not None:
+        due_at = _parse_timestamp(str(send_at))
+    else:
+        due_at = time.time() + max(0.0, float(delay or 0))
+    
+    recurrence = data.get("recurrence")
+    if recurrence is None:
+        return due_at, None
+    if not isinstance(recurrence, dict):
+        recurrence = {"interval": recurrence}
+    interval = float(recurrence.get("interval") or 0)
+    if interval < MIN_RECURRENCE_INTERVAL:
+        raise ValueError(f"'recurrence.interval' must be at least {MIN_RECURRENCE_INTERVAL} seconds")
+    rule = {"interval": interval}
+    if recurrence.get("count"):
+        rule["count"] = int(recurrence["count"])
+    if recurrence.get("until"):
+        rule["until"] = _parse_timestamp(str(recurrence["until"]))
+    return due_at, rule
+
+# 保存定时任务并返回 202
+async def _schedule_message(job: dict, data: dict) -> Response:
+    try:
+        due_at, recurrence = _parse_schedule(data)
+    except (TypeError, ValueError) as e:
+        return json_response({"error": f"Invalid schedule: {e}"}, status=400)
+    try:
+        job_id = await SCHEDULER.schedule(job, due_at, recurrence)
+    except Exception as e:
+        logger.error(f"Failed to schedule message: {e}")
+        return json_response({"error": f"Failed to schedule message: {e}"}, status=503)
+    logger.info(f"Scheduled message {job_id} for {job['type']} {job['target']} at {due_at}")
+    return json_response({"status": "scheduled", "job_id": job_id, "due_at": due_at, "recurrence": recurrence},
+                         status=HTTPStatus.ACCEPTED)
 
 # 发送自定义消息给特定用户
 async def notify_custom(req: Request) -> Response:
@@ -134,18 +401,29 @@ async def notify_custom(req: Request) -> Response:
         data = await req.json()
         message = data.get("message", None)
         user_id = data.get("user_id", None)
+        tenant_id = data.get("tenant_id", None)
         
         if not message or not user_id:
             return json_response({"error": "Missing 'message' or 'user_id' in request payload."}, status=400)
     except Exception as e:
         return json_response({"error": f"Invalid JSON payload: {e}"}, status=400)
     
-    # 从Redis获取对话引用
-    conversation_reference = BOT.get_conversation_reference(user_id)
+    job = {"type": "user", "target": user_id, "tenant_id": tenant_id, "message": message}
+    if _is_scheduled(data):
+        return await _schedule_message(job, data)
+    if _use_queue(data):
+        return await _enqueue_message(job)
+    
+    # 通过用户索引获取一对一对话引用
+    conversation_reference = await BOT.get_conversation_reference_by_user(user_id, tenant_id)
     if not conversation_reference:
         return json_response({"error": f"No conversation reference found for user {user_id}"}, status=404)
     
-    await _send_proactive_message_custom(message, conversation_reference)
+    try:
+        await _send_direct_message(message, conversation_reference, data)
+    except Exception as e:
+        logger.error(f"Failed to send message to user {user_id}: {e}")
+        return json_response({"error": f"Failed to send message to user {user_id}: {e}"}, status=502)
     logger.info(f"Proactive message sent to user {user_id}: {message}")
     return Response(status=HTTPStatus.OK, text=f"Proactive message sent to user {user_id}: {message}")
 
@@ -161,173 +439,685 @@ async def send_message_by_conversation_id(req: Request) -> Response:
     except Exception as e:
         return json_response({"error": f"Invalid JSON payload: {e}"}, status=400)
     
+    job = {"type": "conversation", "target": conversation_id, "message": message}
+    if _is_scheduled(data):
+        return await _schedule_message(job, data)
+    if _use_queue(data):
+        return await _enqueue_message(job)
+    
     # 从Redis获取对话引用
-    conversation_reference = BOT.get_conversation_reference(conversation_id)
+    conversation_reference = await BOT.get_conversation_reference(conversation_id)
     if not conversation_reference:
         return json_response({"error": f"No conversation reference found for conversation ID {conversation_id}"}, status=404)
     
-    await _send_message_by_conversation_id(message, conversation_reference)
+    try:
+        await _send_direct_message(message, conversation_reference, data)
+    except Exception as e:
+        logger.error(f"Failed to send message to conversation {conversation_id}: {e}")
+        return json_response({"error": f"Failed to send message to conversation {conversation_id}: {e}"}, status=502)
     logger.info(f"Message sent to conversation {conversation_id}: {message}")
     return Response(status=HTTPStatus.OK, text=f"Message sent to conversation {conversation_id}: {message}")
 
+# 解析批量发送请求：items 列表，或一条 message 加多个 targets / conversation_ids / user_ids
+def _parse_batch_items(data: dict) -> list:
+    if "items" in data:
+        return [dict(item) for item in data["items"]]
+    
+    message = data.get("message")
+    targets = [dict(target) for target in data.get("targets", [])]
+    targets += [{"conversation_id": conversation_id} for conversation_id in data.get("conversation_ids", [])]
+    targets += [{"user_id": user_id, "tenant_id": data.get("tenant_id")} for user_id in data.get("user_ids", [])]
+    for target in targets:
+        target.setdefault("message", message)
+    return targets
+
+# 批量发送：一次请求发送给多个对话/用户，可选以 NDJSON 流式返回每个目标的结果
+async def send_batch(req: Request) -> Response:
+    try:
+        data = await req.json()
+        items = _parse_batch_items(data)
+    except Exception as e:
+        return json_response({"error": f"Invalid JSON payload: {e}"}, status=400)
+    
+    if not items:
+        return json_response({"error": "Missing 'items' or 'targets' in request payload."}, status=400)
+    if len(items) > CONFIG.BATCH_MAX_ITEMS:
+        return json_response({"error": f"Too many items, the limit is {CONFIG.BATCH_MAX_ITEMS}."}, status=400)
+    
+    stream = str(req.query.get("stream", data.get("stream", ""))).lower() in ("1", "true")
+    
+    # 校验并一次性解析所有目标
+    results = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        target = {key: item[key] for key in ("conversation_id", "user_id") if item.get(key)}
+        if not item.get("message") or len(target) != 1:
+            results[index] = dict(target, index=index, status="invalid",
+                                  error="Each item needs 'message' and one of 'conversation_id' or 'user_id'.")
+        else:
+            valid.append(index)
+    resolved = await BOT.resolve_targets([items[index] for index in valid])
+    
+    targets = []
+    for index, target in zip(valid, resolved):
+        item = items[index]
+        if target is None:
+            results[index] = {key: item[key] for key in ("conversation_id", "user_id") if item.get(key)}
+            results[index].update(index=index, status="not_found", error="No conversation reference found")
+        else:
+            targets.append((index, target[1], item["message"]))
+    
+    def to_item_result(result: dict) -> dict:
+        index = result.pop("conversation_id")
+        item = items[index]
+        return dict({key: item[key] for key in ("conversation_id", "user_id") if item.get(key)}, index=index, **result)
+    
+    if not stream:
+        summary = await BATCH_ENGINE.run(targets)
+        for result in summary.pop("results"):
+            result = to_item_result(result)
+            results[result["index"]] = result
+        summary.update(
+            total=len(items),
+            not_found=sum(1 for result in results if result["status"] == "not_found"),
+            invalid=sum(1 for result in results if result["status"] == "invalid"),
+            results=results
+        )
+        return json_response(summary)
+    
+    response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    await response.prepare(req)
+    for result in results:
+        if result is not None:
+            await response.write((json.dumps(result, ensure_ascii=False) + "\n").encode("utf-8"))
+    
+    async def write_result(result: dict):
+        await response.write((json.dumps(to_item_result(result), ensure_ascii=False) + "\n").encode("utf-8"))
+    
+    summary = await BATCH_ENGINE.run(targets, on_result=write_result, include_results=False)
+    summary["total"] = len(items)
+    await response.write((json.dumps({"summary": summary}) + "\n").encode("utf-8"))
+    await response.write_eof()
+    return response
+
 # 新增：获取所有对话引用的API
 @require_api_key
 async def get_all_references(req: Request) -> Response:
+    # 分页参数：cursor、limit；过滤条件：is_group、channel_id、user_name（前缀）、since / until（最后活跃时间）
     try:
-        references = BOT.get_conversation_references()
-        
-        # 转换为可JSON序列化的格式
-        serialized_refs = {}
-        for conv_id, ref in references.items():
-            serialized_refs[conv_id] = {
-                "conversation_id": conv_id,
-                "user_id": ref.user.id if ref.user else None,
-                "user_name": ref.user.name if ref.user else None,
-                "channel_id": ref.channel_id,
-                "service_url": ref.service_url,
-                "is_group": ref.conversation.is_group if ref.conversation else None,
-                "bot_name": ref.bot.name if ref.bot else None
-            }
-        
-        return json_response({
-            "total_count": len(references),
-            "references": serialized_refs
-        })
+        limit = min(max(int(req.query.get("limit", "100")), 1), 1000)
+        is_group = req.query.get("is_group")
+        if is_group is not None:
+            is_group = is_group.lower() in ("1", "true")
+        since = _parse_timestamp(req.query.get("since"))
+        until = _parse_timestamp(req.query.get("until"))
+    except ValueError as e:
+        return json_response({"error": f"Invalid query parameter: {e}"}, status=400)
+    
+    try:
+        items, next_cursor = await BOT.redis_storage.page_conversation_references(
+            cursor=req.query.get("cursor"),
+            limit=limit,
+            is_group=is_group,
+            channel_id=req.query.get("channel_id"),
+            user_name_prefix=req.query.get("user_name"),
+            last_seen_min=since,
+            last_seen_max=until
+        )
+        total_count = await BOT.redis_storage.count_conversation_references()
     except Exception as e:
         logger.error(f"Failed to get references: {e}")
         return json_response({"error": f"Failed to get references: {e}"}, status=500)
+    
+    # 逐条序列化写出，next_cursor 为 null 时表示没有更多数据
+    response = web.StreamResponse(headers={"Content-Type": "application/json; charset=utf-8"})
+    await response.prepare(req)
+    await response.write(b'{"references": [')
+    for index, (conv_id, ref, last_seen) in enumerate(items):
+        item = {
+            "conversation_id": conv_id,
+            "user_id": ref.user.id if ref.user else None,
+            "user_name": ref.user.name if ref.user else None,
+            "channel_id": ref.channel_id,
+            "service_url": ref.service_url,
+            "is_group": ref.conversation.is_group if ref.conversation else None,
+            "tenant_id": ref.conversation.tenant_id if ref.conversation else None,
+            "bot_name": ref.bot.name if ref.bot else None,
+            "last_seen": last_seen
+        }
+        await response.write(((", " if index else "") + json.dumps(item, ensure_ascii=False)).encode("utf-8"))
+    await response.write(
+        f'], "count": {len(items)}, "total_count": {total_count}, "next_cursor": {json.dumps(next_cursor)}}}'.encode("utf-8")
+    )
+    await response.write_eof()
+    return response
+
+# 解析时间参数：Unix 时间戳或 ISO 8601
+def _parse_timestamp(value):
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
 
 # 新增：导出数据到JSON的API
 @require_api_key
 async def export_to_json(req: Request) -> Response:
+    # format=ndjson（默认，每行一个对话引用）或 json（旧格式）；to_file=1 时写入服务器当前目录
+    fmt = req.query.get("format", reference_io.FORMAT_NDJSON)
+    if fmt not in (reference_io.FORMAT_NDJSON, reference_io.FORMAT_JSON):
+        return json_response({"error": "format must be ndjson or json"}, status=400)
+    filename = f"conversation_references_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    
+    if req.query.get("to_file") in ("1", "true"):
+        try:
+            await BOT.export_to_json(filename)
+            return json_response({"message": f"Data exported to {filename}"})
+        except Exception as e:
+            logger.error(f"Failed to export: {e}")
+            return json_response({"error": f"Failed to export: {e}"}, status=500)
+    
+    content_type = "application/x-ndjson" if fmt == reference_io.FORMAT_NDJSON else "application/json"
+    response = web.StreamResponse(headers={
+        "Content-Type": f"{content_type}; charset=utf-8",
+        "Content-Disposition": f'attachment; filename="{filename}"',
+    })
+    response.enable_chunked_encoding()
+    await response.prepare(req)
+    stats = {"count": 0}
     try:
-        filename = f"conversation_references_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        BOT.export_to_json(filename)
-        return json_response({"message": f"Data exported to {filename}"})
+        async for chunk in reference_io.iter_export_chunks(BOT.redis_storage, fmt, stats):
+            await response.write(chunk.encode("utf-8"))
     except Exception as e:
-        logger.error(f"Failed to export: {e}")
-        return json_response({"error": f"Failed to export: {e}"}, status=500)
+        # 响应头已发送，只能中断连接，客户端会收到不完整的分块响应
+        logger.error(f"Failed to stream export after {stats['count']} references: {e}")
+        raise
+    await response.write_eof()
+    logger.info(f"Streamed {stats['count']} conversation references to the client")
+    return response
 
+# 最近一次导入的进度
+IMPORT_PROGRESS = {}
+IMPORT_TASK = None
+
+async def _run_import(resume: bool) -> dict:
+    IMPORT_PROGRESS.clear()
+    progress = await BOT.migrate_from_json_job(
+        CONFIG.JSON_BACKUP_FILE,
+        batch_size=CONFIG.IMPORT_BATCH_SIZE,
+        resume=resume,
+        on_progress=IMPORT_PROGRESS.update
+    )
+    IMPORT_PROGRESS.update(progress)
+    return progress
+
+# 从 JSON_BACKUP_FILE 导入（.json 为旧格式，其余按 NDJSON）；background=1 时后台执行，进度见 /api/import-status
 @require_api_key
 async def migrate(req: Request) -> Response:
+    global IMPORT_TASK
+    if IMPORT_TASK and not IMPORT_TASK.done():
+        return json_response({"error": "An import is already running", "progress": IMPORT_PROGRESS}, status=409)
+    resume = req.query.get("resume", "1") not in ("0", "false")
+    
+    if req.query.get("background") in ("1", "true"):
+        IMPORT_TASK = asyncio.create_task(_run_import(resume))
+        return json_response({"status": "started", "file": CONFIG.JSON_BACKUP_FILE}, status=HTTPStatus.ACCEPTED)
+    
     try:
-        BOT.migrate_from_json_job("conversation_references.json")
-        return json_response({"message": "Data migrated from JSON successfully."})
+        progress = await _run_import(resume)
+        return json_response({"message": "Data migrated from JSON successfully.", "progress": progress})
     except Exception as e:
         logger.error(f"Failed to migrate from JSON: {e}")
         return json_response({"error": f"Failed to migrate from JSON: {e}"}, status=500)
 
+@require_api_key
+async def import_status(req: Request) -> Response:
+    status = {"running": bool(IMPORT_TASK and not IMPORT_TASK.done()), "progress": IMPORT_PROGRESS}
+    if IMPORT_TASK and IMPORT_TASK.done() and not IMPORT_TASK.cancelled() and IMPORT_TASK.exception():
+        status["error"] = str(IMPORT_TASK.exception())
+    return json_response(status)
+
+# 重建二级索引
+@require_api_key
+async def rebuild_indexes(req: Request) -> Response:
+    try:
+        indexed = await BOT.rebuild_indexes()
+        return json_response({"message": f"Rebuilt indexes for {indexed} conversation references."})
+    except Exception as e:
+        logger.error(f"Failed to rebuild indexes: {e}")
+        return json_response({"error": f"Failed to rebuild indexes: {e}"}, status=500)
+
+# 将对话引用在线迁移为紧凑编码
+@require_api_key
+async def migrate_storage_layout(req: Request) -> Response:
+    try:
+        result = await BOT.migrate_storage_layout()
+        return json_response(result)
+    except Exception as e:
+        logger.error(f"Failed to migrate storage layout: {e}")
+        return json_response({"error": f"Failed to migrate storage layout: {e}"}, status=500)
+
 # 新增：获取Redis状态的API
 @require_api_key
 async def redis_status(req: Request) -> Response:
     try:
-        redis_info = BOT.redis_storage.get_connection_info()
+        redis_info = await BOT.redis_storage.get_connection_info()
+        if BOT.write_buffer:
+            redis_info["write_buffer"] = BOT.write_buffer.get_stats()
+        if BOT.redis_storage.cache:
+            redis_info["reference_cache"] = BOT.redis_storage.cache.get_stats()
+        if BOT.sweeper:
+            redis_info["reference_sweeper"] = BOT.sweeper.get_stats()
         return json_response(redis_info)
     except Exception as e:
         logger.error(f"Failed to get Redis status: {e}")
         return json_response({"error": f"Failed to get Redis status: {e}"}, status=500)
 
-# 内部方法：发送自定义主动消息
-async def _send_proactive_message_custom(message: str, conversation_reference: ConversationReference):
-    # 处理消息格式
-    lines = message.replace("<br />", "\n").replace("<p>", "").replace("</p>", "\n")
-    paragraphs = lines.split("\n")
-    paragraphs = [p.strip() for p in paragraphs if p.strip()]  # 移除空行
-    
-    # 创建 Adaptive Card
-    card_content = {
-        "type": "AdaptiveCard",
-        "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
-        "version": "1.3",
-        "body": []
-    }
-    
-    # 为每个段落添加一个TextBlock
-    for paragraph in paragraphs:
-        card_content["body"].append({
-            "type": "TextBlock",
-            "text": paragraph,
-            "wrap": True,
-            "separator": True
-        })
-    
-    attachment = Attachment(
-        content_type="application/vnd.microsoft.card.adaptive",
-        content=card_content
-    )
+# 列出定时任务（按到期时间排序）
+@require_api_key
+async def list_scheduled(req: Request) -> Response:
+    try:
+        offset = max(0, int(req.query.get("offset", 0)))
+        limit = min(1000, max(1, int(req.query.get("limit", 100))))
+    except ValueError:
+        return json_response({"error": "offset and limit must be integers"}, status=400)
+    total, jobs = await SCHEDULER.list_jobs(offset, limit)
+    return json_response({"total": total, "offset": offset, "jobs": jobs})
+
+# 取消定时任务
+@require_api_key
+async def cancel_scheduled(req: Request) -> Response:
+    job_id = req.match_info["job_id"]
+    if not await SCHEDULER.cancel(job_id):
+        return json_response({"error": f"Scheduled job {job_id} not found"}, status=404)
+    return json_response({"status": "cancelled", "job_id": job_id})
+
+# 获取出站队列状态
+@require_api_key
+async def queue_status(req: Request) -> Response:
+    if not OUTBOUND_QUEUE:
+        return json_response({"enabled": False})
+    return json_response(await OUTBOUND_QUEUE.get_stats())
+
+# Prometheus 指标
+@require_api_key
+async def metrics_endpoint(req: Request) -> Response:
+    metrics.record_component_stats("card_cache", CARD_RENDERER.get_stats())
+    metrics.record_component_stats("rate_limiter", RATE_LIMITER.get_stats())
+    metrics.record_component_stats("connector_pool", AUTHENTICATION.get_stats())
+    if BOT.write_buffer:
+        metrics.record_component_stats("write_buffer", BOT.write_buffer.get_stats())
+    if BOT.redis_storage.cache:
+        metrics.record_component_stats("reference_cache", BOT.redis_storage.cache.get_stats())
+    if BOT.sweeper:
+        metrics.record_component_stats("reference_sweeper", BOT.sweeper.get_stats())
+    if INBOUND_EXECUTOR:
+        metrics.record_component_stats("inbound_executor", INBOUND_EXECUTOR.get_stats())
+    if INBOUND_DEDUPLICATOR:
+        metrics.record_component_stats("inbound_dedupe", INBOUND_DEDUPLICATOR.get_stats())
+    if OUTBOUND_QUEUE:
+        metrics.record_component_stats("outbound_queue", await OUTBOUND_QUEUE.get_stats())
+    metrics.record_component_stats("scheduler", await SCHEDULER.get_stats())
+    if COALESCER:
+        metrics.record_component_stats("coalescer", COALESCER.get_stats())
+    return Response(body=metrics.REGISTRY.render().encode("utf-8"),
+                    headers={"Content-Type": metrics.MetricsRegistry.CONTENT_TYPE})
+
+# 获取卡片渲染缓存状态
+@require_api_key
+async def card_cache_status(req: Request) -> Response:
+    return json_response(CARD_RENDERER.get_stats())
+
+# 获取出站限流状态
+@require_api_key
+async def throttle_status(req: Request) -> Response:
+    return json_response(RATE_LIMITER.get_stats())
+
+# 内部方法：把消息渲染为 Adaptive Card 并发送（相同内容的卡片只渲染一次）
+async def _send_message_card(message: str, conversation_reference: ConversationReference):
+    card = CARD_RENDERER.render(message)
+    await _send_activity(conversation_reference, card.to_activity())
+
+# 直接发送单条消息；请求开启合并（coalesce，默认 COALESCE_DEFAULT）时与同一对话窗口内的其他消息合并为一张卡片
+async def _send_direct_message(message: str, conversation_reference: ConversationReference, data: dict):
+    if COALESCER and data.get("coalesce", CONFIG.COALESCE_DEFAULT):
+        await COALESCER.submit(conversation_reference, message)
+    else:
+        await _send_message_card(message, conversation_reference)
+
+# 卡片渲染缓存（由 create_app 创建）
+CARD_RENDERER = None
+
+# 按对话合并短时间内的连续消息，COALESCE_WINDOW_MS 为 0 时关闭（由 create_app 创建）
+COALESCER = None
+
+# 出站限流器：所有 continue_conversation 调用都经过它（由 create_app 创建）
+RATE_LIMITER = None
+
+# 正在进行的发送数量，关闭时等待其归零
+INFLIGHT_SENDS = 0
+
+# 内部方法：在限流保护下发送一条活动，失败时抛出异常
+# （返回 403/404 或机器人已不在对话中时删除该对话引用，之后的广播不再发往该对话）
+async def _send_activity(conversation_reference: ConversationReference, activity):
+    global INFLIGHT_SENDS
+    INFLIGHT_SENDS += 1
+    try:
+        await RATE_LIMITER.call(
+            conversation_reference,
+            lambda: _deliver_activity(conversation_reference, activity)
+        )
+    except Exception as e:
+        if CONFIG.REMOVE_DEAD_REFERENCES and is_dead_conversation_error(e):
+            await BOT.remove_conversation_reference(conversation_reference.conversation.id)
+        raise
+    finally:
+        INFLIGHT_SENDS -= 1
+
+# 等待进行中的发送完成，超时后放弃
+async def _wait_for_inflight_sends(timeout: float):
+    deadline = time.monotonic() + timeout
+    if INFLIGHT_SENDS:
+        logger.info(f"Waiting for {INFLIGHT_SENDS} in-flight sends to finish")
+    while INFLIGHT_SENDS and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    if INFLIGHT_SENDS:
+        logger.warning(f"Shutting down with {INFLIGHT_SENDS} sends still in flight")
+
+# 内部方法：在对话中发送一条活动
+# （异常在 continue_conversation 的回调内会被 on_turn_error 吞掉，因此在回调内捕获后重新抛出）
+async def _deliver_activity(conversation_reference: ConversationReference, activity):
+    errors = []
     
-    await ADAPTER.continue_conversation(
-        conversation_reference,
-        lambda turn_context: turn_context.send_activity(MessageFactory.attachment(attachment)),
-        APP_ID,
-    )
+    async def callback(turn_context: TurnContext):
+        try:
+            await turn_context.send_activity(activity)
+        except Exception as error:
+            errors.append(error)
+    
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        await ADAPTER.continue_conversation(conversation_reference, callback, APP_ID)
+        if errors:
+            raise errors[0]
+    except Exception as e:
+        outcome = str(get_status_code(e) or "error")
+        raise
+    finally:
+        metrics.SEND_LATENCY.observe(time.perf_counter() - started,
+                                     conversation_reference.service_url or "", outcome)
 
-# 内部方法：通过对话ID发送消息
-async def _send_message_by_conversation_id(message: str, conversation_reference: ConversationReference):
-    # 处理消息格式
-    lines = message.replace("<br />", "\n").replace("<p>", "").replace("</p>", "\n")
-    paragraphs = lines.split("\n")
-    paragraphs = [p.strip() for p in paragraphs if p.strip()]  # 移除空行
-    
-    # 创建 Adaptive Card
-    card_content = {
-        "type": "AdaptiveCard",
-        "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
-        "version": "1.3",
-        "body": []
-    }
-    
-    # 为每个段落添加一个TextBlock
-    for paragraph in paragraphs:
-        card_content["body"].append({
-            "type": "TextBlock",
-            "text": paragraph,
-            "wrap": True,
-            "separator": True
-        })
-    
-    attachment = Attachment(
-        content_type="application/vnd.microsoft.card.adaptive",
-        content=card_content
-    )
+# 广播引擎：限制全局并发和每个 service_url 的并发（由 create_app 创建）
+BROADCAST_ENGINE = None
+
+# 队列消费者：解析目标并发送（找不到对话引用时直接进入死信流）
+async def _process_queued_message(job: dict):
+    target = job.get("target")
+    if job.get("type") == "user":
+        conversation_reference = await BOT.get_conversation_reference_by_user(target, job.get("tenant_id"))
+    else:
+        conversation_reference = await BOT.get_conversation_reference(target)
+    if not conversation_reference:
+        raise DeadLetterError(f"No conversation reference found for {job.get('type')} {target}")
     
-    await ADAPTER.continue_conversation(
-        conversation_reference,
-        lambda turn_context: turn_context.send_activity(MessageFactory.attachment(attachment)),
-        APP_ID,
-    )
+    try:
+        await _send_message_card(job["message"], conversation_reference)
+    except Exception as e:
+        # 对话已失效，重试不会成功
+        if is_dead_conversation_error(e):
+            raise DeadLetterError(f"Conversation {conversation_reference.conversation.id} is no longer reachable: {e}")
+        raise
+
+# 出站消息队列（Redis Streams），OUTBOUND_QUEUE_WORKERS 为 0 时关闭（由 create_app 创建）
+OUTBOUND_QUEUE = None
 
-# 发送消息给所有对话成员
-async def _send_proactive_message():
+# 发送到期的定时任务：启用出站队列时入队（失败按队列规则重试），否则直接发送
+async def _dispatch_scheduled_message(job: dict):
+    if OUTBOUND_QUEUE:
+        await OUTBOUND_QUEUE.enqueue(job)
+    else:
+        await _process_queued_message(job)
+
+# 定时消息调度器（由 create_app 创建）
+SCHEDULER = None
+
+# 批量发送引擎：发送内容为消息文本，渲染为卡片后发送（由 create_app 创建）
+BATCH_ENGINE = None
+
+# 发送消息给所有对话成员，指定受众表达式时只发给匹配的对话
+async def _send_proactive_message(message: str, audience=None) -> dict:
+    async def targets():
+        if audience is None:
+            batches = BOT.iter_conversation_references()
+        else:
+            batches = BOT.iter_audience(audience)
+        async for batch in batches:
+            yield [(conversation_id, reference, message) for conversation_id, reference in batch]
+    
     try:
-        references = BOT.get_conversation_references()
-        
-        for conversation_reference in references.values():
-            await ADAPTER.continue_conversation(
-                conversation_reference,
-                lambda turn_context: turn_context.send_activity("proactive hello from Redis storage!"),
-                APP_ID,
-            )
-        
-        logger.info(f"Sent proactive message to {len(references)} conversations")
+        return await BROADCAST_ENGINE.run(targets())
     except Exception as e:
         logger.error(f"Failed to send proactive messages: {e}")
+        return {"error": f"Failed to send proactive messages: {e}"}
+
+# 记录每个路由的请求耗时
+@web.middleware
+async def metrics_middleware(req: Request, handler):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(req)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        resource = req.match_info.route.resource
+        route = resource.canonical if resource else "unmatched"
+        metrics.REQUEST_LATENCY.observe(time.perf_counter() - started, req.method, route, status)
 
-# 设置路由
-APP = web.Application(middlewares=[aiohttp_error_middleware])
-APP.router.add_post("/api/messages", messages)
-APP.router.add_get("/api/notify", notify)
-APP.router.add_post("/api/send-message", notify_custom)
-APP.router.add_post("/api/send-by-convid", send_message_by_conversation_id)
-APP.router.add_get("/api/references", get_all_references)
-APP.router.add_get("/api/export", export_to_json)
-APP.router.add_get("/api/redis-status", redis_status)
-APP.router.add_get("/api/migrate-from-json", migrate)
+# 创建当前 worker 进程的适配器、机器人和发送组件，并返回 aiohttp 应用
+# （多进程部署时每个 worker 调用一次；出站限流按 worker 数量均分，使所有 worker 合计不超过配置的速率）
+def create_app(worker_count: int = 1) -> web.Application:
+    global ADAPTER, AUTHENTICATION, BOT, CARD_RENDERER, RATE_LIMITER, BROADCAST_ENGINE, OUTBOUND_QUEUE, BATCH_ENGINE
+    global INBOUND_EXECUTOR, INBOUND_DEDUPLICATOR, SCHEDULER, COALESCER
+    worker_count = max(1, worker_count)
+    
+    AUTHENTICATION = PooledBotFrameworkAuthentication(
+        CONFIG,
+        pool_maxsize=CONFIG.BROADCAST_PER_SERVICE_URL_CONCURRENCY,
+        token_refresh_margin=CONFIG.TOKEN_REFRESH_MARGIN
+    )
+    ADAPTER = CloudAdapter(AUTHENTICATION)
+    ADAPTER.on_turn_error = on_error
+    
+    # 创建机器人实例，配置Redis连接信息
+    try:
+        BOT = ProactiveBot(
+            redis_host=CONFIG.REDIS_HOST,
+            redis_port=CONFIG.REDIS_PORT,
+            redis_db=CONFIG.REDIS_DB,
+            redis_password=CONFIG.REDIS_PASSWORD,
+            redis_scan_count=CONFIG.REDIS_SCAN_COUNT,
+            write_flush_interval=CONFIG.WRITE_FLUSH_INTERVAL,
+            write_batch_size=CONFIG.WRITE_BATCH_SIZE,
+            compact_format=CONFIG.STORAGE_COMPACT_FORMAT,
+            reference_cache_max_entries=CONFIG.REFERENCE_CACHE_MAX_ENTRIES,
+            reference_cache_ttl=CONFIG.REFERENCE_CACHE_TTL,
+            reference_max_idle=CONFIG.REFERENCE_MAX_IDLE_DAYS * 86400,
+            reference_sweep_interval=CONFIG.REFERENCE_SWEEP_INTERVAL,
+            redis_mode=CONFIG.REDIS_MODE,
+            redis_sentinels=parse_addresses(CONFIG.REDIS_SENTINELS, default_port=26379),
+            redis_sentinel_master=CONFIG.REDIS_SENTINEL_MASTER,
+            redis_sentinel_password=CONFIG.REDIS_SENTINEL_PASSWORD or None,
+            redis_cluster_nodes=parse_addresses(CONFIG.REDIS_CLUSTER_NODES),
+            redis_read_from_replicas=CONFIG.REDIS_READ_FROM_REPLICAS
+        )
+        logger.info("Bot initialized successfully with Redis storage")
+    except Exception as e:
+        logger.error(f"Failed to initialize bot: {e}")
+        raise
+    
+    INBOUND_EXECUTOR = None
+    if CONFIG.INBOUND_FAST_ACK:
+        INBOUND_EXECUTOR = InboundTurnExecutor(
+            _process_inbound_turn,
+            workers=CONFIG.INBOUND_WORKERS,
+            max_pending=CONFIG.INBOUND_QUEUE_SIZE
+        )
+    
+    INBOUND_DEDUPLICATOR = None
+    if CONFIG.INBOUND_DEDUPE_TTL > 0:
+        INBOUND_DEDUPLICATOR = ActivityDeduplicator(
+            BOT.redis_storage.redis_client,
+            prefix=f"{BOT.redis_storage.index_prefix}inbound:",
+            ttl=CONFIG.INBOUND_DEDUPE_TTL
+        )
+    
+    CARD_RENDERER = CardRenderer(
+        max_entries=CONFIG.CARD_CACHE_MAX_ENTRIES,
+        max_bytes=CONFIG.CARD_CACHE_MAX_BYTES,
+        ttl=CONFIG.CARD_CACHE_TTL
+    )
+    
+    RATE_LIMITER = AdaptiveRateLimiter(
+        conversation_rate=CONFIG.RATE_LIMIT_CONVERSATION_RATE / worker_count,
+        conversation_burst=max(1.0, CONFIG.RATE_LIMIT_CONVERSATION_BURST / worker_count),
+        service_url_rate=CONFIG.RATE_LIMIT_SERVICE_URL_RATE / worker_count,
+        service_url_burst=max(1.0, CONFIG.RATE_LIMIT_SERVICE_URL_BURST / worker_count),
+        max_retries=CONFIG.RATE_LIMIT_MAX_RETRIES
+    )
+    
+    BROADCAST_ENGINE = BroadcastEngine(
+        _send_activity,
+        max_concurrency=CONFIG.BROADCAST_CONCURRENCY,
+        per_service_url_concurrency=CONFIG.BROADCAST_PER_SERVICE_URL_CONCURRENCY,
+        name="notify"
+    )
+    
+    OUTBOUND_QUEUE = None
+    if CONFIG.OUTBOUND_QUEUE_WORKERS > 0:
+        OUTBOUND_QUEUE = OutboundMessageQueue(
+            BOT.redis_storage.redis_client,
+            _process_queued_message,
+            stream=BOT.redis_storage.topology.hash_tag("bot_outbound"),
+            consumer_count=CONFIG.OUTBOUND_QUEUE_WORKERS,
+            max_deliveries=CONFIG.OUTBOUND_QUEUE_MAX_DELIVERIES
+        )
+    
+    COALESCER = None
+    if CONFIG.COALESCE_WINDOW_MS > 0:
+        COALESCER = MessageCoalescer(
+            _send_activity,
+            window=CONFIG.COALESCE_WINDOW_MS / 1000,
+            max_card_bytes=CONFIG.COALESCE_MAX_CARD_BYTES
+        )
+    
+    SCHEDULER = MessageScheduler(
+        BOT.redis_storage.redis_client,
+        _dispatch_scheduled_message,
+        key=BOT.redis_storage.topology.hash_tag("bot_scheduled"),
+        poll_interval=CONFIG.SCHEDULER_POLL_INTERVAL,
+        batch_size=CONFIG.SCHEDULER_BATCH_SIZE
+    )
+    
+    BATCH_ENGINE = BroadcastEngine(
+        lambda conversation_reference, message: _send_message_card(message, conversation_reference),
+        max_concurrency=CONFIG.BROADCAST_CONCURRENCY,
+        per_service_url_concurrency=CONFIG.BROADCAST_PER_SERVICE_URL_CONCURRENCY,
+        name="batch"
+    )
+    
+    # 设置路由
+    app = web.Application(middlewares=[metrics_middleware, aiohttp_error_middleware])
+    app.cleanup_ctx.extend([connector_context, storage_context, workers_context, warmup_context])
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/readyz", readyz)
+    app.router.add_post("/api/messages", messages)
+    app.router.add_get("/api/notify", notify)
+    app.router.add_post("/api/notify", notify)
+    app.router.add_post("/api/send-message", notify_custom)
+    app.router.add_post("/api/send-by-convid", send_message_by_conversation_id)
+    app.router.add_post("/api/send-batch", send_batch)
+    app.router.add_get("/api/references", get_all_references)
+    app.router.add_get("/api/tags", list_tags)
+    app.router.add_post("/api/tags", update_tags)
+    app.router.add_post("/api/audience", audience_count)
+    app.router.add_get("/api/export", export_to_json)
+    app.router.add_get("/api/redis-status", redis_status)
+    app.router.add_get("/api/throttle-status", throttle_status)
+    app.router.add_get("/api/queue-status", queue_status)
+    app.router.add_get("/api/scheduled", list_scheduled)
+    app.router.add_delete("/api/scheduled/{job_id}", cancel_scheduled)
+    app.router.add_get("/api/card-cache-status", card_cache_status)
+    app.router.add_get("/metrics", metrics_endpoint)
+    app.router.add_get("/api/migrate-from-json", migrate)
+    app.router.add_get("/api/import-status", import_status)
+    app.router.add_get("/api/rebuild-index", rebuild_indexes)
+    app.router.add_get("/api/migrate-storage", migrate_storage_layout)
+    return app
+
+# worker 进程入口：独立进程组（信号只由主进程转发），SO_REUSEPORT 共享端口
+def _run_worker(worker_count: int):
+    os.setpgrp()
+    web.run_app(
+        create_app(worker_count),
+        host="127.0.0.1",
+        port=CONFIG.PORT,
+        reuse_port=True,
+        shutdown_timeout=CONFIG.SHUTDOWN_TIMEOUT,
+        print=None
+    )
+
+# 预派生多个 worker 进程，由内核在监听同一端口的进程间分配连接；worker 异常退出时自动重启
+def run_prefork(worker_count: int):
+    stopping = []
+    
+    def request_stop(signum, frame):
+        stopping.append(signum)
+    
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    
+    def start_worker(index: int) -> multiprocessing.Process:
+        process = multiprocessing.Process(target=_run_worker, args=(worker_count,), name=f"bot-worker-{index}")
+        process.start()
+        logger.info(f"Started worker {index} (pid {process.pid})")
+        return process
+    
+    workers = [start_worker(index) for index in range(worker_count)]
+    while not stopping:
+        for index, process in enumerate(workers):
+            if not process.is_alive():
+                logger.warning(f"Worker {index} (pid {process.pid}) exited with code {process.exitcode}, restarting")
+                workers[index] = start_worker(index)
+        time.sleep(1)
+    
+    logger.info(f"Stopping {len(workers)} workers")
+    for process in workers:
+        if process.is_alive():
+            process.terminate()
+    for process in workers:
+        process.join(CONFIG.SHUTDOWN_TIMEOUT + 5)
+        if process.is_alive():
+            logger.warning(f"Worker pid {process.pid} did not stop in time, killing it")
+            process.kill()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Teams proactive bot server")
+    parser.add_argument("--workers", type=int, default=CONFIG.WORKERS,
+                        help="number of worker processes sharing the port (SO_REUSEPORT)")
+    args = parser.parse_args()
     try:
-        logger.info(f"Starting bot server on port {CONFIG.PORT}")
-        web.run_app(APP, host="127.0.0.1", port=CONFIG.PORT)
+        logger.info(f"Starting bot server on port {CONFIG.PORT} with {args.workers} worker(s)")
+        if args.workers > 1:
+            run_prefork(args.workers)
+        else:
+            web.run_app(create_app(), host="127.0.0.1", port=CONFIG.PORT,
+                        shutdown_timeout=CONFIG.SHUTDOWN_TIMEOUT)
     except Exception as error:
         logger.error(f"Failed to start server: {error}")
-        raise error
\ No newline at end of file
+        raise error
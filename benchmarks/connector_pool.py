@@ -0,0 +1,132 @@
+"""
+出站 Bot Connector 调用的微基准：对比 SDK 默认认证与 PooledBotFrameworkAuthentication
+
+在独立线程中启动本地 HTTPS 替身服务（fake_connector.FakeConnector：Connector 的发送活动接口 + AAD 令牌接口），
+分别用两种认证通过 CloudAdapter.continue_conversation 发送 N 条消息，
+统计吞吐、新建的 TLS 连接数和令牌请求数。
+
+用法：python benchmarks/connector_pool.py --messages 500 --concurrency 16
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from botbuilder.core import TurnContext  # noqa: E402
+from botbuilder.integration.aiohttp import CloudAdapter, ConfigurationBotFrameworkAuthentication  # noqa: E402
+from botbuilder.schema import ChannelAccount, ConversationAccount, ConversationReference  # noqa: E402
+from botframework.connector.auth import AppCredentials, ServiceClientCredentialsFactory  # noqa: E402
+
+from bots.connector_pool import PooledBotFrameworkAuthentication  # noqa: E402
+from fake_connector import FakeConnector  # noqa: E402
+
+APP_ID = "00000000-0000-0000-0000-000000000001"
+
+
+class BenchmarkConfig:
+    APP_ID = APP_ID
+    APP_PASSWORD = "secret"
+
+
+class StandInAppCredentials(AppCredentials):
+    """模拟 MicrosoftAppCredentials：每个凭据对象首次使用时向令牌接口请求令牌并缓存在对象内"""
+
+    def __init__(self, token_url: str):
+        super().__init__(app_id=APP_ID)
+        self.token_url = token_url
+        self._token = None
+
+    def get_access_token(self, force_refresh: bool = False) -> str:
+        if self._token is None or force_refresh:
+            response = requests.post(self.token_url, data={"grant_type": "client_credentials"})
+            response.raise_for_status()
+            self._token = response.json()["access_token"]
+        return self._token
+
+
+class StandInCredentialsFactory(ServiceClientCredentialsFactory):
+    """与 SDK 的密码凭据工厂一样，每次调用都创建新的凭据对象"""
+
+    def __init__(self, token_url: str):
+        self.token_url = token_url
+
+    async def is_valid_app_id(self, app_id: str) -> bool:
+        return app_id == APP_ID
+
+    async def is_authentication_disabled(self) -> bool:
+        return False
+
+    async def create_credentials(self, app_id, oauth_scope, login_endpoint, validate_authority):
+        return StandInAppCredentials(self.token_url)
+
+
+async def send_messages(adapter: CloudAdapter, service_url: str, messages: int, concurrency: int) -> float:
+    """并发发送 messages 条消息，返回耗时（秒）"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def callback(turn_context: TurnContext):
+        await turn_context.send_activity("benchmark")
+
+    async def send(index: int):
+        reference = ConversationReference(
+            channel_id="msteams",
+            service_url=service_url,
+            conversation=ConversationAccount(id=f"conversation-{index % 100}"),
+            bot=ChannelAccount(id=f"28:{APP_ID}"),
+            user=ChannelAccount(id=f"29:user-{index % 100}"),
+        )
+        async with semaphore:
+            await adapter.continue_conversation(reference, callback, APP_ID)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send(index) for index in range(messages)))
+    return time.perf_counter() - started
+
+
+async def run_case(name: str, authentication, server: FakeConnector, messages: int, concurrency: int):
+    adapter = CloudAdapter(authentication)
+    if hasattr(authentication, "start"):
+        authentication.start()
+    # 预热一条，排除首次导入和凭据创建的开销
+    await send_messages(adapter, server.url, 1, 1)
+    before = server.snapshot()
+    elapsed = await send_messages(adapter, server.url, messages, concurrency)
+    after = server.snapshot()
+    if hasattr(authentication, "close"):
+        await authentication.close()
+    print(f"{name:<10} {messages / elapsed:>10.1f} {elapsed * 1000 / messages:>12.2f} "
+          f"{after['connections'] - before['connections']:>14} "
+          f"{after['token_requests'] - before['token_requests']:>14} "
+          f"{after['activities'] - before['activities']:>10}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=500, help="每种认证发送的消息数")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发发送数")
+    args = parser.parse_args()
+
+    server = FakeConnector(tls=True)
+    server.start()
+    os.environ["REQUESTS_CA_BUNDLE"] = server.ca_file
+    token_url = f"{server.url}/token"
+    try:
+        print(f"{'case':<10} {'msg/s':>10} {'ms/msg':>12} {'new TLS conns':>14} {'token requests':>14} {'activities':>10}")
+        await run_case("default", ConfigurationBotFrameworkAuthentication(
+            BenchmarkConfig, credentials_factory=StandInCredentialsFactory(token_url)
+        ), server, args.messages, args.concurrency)
+        await run_case("pooled", PooledBotFrameworkAuthentication(
+            BenchmarkConfig, credentials_factory=StandInCredentialsFactory(token_url),
+            pool_maxsize=args.concurrency
+        ), server, args.messages, args.concurrency)
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
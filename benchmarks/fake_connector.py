@@ -0,0 +1,144 @@
+"""
+本地 Bot Framework Connector 替身（aiohttp），在独立线程的事件循环中运行
+
+记录收到的活动、新建连接数和令牌请求数，可注入固定延迟和一定比例的 429 响应。
+"""
+import asyncio
+import datetime
+import os
+import random
+import ssl
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Optional
+
+import jwt
+from aiohttp import web
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+
+class FakeConnector:
+    """Bot Connector 与 AAD 令牌接口的替身"""
+
+    def __init__(self, latency: float = 0.0, throttle_rate: float = 0.0, retry_after: float = 0.0,
+                 tls: bool = False, seed: Optional[int] = None):
+        """
+        Args:
+            latency: 每个请求的附加延迟（秒）
+            throttle_rate: 返回 429 的请求比例（0~1）
+            retry_after: 429 响应的 Retry-After（秒）
+            tls: 是否使用自签名证书提供 HTTPS（ca_file 为对应的 CA 文件）
+            seed: 429 注入的随机种子，便于复现
+        """
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.tls = tls
+        self._random = random.Random(seed)
+
+        self.connections = set()
+        self.token_requests = 0
+        self.activities = 0
+        self.throttled = 0
+        self.by_conversation: Counter = Counter()
+
+        self.port = None
+        self._loop = None
+        self._runner = None
+        self._ready = threading.Event()
+        self._directory = tempfile.TemporaryDirectory()
+        self.ca_file = os.path.join(self._directory.name, "cert.pem")
+
+    def _write_certificate(self) -> tuple:
+        key = ec.generate_private_key(ec.SECP256R1())
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        certificate = (
+            x509.CertificateBuilder()
+            .subject_name(name).issuer_name(name)
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(minutes=1))
+            .not_valid_after(now + datetime.timedelta(days=1))
+            .add_extension(x509.SubjectAlternativeName([x509.DNSName("localhost")]), critical=False)
+            .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+            .sign(key, hashes.SHA256())
+        )
+        key_file = os.path.join(self._directory.name, "key.pem")
+        with open(self.ca_file, "wb") as file:
+            file.write(certificate.public_bytes(serialization.Encoding.PEM))
+        with open(key_file, "wb") as file:
+            file.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                         serialization.NoEncryption()))
+        return self.ca_file, key_file
+
+    def _track(self, request: web.Request):
+        self.connections.add(request.transport.get_extra_info("peername"))
+
+    async def _token(self, request: web.Request) -> web.Response:
+        self._track(request)
+        self.token_requests += 1
+        token = jwt.encode({"aud": "https://api.botframework.com", "exp": int(time.time()) + 3600},
+                           "benchmark-signing-key-not-verified-by-client", algorithm="HS256")
+        return web.json_response({"token_type": "Bearer", "expires_in": 3600, "access_token": token})
+
+    async def _activity(self, request: web.Request) -> web.Response:
+        self._track(request)
+        await request.read()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.throttle_rate and self._random.random() < self.throttle_rate:
+            self.throttled += 1
+            return web.json_response(
+                {"error": {"code": "Throttled", "message": "Too many requests"}},
+                status=429, headers={"Retry-After": str(self.retry_after)}
+            )
+        self.activities += 1
+        self.by_conversation[request.match_info["conversation_id"]] += 1
+        return web.json_response({"id": uuid.uuid4().hex})
+
+    def _serve(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        context = None
+        if self.tls:
+            context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            context.load_cert_chain(*self._write_certificate())
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post("/token", self._token)
+        app.router.add_post("/v3/conversations/{conversation_id}/activities", self._activity)
+        app.router.add_post("/v3/conversations/{conversation_id}/activities/{activity_id}", self._activity)
+        self._runner = web.AppRunner(app, access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, "localhost", 0, ssl_context=context)
+        self._loop.run_until_complete(site.start())
+        self.port = self._runner.addresses[0][1]
+        self._ready.set()
+        self._loop.run_forever()
+
+    def start(self):
+        threading.Thread(target=self._serve, daemon=True).start()
+        self._ready.wait()
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._directory.cleanup()
+
+    @property
+    def url(self) -> str:
+        return f"{'https' if self.tls else 'http'}://localhost:{self.port}"
+
+    def snapshot(self) -> dict:
+        return {
+            "connections": len(self.connections),
+            "token_requests": self.token_requests,
+            "activities": self.activities,
+            "throttled": self.throttled,
+        }
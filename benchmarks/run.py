@@ -0,0 +1,424 @@
+"""
+负载测试与基准
+
+在本进程中启动 app.create_app()，连接本地 Redis（未指定时启动 fakeredis）和本地 Connector 替身
+（fake_connector.FakeConnector，可注入延迟和 429），驱动以下负载：
+
+  inbound   /api/messages 入站消息（每条都会写对话引用并回复）
+  send      /api/send-by-convid 并发发送
+  notify    /api/notify 向 1k/10k/100k 个对话广播
+  export    /api/export 流式导出
+  migrate   /api/migrate-from-json 导入上一步的导出文件
+
+输出每项的吞吐、p50/p99 延迟和进程内存，结果写入 JSON；指定 --baseline 时与之前的结果比较，
+吞吐下降或 p99 上升超过 --tolerance 时以非零状态退出。
+
+限流参数默认放开（测量的是本服务的开销），需要测试退避时用 --throttle-rate 注入 429。
+会清空目标 Redis 数据库中的数据，指定 --redis-url 时必须是空库，或显式加 --flush。
+
+用法：
+  python benchmarks/run.py --output results.json
+  python benchmarks/run.py --redis-url redis://localhost:6379/15 --flush --notify-sizes 1000,10000,100000
+  python benchmarks/run.py --scenarios send,notify --baseline results.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import re
+import resource
+import sys
+import tempfile
+import threading
+import time
+import types
+from typing import Awaitable, Callable, List, Optional
+from urllib.parse import urlparse
+
+import aiohttp
+import redis.asyncio as redis
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_connector import FakeConnector  # noqa: E402
+
+API_KEY = "benchmark-api-key"
+SCENARIOS = ("inbound", "send", "notify", "export", "migrate")
+
+
+def _load_config_module():
+    """没有 config.py 时按 config-example.py 生成配置模块（未填写的项为 None，随后由基准覆盖）"""
+    try:
+        import config  # noqa: F401
+        return
+    except ImportError:
+        pass
+    with open(os.path.join(ROOT, "config-example.py"), encoding="utf-8") as file:
+        source = re.sub(r"^(\s+\w+\s*=)\s*$", r"\1 None", file.read(), flags=re.MULTILINE)
+    module = types.ModuleType("config")
+    exec(compile(source, "config-example.py", "exec"), module.__dict__)
+    sys.modules["config"] = module
+
+
+def load_app(redis_url: str, args):
+    """导入 app 并覆盖与基准相关的配置"""
+    _load_config_module()
+    import app
+
+    url = urlparse(redis_url)
+    overrides = {
+        "REDIS_HOST": url.hostname or "localhost",
+        "REDIS_PORT": url.port or 6379,
+        "REDIS_DB": int(url.path.lstrip("/") or 0),
+        "REDIS_PASSWORD": url.password,
+        # 关闭认证：入站请求不带 JWT，出站不获取令牌
+        "APP_ID": "",
+        "APP_PASSWORD": "",
+        "API_KEY": API_KEY,
+        "RATE_LIMIT_CONVERSATION_RATE": args.conversation_rate,
+        "RATE_LIMIT_CONVERSATION_BURST": max(1.0, args.conversation_rate),
+        "RATE_LIMIT_SERVICE_URL_RATE": args.service_url_rate,
+        "RATE_LIMIT_SERVICE_URL_BURST": max(1.0, args.service_url_rate),
+        "OUTBOUND_QUEUE_WORKERS": 0,
+        "REFERENCE_MAX_IDLE_DAYS": 0,
+    }
+    for key, value in overrides.items():
+        setattr(app.CONFIG, key, value)
+    app.API_KEY = API_KEY
+    logging.getLogger().setLevel(args.log_level)
+    return app
+
+
+def start_fake_redis() -> str:
+    """在后台线程启动 fakeredis TCP 服务，返回连接地址"""
+    from fakeredis import TcpFakeServer
+
+    server = TcpFakeServer(("127.0.0.1", 0), server_type="redis")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    return f"redis://{host}:{port}/0"
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, math.ceil(q * len(values)) - 1))]
+
+
+def memory_mb() -> dict:
+    """当前与峰值常驻内存（MB）"""
+    current = None
+    try:
+        with open("/proc/self/statm") as file:
+            current = int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    peak = peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+    return {"rss_mb": round(current, 1) if current is not None else None, "peak_rss_mb": round(peak, 1)}
+
+
+def make_result(name: str, count: int, errors: int, duration: float, latencies: List[float], **extra) -> dict:
+    p50 = percentile(latencies, 0.5)
+    p99 = percentile(latencies, 0.99)
+    return {
+        "name": name,
+        "count": count,
+        "errors": errors,
+        "duration_s": round(duration, 3),
+        "throughput": round(count / duration, 1) if duration else None,
+        "p50_ms": round(p50 * 1000, 2) if p50 is not None else None,
+        "p99_ms": round(p99 * 1000, 2) if p99 is not None else None,
+        **memory_mb(),
+        **extra,
+    }
+
+
+async def drive(total: int, concurrency: int, func: Callable[[int], Awaitable[bool]]):
+    """用 concurrency 个并发工作协程执行 total 次请求，返回 (延迟列表, 失败数, 总耗时)"""
+    latencies = []
+    errors = 0
+    indexes = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for index in indexes:
+            started = time.perf_counter()
+            try:
+                if not await func(index):
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+class Benchmark:
+    """基准运行上下文：应用、HTTP 客户端、存储和 Connector 替身"""
+
+    def __init__(self, app, session: aiohttp.ClientSession, base_url: str, connector: FakeConnector, args):
+        self.app = app
+        self.session = session
+        self.base_url = base_url
+        self.connector = connector
+        self.args = args
+        self.storage = app.BOT.redis_storage
+        self.headers = {"X-API-Key": API_KEY}
+        self.random = random.Random(args.seed)
+        self.export_file = os.path.join(tempfile.mkdtemp(prefix="bot-bench-"), "references.ndjson")
+
+    def reference(self, index: int) -> dict:
+        """第 index 个测试对话的序列化引用（偶数为一对一对话，奇数为群聊）"""
+        personal = index % 2 == 0
+        return {
+            "activity_id": "",
+            "bot_id": "28:benchmark-bot",
+            "bot_name": "benchmark-bot",
+            "channel_id": "msteams",
+            "conversation_id": f"bench-conv-{index}",
+            "conversation_is_group": "false" if personal else "true",
+            "service_url": f"{self.connector.url}/",
+            "user_id": f"29:bench-user-{index}",
+            "user_name": f"Bench User {index}",
+            "user_aad_object_id": "",
+            "conversation_type": "personal" if personal else "groupChat",
+            "tenant_id": "bench-tenant",
+        }
+
+    async def seed(self, count: int):
+        """清空并写入 count 个对话引用"""
+        if self.app.BOT.write_buffer:
+            await self.app.BOT.write_buffer.flush()
+        await self.storage.clear_all_references()
+        for start in range(0, count, 1000):
+            await self.storage.add_serialized_references({
+                f"bench-conv-{index}": self.reference(index)
+                for index in range(start, min(count, start + 1000))
+            })
+
+    def _activity(self, index: int) -> dict:
+        conversation = index % self.args.conversations
+        return {
+            "type": "message",
+            "id": f"bench-activity-{index}",
+            "text": f"hello {index}",
+            "channelId": "msteams",
+            "serviceUrl": f"{self.connector.url}/",
+            "from": {"id": f"29:bench-user-{conversation}", "name": f"Bench User {conversation}"},
+            "recipient": {"id": "28:benchmark-bot", "name": "benchmark-bot"},
+            "conversation": {"id": f"bench-inbound-{conversation}", "conversationType": "personal",
+                             "tenantId": "bench-tenant"},
+            "channelData": {"tenant": {"id": "bench-tenant"}},
+        }
+
+    async def _post(self, path: str, payload: dict) -> bool:
+        async with self.session.post(f"{self.base_url}{path}", json=payload, headers=self.headers) as response:
+            await response.read()
+            return response.status < 300
+
+    async def inbound(self) -> List[dict]:
+        total = self.args.requests
+        before = self.connector.snapshot()
+        latencies, errors, duration = await drive(
+            total, self.args.concurrency, lambda index: self._post("/api/messages", self._activity(index))
+        )
+        replies = self.connector.snapshot()["activities"] - before["activities"]
+        return [make_result("inbound", total - errors, errors, duration, latencies, replies=replies)]
+
+    async def send(self) -> List[dict]:
+        await self.seed(self.args.conversations)
+        total = self.args.requests
+
+        def send_one(index: int):
+            conversation_id = f"bench-conv-{self.random.randrange(self.args.conversations)}"
+            return self._post("/api/send-by-convid", {"message": f"bench {index}", "conversation_id": conversation_id})
+
+        before = self.connector.snapshot()
+        latencies, errors, duration = await drive(total, self.args.concurrency, send_one)
+        after = self.connector.snapshot()
+        return [make_result("send", total - errors, errors, duration, latencies,
+                            delivered=after["activities"] - before["activities"],
+                            throttled=after["throttled"] - before["throttled"])]
+
+    async def notify(self) -> List[dict]:
+        results = []
+        for size in self.args.notify_sizes:
+            await self.seed(size)
+            before = self.connector.snapshot()
+            started = time.perf_counter()
+            async with self.session.post(f"{self.base_url}/api/notify", json={"message": "bench broadcast"},
+                                         headers=self.headers) as response:
+                summary = await response.json()
+            duration = time.perf_counter() - started
+            after = self.connector.snapshot()
+            # 每个对话的发送耗时（从获取并发名额到发送完成）
+            latencies = [item["elapsed_ms"] / 1000 for item in summary.get("results", [])]
+            results.append(make_result(
+                f"notify[{size}]", summary.get("sent", 0), summary.get("failed", 0), duration, latencies,
+                references=size,
+                delivered=after["activities"] - before["activities"],
+                throttled=after["throttled"] - before["throttled"],
+            ))
+        return results
+
+    async def export(self) -> List[dict]:
+        await self.seed(self.args.export_size)
+        count = 0
+        size = 0
+        started = time.perf_counter()
+        first_byte = None
+        async with self.session.get(f"{self.base_url}/api/export", params={"format": "ndjson"},
+                                    headers=self.headers) as response:
+            with open(self.export_file, "wb") as file:
+                async for chunk in response.content.iter_chunked(64 * 1024):
+                    if first_byte is None:
+                        first_byte = time.perf_counter() - started
+                    file.write(chunk)
+                    size += len(chunk)
+                    count += chunk.count(b"\n")
+            ok = response.status == 200
+        duration = time.perf_counter() - started
+        return [make_result("export", count, 0 if ok else 1, duration, [duration],
+                            bytes=size, first_byte_ms=round((first_byte or 0) * 1000, 2))]
+
+    async def migrate(self) -> List[dict]:
+        if not os.path.exists(self.export_file):
+            await self.export()
+        await self.storage.clear_all_references()
+        self.app.CONFIG.JSON_BACKUP_FILE = self.export_file
+        started = time.perf_counter()
+        async with self.session.get(f"{self.base_url}/api/migrate-from-json", params={"resume": "0"},
+                                    headers=self.headers) as response:
+            data = await response.json()
+        duration = time.perf_counter() - started
+        imported = data.get("progress", {}).get("imported", 0)
+        stored = await self.storage.count_conversation_references()
+        return [make_result("migrate", imported, 0 if response.status == 200 and stored == imported else 1,
+                            duration, [duration], stored=stored)]
+
+
+def compare(results: List[dict], baseline_path: str, tolerance: float) -> List[str]:
+    """与基线比较，返回回退项的说明"""
+    with open(baseline_path, encoding="utf-8") as file:
+        baseline = {item["name"]: item for item in json.load(file)["results"]}
+    regressions = []
+    for result in results:
+        previous = baseline.get(result["name"])
+        if not previous:
+            continue
+        if previous.get("throughput") and result.get("throughput") is not None \
+                and result["throughput"] < previous["throughput"] * (1 - tolerance):
+            regressions.append(f"{result['name']}: throughput {result['throughput']} < {previous['throughput']}")
+        if previous.get("p99_ms") and result.get("p99_ms") is not None \
+                and result["p99_ms"] > previous["p99_ms"] * (1 + tolerance):
+            regressions.append(f"{result['name']}: p99 {result['p99_ms']}ms > {previous['p99_ms']}ms")
+    return regressions
+
+
+def print_table(results: List[dict]):
+    print(f"{'scenario':<16} {'count':>8} {'errors':>7} {'ops/s':>10} {'p50 ms':>9} {'p99 ms':>9} "
+          f"{'rss MB':>8} {'peak MB':>8}")
+    for result in results:
+        print(f"{result['name']:<16} {result['count']:>8} {result['errors']:>7} "
+              f"{result['throughput'] if result['throughput'] is not None else '-':>10} "
+              f"{result['p50_ms'] if result['p50_ms'] is not None else '-':>9} "
+              f"{result['p99_ms'] if result['p99_ms'] is not None else '-':>9} "
+              f"{result['rss_mb'] if result['rss_mb'] is not None else '-':>8} {result['peak_rss_mb']:>8}")
+
+
+async def main(args) -> int:
+    redis_url = args.redis_url or start_fake_redis()
+    client = redis.from_url(redis_url)
+    try:
+        if await client.dbsize():
+            if not args.flush:
+                print(f"Redis database {redis_url} is not empty; use an empty database or pass --flush",
+                      file=sys.stderr)
+                return 2
+            await client.flushdb()
+    finally:
+        await client.aclose()
+
+    connector = FakeConnector(latency=args.latency_ms / 1000, throttle_rate=args.throttle_rate,
+                              retry_after=args.retry_after, seed=args.seed)
+    connector.start()
+    app = load_app(redis_url, args)
+    runner = web.AppRunner(app.create_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    base_url = f"http://127.0.0.1:{runner.addresses[0][1]}"
+
+    results = []
+    try:
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=args.concurrency)) as session:
+            benchmark = Benchmark(app, session, base_url, connector, args)
+            for scenario in args.scenarios:
+                results.extend(await getattr(benchmark, scenario)())
+    finally:
+        await runner.cleanup()
+        connector.stop()
+
+    print_table(results)
+    report = {
+        "timestamp": time.time(),
+        "python": sys.version.split()[0],
+        "redis": "fakeredis" if not args.redis_url else "redis",
+        "params": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        type=lambda value: [item for item in value.split(",") if item],
+                        help=f"要运行的负载，逗号分隔（{', '.join(SCENARIOS)}）")
+    parser.add_argument("--redis-url", help="Redis 地址（如 redis://localhost:6379/15），不指定时使用 fakeredis")
+    parser.add_argument("--flush", action="store_true", help="允许清空非空的 Redis 数据库")
+    parser.add_argument("--requests", type=int, default=2000, help="inbound/send 的请求数")
+    parser.add_argument("--concurrency", type=int, default=32, help="并发请求数")
+    parser.add_argument("--conversations", type=int, default=1000, help="inbound/send 使用的对话数量")
+    parser.add_argument("--notify-sizes", default=[1000, 10000],
+                        type=lambda value: [int(item) for item in value.split(",") if item],
+                        help="notify 广播的对话数量，逗号分隔（如 1000,10000,100000）")
+    parser.add_argument("--export-size", type=int, default=10000, help="export/migrate 的对话数量")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Connector 替身的响应延迟（毫秒）")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Connector 替身返回 429 的比例")
+    parser.add_argument("--retry-after", type=float, default=0.0, help="429 响应的 Retry-After（秒）")
+    parser.add_argument("--conversation-rate", type=float, default=1e6, help="每个对话的限流速率")
+    parser.add_argument("--service-url-rate", type=float, default=1e6, help="每个 service_url 的限流速率")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子")
+    parser.add_argument("--output", help="结果 JSON 文件")
+    parser.add_argument("--baseline", help="基线结果 JSON 文件，检测性能回退")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的回退比例")
+    parser.add_argument("--log-level", default="WARNING", help="日志级别")
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
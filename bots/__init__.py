@@ -1,6 +1,20 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT License.
 
+from .broadcast import BroadcastEngine
+from .cards import CardRenderer, RenderedCard
+from .connector_pool import PooledBotFrameworkAuthentication
+from .message_queue import DeadLetterError, OutboundMessageQueue
 from .proactive_bot import ProactiveBot
+from .rate_limiter import AdaptiveRateLimiter
 
-__all__ = ["ProactiveBot"]
+__all__ = [
+    "AdaptiveRateLimiter",
+    "BroadcastEngine",
+    "CardRenderer",
+    "DeadLetterError",
+    "OutboundMessageQueue",
+    "PooledBotFrameworkAuthentication",
+    "ProactiveBot",
+    "RenderedCard",
+]
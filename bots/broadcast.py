@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+from botbuilder.schema import ConversationReference
+
+from .metrics import BROADCAST_DURATION, BROADCAST_SIZE
+
+logger = logging.getLogger(__name__)
+
+# (conversation_id, 对话引用, 发送内容)
+BroadcastTarget = Tuple[str, ConversationReference, Any]
+
+
+async def iter_targets(targets) -> AsyncIterator[BroadcastTarget]:
+    """统一遍历目标：支持普通可迭代对象，或按批次产出列表的异步迭代器"""
+    if hasattr(targets, "__aiter__"):
+        async for batch in targets:
+            for target in batch:
+                yield target
+    else:
+        for target in targets:
+            yield target
+
+
+class BroadcastEngine:
+    """并发广播引擎：全局并发上限 + 每个 service_url 的并发上限，单个对话失败不影响其他对话"""
+
+    def __init__(self, send_func: Callable[[ConversationReference, Any], Awaitable],
+                 max_concurrency: int = 64, per_service_url_concurrency: int = 16,
+                 name: str = "broadcast"):
+        """
+        初始化广播引擎
+
+        Args:
+            send_func: 发送函数，参数为 (对话引用, 发送内容)，失败时抛出异常
+            max_concurrency: 全局最大并发发送数
+            per_service_url_concurrency: 每个 service_url 的最大并发发送数
+            name: 引擎名称，用作指标标签
+        """
+        self.send_func = send_func
+        self.max_concurrency = max_concurrency
+        self.per_service_url_concurrency = per_service_url_concurrency
+        self.name = name
+        self._service_url_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def _service_url_semaphore(self, service_url: str) -> asyncio.Semaphore:
+        semaphore = self._service_url_semaphores.get(service_url)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.per_service_url_concurrency)
+            self._service_url_semaphores[service_url] = semaphore
+        return semaphore
+
+    async def _send_one(self, target: BroadcastTarget) -> dict:
+        conversation_id, reference, payload = target
+        started = time.monotonic()
+        try:
+            async with self._service_url_semaphore(reference.service_url or ""):
+                await self.send_func(reference, payload)
+            return {"conversation_id": conversation_id, "status": "sent",
+                    "elapsed_ms": round((time.monotonic() - started) * 1000, 1)}
+        except Exception as e:
+            logger.warning(f"Broadcast to {conversation_id} failed: {e}")
+            return {"conversation_id": conversation_id, "status": "failed", "error": str(e),
+                    "elapsed_ms": round((time.monotonic() - started) * 1000, 1)}
+
+    async def run(self, targets, on_result: Optional[Callable[[dict], Awaitable]] = None,
+                  include_results: bool = True) -> dict:
+        """
+        向所有目标并发发送，返回汇总结果
+
+        Args:
+            targets: 目标列表，或按批次产出目标列表的异步迭代器（可边读取边发送）
+            on_result: 每个目标完成时回调（用于流式返回结果）
+            include_results: 汇总中是否包含每个目标的结果
+        """
+        started = time.monotonic()
+        global_semaphore = asyncio.Semaphore(self.max_concurrency)
+        tasks = set()
+        results = []
+        summary = {"total": 0, "sent": 0, "failed": 0}
+
+        async def worker(target: BroadcastTarget):
+            try:
+                result = await self._send_one(target)
+                summary[result["status"]] += 1
+                if include_results:
+                    results.append(result)
+                if on_result is not None:
+                    try:
+                        await on_result(result)
+                    except Exception as e:
+                        logger.error(f"Broadcast result callback failed: {e}")
+            finally:
+                global_semaphore.release()
+
+        try:
+            async for target in iter_targets(targets):
+                # 先获取全局并发名额再创建任务，读取速度受发送速度反压
+                await global_semaphore.acquire()
+                summary["total"] += 1
+                task = asyncio.create_task(worker(target))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+        elapsed = time.monotonic() - started
+        BROADCAST_SIZE.observe(summary["total"], self.name)
+        BROADCAST_DURATION.observe(elapsed, self.name)
+        summary["elapsed_seconds"] = round(elapsed, 3)
+        if include_results:
+            summary["results"] = results
+        logger.info(f"Broadcast finished: {summary['sent']} sent, {summary['failed']} failed, "
+                    f"{summary['total']} total in {summary['elapsed_seconds']}s")
+        return summary
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Tuple
+
+from botbuilder.core import MessageFactory
+from botbuilder.schema import Activity, Attachment
+
+logger = logging.getLogger(__name__)
+
+ADAPTIVE_CARD_CONTENT_TYPE = "application/vnd.microsoft.card.adaptive"
+
+
+def split_paragraphs(message: str) -> list:
+    """把消息按 <br />、<p></p> 和换行拆分为段落，移除空行"""
+    lines = message.replace("<br />", "\n").replace("<p>", "").replace("</p>", "\n")
+    return [p.strip() for p in lines.split("\n") if p.strip()]
+
+
+def build_card_content(paragraphs: list) -> dict:
+    """为每个段落生成一个 TextBlock，组成 Adaptive Card"""
+    return {
+        "type": "AdaptiveCard",
+        "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
+        "version": "1.3",
+        "body": [
+            {
+                "type": "TextBlock",
+                "text": paragraph,
+                "wrap": True,
+                "separator": True
+            }
+            for paragraph in paragraphs
+        ]
+    }
+
+
+class RenderedCard:
+    """渲染好的卡片：内容与序列化结果只生成一次，在多次发送之间共享，不可修改"""
+
+    __slots__ = ("_key", "_json", "_attachment")
+
+    def __init__(self, key: str, content: dict):
+        self._key = key
+        self._json = json.dumps(content, ensure_ascii=False, separators=(",", ":"))
+        self._attachment = Attachment(content_type=ADAPTIVE_CARD_CONTENT_TYPE, content=content)
+
+    @property
+    def key(self) -> str:
+        return self._key
+
+    @property
+    def json(self) -> str:
+        """卡片内容的 JSON 字符串"""
+        return self._json
+
+    @property
+    def size(self) -> int:
+        """卡片内容序列化后的字节数"""
+        return len(self._json.encode("utf-8"))
+
+    def to_activity(self) -> Activity:
+        """生成一个新的消息活动（活动在发送时会被修改，因此每次发送都要新建，附件可以共享）"""
+        return MessageFactory.attachment(self._attachment)
+
+
+class CardRenderer:
+    """消息卡片渲染器，按消息内容哈希缓存渲染结果（LRU + TTL + 总大小上限）"""
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 16 * 1024 * 1024, ttl: float = 600.0):
+        """
+        初始化卡片渲染器
+
+        Args:
+            max_entries: 最多缓存的卡片数量
+            max_bytes: 缓存卡片的总字节数上限
+            ttl: 缓存有效期（秒），<= 0 表示不过期
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._cache: "OrderedDict[str, Tuple[float, RenderedCard]]" = OrderedDict()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def cache_key(message: str) -> str:
+        return hashlib.sha256(message.encode("utf-8")).hexdigest()
+
+    def render(self, message: str) -> RenderedCard:
+        """渲染消息卡片，相同内容直接返回缓存结果"""
+        key = self.cache_key(message)
+        now = time.monotonic()
+
+        entry = self._cache.get(key)
+        if entry is not None:
+            expires_at, card = entry
+            if expires_at > now:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return card
+            self._remove(key)
+
+        self.misses += 1
+        card = RenderedCard(key, build_card_content(split_paragraphs(message)))
+        if card.size <= self.max_bytes:
+            expires_at = now + self.ttl if self.ttl > 0 else float("inf")
+            self._cache[key] = (expires_at, card)
+            self._bytes += card.size
+            self._evict()
+        return card
+
+    def _remove(self, key: str):
+        _, card = self._cache.pop(key)
+        self._bytes -= card.size
+
+    def _evict(self):
+        while self._cache and (len(self._cache) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, card) = self._cache.popitem(last=False)
+            self._bytes -= card.size
+            self.evictions += 1
+
+    def clear(self):
+        self._cache.clear()
+        self._bytes = 0
+
+    def get_stats(self) -> dict:
+        """获取缓存统计信息"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._cache),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 4) if total else None,
+        }
@@ -0,0 +1,157 @@
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from botbuilder.schema import ConversationReference
+
+from .cards import CardRenderer, RenderedCard, build_card_content, split_paragraphs
+from .metrics import COALESCED_CALLS_SAVED
+
+logger = logging.getLogger(__name__)
+
+# Teams 单条消息的上限约 28 KB（包含活动本身的字段），卡片内容留出余量
+DEFAULT_MAX_CARD_BYTES = 24 * 1024
+
+
+def _json_size(value) -> int:
+    """与 RenderedCard 相同的序列化方式下的字节数"""
+    return len(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+# 不含 TextBlock 的卡片内容字节数
+_EMPTY_CARD_SIZE = _json_size(build_card_content([]))
+
+
+def pack_cards(messages: List[str], max_bytes: int = DEFAULT_MAX_CARD_BYTES) -> List[Tuple[RenderedCard, int]]:
+    """
+    按顺序把多条消息合并为尽量少的卡片，每条消息的段落各为一个 TextBlock
+
+    返回 [(卡片, 包含的消息数), ...]；单条消息本身超过上限时单独成卡。
+    卡片大小按各 TextBlock 的字节数累加估算，每张卡片只序列化一次。
+    """
+    groups = []
+    paragraphs: list = []
+    size = _EMPTY_CARD_SIZE
+    count = 0
+    for message in messages:
+        message_paragraphs = split_paragraphs(message)
+        # 每个 TextBlock 之间有一个逗号
+        blocks_size = sum(_json_size(block) + 1 for block in build_card_content(message_paragraphs)["body"])
+        if count and size + blocks_size - 1 > max_bytes:
+            groups.append((paragraphs, count))
+            paragraphs, size, count = [], _EMPTY_CARD_SIZE, 0
+        paragraphs = paragraphs + message_paragraphs
+        size += blocks_size
+        count += 1
+    if count:
+        groups.append((paragraphs, count))
+    return [
+        (RenderedCard(CardRenderer.cache_key("\n".join(paragraphs)), build_card_content(paragraphs)), count)
+        for paragraphs, count in groups
+    ]
+
+
+class _PendingBurst:
+    """一个对话在当前窗口内积累的消息"""
+
+    __slots__ = ("reference", "messages", "futures", "task")
+
+    def __init__(self, reference: ConversationReference):
+        self.reference = reference
+        self.messages: List[str] = []
+        self.futures: List[asyncio.Future] = []
+        self.task: Optional[asyncio.Task] = None
+
+
+class MessageCoalescer:
+    """
+    按对话合并短时间内连续发送的消息
+
+    对话的第一条消息开启一个窗口，窗口内到达的消息在窗口结束时合并为一张（超过大小上限时
+    拆为尽量少的几张）卡片发送；窗口从第一条消息开始计时，持续有消息时延迟也不超过窗口长度。
+    submit 在所在卡片发送完成后返回，发送失败时抛出同样的异常。
+    """
+
+    def __init__(self, send_func: Callable[[ConversationReference, object], Awaitable],
+                 window: float = 0.5, max_card_bytes: int = DEFAULT_MAX_CARD_BYTES):
+        """
+        Args:
+            send_func: 发送函数，参数为 (对话引用, 活动)
+            window: 合并窗口（秒）
+            max_card_bytes: 每张卡片内容序列化后的最大字节数
+        """
+        self.send_func = send_func
+        self.window = window
+        self.max_card_bytes = max_card_bytes
+        self._pending: Dict[str, _PendingBurst] = {}
+
+        self.messages = 0
+        self.cards_sent = 0
+        self.calls_saved = 0
+        self.failed = 0
+
+    async def submit(self, conversation_reference: ConversationReference, message: str):
+        """加入当前对话的合并窗口，等待所在卡片发送完成"""
+        conversation_id = conversation_reference.conversation.id
+        burst = self._pending.get(conversation_id)
+        if burst is None:
+            burst = self._pending[conversation_id] = _PendingBurst(conversation_reference)
+            burst.task = asyncio.create_task(self._flush_after_window(conversation_id, burst))
+        future = asyncio.get_running_loop().create_future()
+        burst.messages.append(message)
+        burst.futures.append(future)
+        self.messages += 1
+        await future
+
+    async def _flush_after_window(self, conversation_id: str, burst: _PendingBurst):
+        try:
+            await asyncio.sleep(self.window)
+        finally:
+            # 窗口结束后到达的消息开启新的窗口
+            if self._pending.get(conversation_id) is burst:
+                del self._pending[conversation_id]
+        await self._send_burst(burst)
+
+    async def _send_burst(self, burst: _PendingBurst):
+        offset = 0
+        for card, count in pack_cards(burst.messages, self.max_card_bytes):
+            futures = burst.futures[offset:offset + count]
+            offset += count
+            try:
+                await self.send_func(burst.reference, card.to_activity())
+            except Exception as e:
+                self.failed += 1
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.cards_sent += 1
+            if count > 1:
+                self.calls_saved += count - 1
+                COALESCED_CALLS_SAVED.inc(amount=count - 1)
+                logger.debug(f"Coalesced {count} messages into one card for "
+                             f"{burst.reference.conversation.id}")
+            for future in futures:
+                if not future.done():
+                    future.set_result(None)
+
+    async def close(self):
+        """立即发送所有未到窗口结束的消息"""
+        bursts = list(self._pending.values())
+        self._pending.clear()
+        for burst in bursts:
+            burst.task.cancel()
+        await asyncio.gather(*(burst.task for burst in bursts), return_exceptions=True)
+        await asyncio.gather(*(self._send_burst(burst) for burst in bursts), return_exceptions=True)
+
+    def get_stats(self) -> dict:
+        """获取合并统计信息"""
+        return {
+            "window_ms": round(self.window * 1000),
+            "pending_conversations": len(self._pending),
+            "messages": self.messages,
+            "cards_sent": self.cards_sent,
+            "api_calls_saved": self.calls_saved,
+            "failed_cards": self.failed,
+        }
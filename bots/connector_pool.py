@@ -0,0 +1,294 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import jwt
+import requests
+from requests.adapters import HTTPAdapter
+from msrest.authentication import Authentication
+
+from botbuilder.integration.aiohttp import (
+    ConfigurationBotFrameworkAuthentication,
+    ConfigurationServiceClientCredentialFactory,
+)
+from botbuilder.schema import Activity
+from botframework.connector.aio import ConnectorClient
+from botframework.connector.auth import (
+    AuthenticateRequestResult,
+    AuthenticationConstants,
+    ClaimsIdentity,
+    ConnectorFactory,
+    ServiceClientCredentialsFactory,
+)
+
+logger = logging.getLogger(__name__)
+
+# 无法从令牌中解析过期时间时使用的有效期（秒），AAD 应用令牌通常为 1 小时
+DEFAULT_TOKEN_LIFETIME = 3000
+
+
+class CachedTokenCredentials(Authentication):
+    """
+    访问令牌缓存在内存中的凭据包装
+
+    SDK 在事件循环线程上同步调用 signed_session；令牌由后台任务在线程池中提前刷新，
+    正常情况下 signed_session 只读取缓存，不会阻塞事件循环。其他属性转发给被包装的凭据。
+    """
+
+    def __init__(self, credentials: Authentication):
+        self.credentials = credentials
+        app_id = getattr(credentials, "microsoft_app_id", None)
+        self.enabled = bool(app_id) and app_id != AuthenticationConstants.ANONYMOUS_SKILL_APP_ID
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self.acquisitions = 0
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.credentials, name)
+
+    @property
+    def expires_in(self) -> float:
+        """缓存的令牌剩余有效时间（秒）"""
+        return self._expires_at - time.time()
+
+    def _acquire(self) -> str:
+        """从被包装的凭据获取令牌（可能发起网络请求），并解析过期时间"""
+        with self._lock:
+            token = self.credentials.get_access_token()
+            try:
+                claims = jwt.decode(token, options={"verify_signature": False})
+                expires_at = float(claims["exp"])
+            except (jwt.PyJWTError, KeyError, TypeError, ValueError):
+                expires_at = time.time() + DEFAULT_TOKEN_LIFETIME
+            self._token = token
+            self._expires_at = expires_at
+            self.acquisitions += 1
+            return token
+
+    async def refresh(self):
+        """在线程池中获取令牌，避免阻塞事件循环"""
+        if self.enabled:
+            await asyncio.to_thread(self._acquire)
+
+    def get_access_token(self, force_refresh: bool = False) -> str:
+        # 后台刷新失败时兜底：令牌即将过期则同步获取
+        if force_refresh or self._token is None or self.expires_in < 60:
+            return self._acquire()
+        return self._token
+
+    def signed_session(self, session: requests.Session = None) -> requests.Session:
+        if not session:
+            session = requests.Session()
+        if self.enabled:
+            session.headers["Authorization"] = f"Bearer {self.get_access_token()}"
+        else:
+            session.headers.pop("Authorization", None)
+        return session
+
+
+class CachedCredentialsFactory(ServiceClientCredentialsFactory):
+    """凭据工厂包装：相同参数复用同一个凭据对象，令牌在过期前由后台任务刷新"""
+
+    def __init__(self, inner: ServiceClientCredentialsFactory, refresh_margin: float = 300.0,
+                 check_interval: float = 60.0):
+        """
+        Args:
+            inner: 实际创建凭据的工厂
+            refresh_margin: 令牌剩余有效时间低于该值（秒）时刷新
+            check_interval: 后台检查间隔（秒）
+        """
+        self.inner = inner
+        self.refresh_margin = refresh_margin
+        self.check_interval = check_interval
+        self._credentials: Dict[Tuple, CachedTokenCredentials] = {}
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.refresh_errors = 0
+
+    async def is_valid_app_id(self, app_id: str) -> bool:
+        return await self.inner.is_valid_app_id(app_id)
+
+    async def is_authentication_disabled(self) -> bool:
+        return await self.inner.is_authentication_disabled()
+
+    async def create_credentials(self, app_id: str, oauth_scope: str, login_endpoint: str,
+                                 validate_authority: bool) -> Authentication:
+        key = (app_id, oauth_scope, login_endpoint, validate_authority)
+        credentials = self._credentials.get(key)
+        if credentials is not None:
+            return credentials
+        async with self._lock:
+            credentials = self._credentials.get(key)
+            if credentials is None:
+                credentials = CachedTokenCredentials(
+                    await self.inner.create_credentials(app_id, oauth_scope, login_endpoint, validate_authority)
+                )
+                await credentials.refresh()
+                self._credentials[key] = credentials
+        return credentials
+
+    def start(self):
+        """启动后台令牌刷新任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            for credentials in list(self._credentials.values()):
+                if not credentials.enabled or credentials.expires_in > self.refresh_margin:
+                    continue
+                try:
+                    await credentials.refresh()
+                except Exception as e:
+                    self.refresh_errors += 1
+                    logger.error(f"Failed to refresh access token for {credentials.oauth_scope}: {e}")
+
+    def get_stats(self) -> dict:
+        """获取凭据缓存统计信息"""
+        enabled = [credentials for credentials in self._credentials.values() if credentials.enabled]
+        return {
+            "credentials": len(self._credentials),
+            "token_acquisitions": sum(credentials.acquisitions for credentials in enabled),
+            "refresh_errors": self.refresh_errors,
+            "min_token_expires_in": round(min(credentials.expires_in for credentials in enabled), 1)
+            if enabled else None,
+        }
+
+
+class _PooledConnectorFactory(ConnectorFactory):
+    """从连接池取得 ConnectorClient，未命中时由 SDK 的工厂创建"""
+
+    def __init__(self, authentication: "PooledBotFrameworkAuthentication", inner: ConnectorFactory, app_id: str):
+        self.authentication = authentication
+        self.inner = inner
+        self.app_id = app_id
+
+    async def create(self, service_url: str, audience: str = None) -> ConnectorClient:
+        return await self.authentication.get_connector_client(self.app_id, service_url, audience, self.inner)
+
+
+class PooledBotFrameworkAuthentication(ConfigurationBotFrameworkAuthentication):
+    """
+    复用出站连接的 Bot Framework 认证
+
+    SDK 默认每次 continue_conversation 都创建新的 ConnectorClient 和凭据：新的 requests 会话意味着
+    新的 TCP/TLS 握手，新的凭据意味着重新向 AAD 获取令牌。这里按 (app_id, service_url, audience)
+    缓存 ConnectorClient，保持每个 service_url 一个 keep-alive 会话，并缓存凭据和令牌。
+    """
+
+    def __init__(self, configuration: Any, *, credentials_factory: ServiceClientCredentialsFactory = None,
+                 pool_maxsize: int = 16, token_refresh_margin: float = 300.0, **kwargs):
+        """
+        Args:
+            configuration: 机器人配置（与 ConfigurationBotFrameworkAuthentication 相同）
+            credentials_factory: 凭据工厂，默认按配置创建
+            pool_maxsize: 每个 service_url 保持的最大 keep-alive 连接数（不低于并发发送数）
+            token_refresh_margin: 令牌剩余有效时间低于该值（秒）时在后台刷新
+        """
+        self.credentials_factory = CachedCredentialsFactory(
+            credentials_factory or ConfigurationServiceClientCredentialFactory(configuration),
+            refresh_margin=token_refresh_margin
+        )
+        super().__init__(configuration, credentials_factory=self.credentials_factory, **kwargs)
+        self.pool_maxsize = pool_maxsize
+        self._clients: Dict[Tuple[str, str, Optional[str]], ConnectorClient] = {}
+        self.client_hits = 0
+        self.client_misses = 0
+
+    @staticmethod
+    def _get_app_id(claims_identity: ClaimsIdentity) -> str:
+        app_id = claims_identity.get_claim_value(AuthenticationConstants.AUDIENCE_CLAIM)
+        if app_id is None:
+            app_id = claims_identity.get_claim_value(AuthenticationConstants.APP_ID_CLAIM)
+        return app_id
+
+    def create_connector_factory(self, claims_identity: ClaimsIdentity) -> ConnectorFactory:
+        return _PooledConnectorFactory(
+            self, super().create_connector_factory(claims_identity), self._get_app_id(claims_identity)
+        )
+
+    async def authenticate_request(self, activity: Activity, auth_header: str) -> AuthenticateRequestResult:
+        result = await super().authenticate_request(activity, auth_header)
+        if result.connector_factory:
+            result.connector_factory = _PooledConnectorFactory(
+                self, result.connector_factory, self._get_app_id(result.claims_identity)
+            )
+        return result
+
+    def _configure_session(self, session: requests.Session, global_config, local_config, **kwargs):
+        """msrest 发送前的会话回调：首次使用时按并发数扩大连接池，避免超出的连接用完即关"""
+        if not getattr(session, "_bot_pool_configured", False):
+            for prefix in ("https://", "http://"):
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=self.pool_maxsize,
+                    max_retries=session.get_adapter(prefix).max_retries
+                )
+                session.mount(prefix, adapter)
+            session._bot_pool_configured = True
+        return kwargs
+
+    async def get_connector_client(self, app_id: str, service_url: str, audience: Optional[str],
+                                   inner: ConnectorFactory) -> ConnectorClient:
+        """取得 (app_id, service_url, audience) 对应的 ConnectorClient，不存在时创建并缓存"""
+        key = (app_id, service_url, audience)
+        client = self._clients.get(key)
+        if client is not None:
+            self.client_hits += 1
+            return client
+        client = await inner.create(service_url, audience)
+        client.config.session_configuration_callback = self._configure_session
+        # 并发创建时保留先写入的客户端
+        client = self._clients.setdefault(key, client)
+        self.client_misses += 1
+        return client
+
+    async def warm_up(self, app_id: str, service_urls: Iterable[str]) -> int:
+        """为主动发送预先创建各 service_url 的 ConnectorClient（同时获取访问令牌），返回创建数量"""
+        claims_identity = ClaimsIdentity({
+            AuthenticationConstants.AUDIENCE_CLAIM: app_id,
+            AuthenticationConstants.APP_ID_CLAIM: app_id,
+        }, True)
+        factory = self.create_connector_factory(claims_identity)
+        created = 0
+        for service_url in service_urls:
+            # 与 continue_conversation 相同，audience 为 None
+            await factory.create(service_url, None)
+            created += 1
+        return created
+
+    def start(self):
+        """启动后台令牌刷新（需在事件循环启动后调用）"""
+        self.credentials_factory.start()
+
+    async def close(self):
+        """停止令牌刷新并关闭所有连接"""
+        await self.credentials_factory.close()
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            try:
+                await client.__aexit__(None, None, None)
+            except Exception as e:
+                logger.warning(f"Failed to close connector client: {e}")
+
+    def get_stats(self) -> dict:
+        """获取连接池和凭据缓存统计信息"""
+        return {
+            "connector_clients": len(self._clients),
+            "client_hits": self.client_hits,
+            "client_misses": self.client_misses,
+            **self.credentials_factory.get_stats(),
+        }
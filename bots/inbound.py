@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from botbuilder.schema import Activity, ActivityTypes, DeliveryModes
+
+from .metrics import INBOUND_ACTIVITIES, INBOUND_QUEUE_DEPTH, INBOUND_QUEUE_WAIT
+
+logger = logging.getLogger(__name__)
+
+
+def requires_inline_processing(activity: Activity) -> bool:
+    """invoke 和 expectReplies 活动的结果要写在 HTTP 响应中，不能先确认再处理"""
+    return activity.type == ActivityTypes.invoke or activity.delivery_mode == DeliveryModes.expect_replies
+
+
+class ActivityDeduplicator:
+    """
+    按活动 ID 去重入站活动
+
+    Teams 在 webhook 超时或出错时会重新投递同一个活动；首次处理时用 SET NX 记录
+    (conversation_id, activity_id)，有效期内再次收到的活动直接确认而不再执行。
+    记录在 Redis 中，多个 worker 或副本共享。
+    """
+
+    def __init__(self, redis_client, prefix: str, ttl: int = 600):
+        """
+        Args:
+            redis_client: redis.asyncio 客户端
+            prefix: 键前缀
+            ttl: 记录的有效期（秒），应覆盖 Teams 的重试窗口
+        """
+        self.redis_client = redis_client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.duplicates = 0
+        self.errors = 0
+
+    def _key(self, activity: Activity) -> Optional[str]:
+        if not activity.id or not activity.conversation or not activity.conversation.id:
+            return None
+        return f"{self.prefix}{activity.conversation.id}:{activity.id}"
+
+    async def claim(self, activity: Activity) -> bool:
+        """首次收到返回 True；重复投递返回 False。Redis 不可用时按首次处理（宁可重复也不丢失）"""
+        key = self._key(activity)
+        if key is None:
+            return True
+        try:
+            claimed = await self.redis_client.set(key, 1, nx=True, ex=self.ttl)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Failed to check duplicate activity {activity.id}: {e}")
+            return True
+        if not claimed:
+            self.duplicates += 1
+        return bool(claimed)
+
+    async def release(self, activity: Activity):
+        """处理未完成（被拒绝或失败）时删除记录，使重试能够再次处理"""
+        key = self._key(activity)
+        if key is None:
+            return
+        try:
+            await self.redis_client.delete(key)
+        except Exception as e:
+            logger.warning(f"Failed to release duplicate check for activity {activity.id}: {e}")
+
+    def get_stats(self) -> dict:
+        return {"ttl_seconds": self.ttl, "duplicates": self.duplicates, "errors": self.errors}
+
+
+class InboundTurnExecutor:
+    """
+    入站轮次的有界后台执行器
+
+    /api/messages 完成认证后把轮次放入有界队列并立即确认，由固定数量的工作协程执行。
+    同一个 key（对话）的轮次按入队顺序逐个执行；队列满时 submit 抛出 asyncio.QueueFull，
+    由调用方返回 503 让 Teams 稍后重试（反压）。
+    """
+
+    def __init__(self, handler: Callable[..., Awaitable], workers: int = 16, max_pending: int = 1000):
+        """
+        Args:
+            handler: 轮次处理函数，参数为 submit 时传入的参数
+            workers: 工作协程数量（即并发执行的轮次数）
+            max_pending: 等待执行的最大轮次数
+        """
+        self.handler = handler
+        self.workers = workers
+        self.max_pending = max_pending
+        self._queue: asyncio.Queue = None
+        self._tasks: List[asyncio.Task] = []
+        # key -> [锁, 持有或等待的轮次数]；asyncio.Lock 按等待顺序唤醒，保证同一对话内的顺序
+        self._locks: Dict[str, list] = {}
+
+        self.submitted = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self):
+        """启动工作协程（需在事件循环启动后调用）"""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        logger.info(f"Inbound executor started with {self.workers} workers")
+
+    async def stop(self, timeout: float = 10.0):
+        """停止接收新轮次，等待已排队的轮次执行完成，超时后取消"""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Shutting down with {self._queue.qsize()} inbound turns still queued")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        INBOUND_QUEUE_DEPTH.set(0)
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def submit(self, key: str, *args):
+        """放入一个轮次（key 相同的轮次串行执行）；队列已满时抛出 asyncio.QueueFull"""
+        if self._queue is None:
+            raise RuntimeError("Inbound executor is not started")
+        try:
+            self._queue.put_nowait((time.perf_counter(), key, args))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            INBOUND_ACTIVITIES.inc("rejected")
+            raise
+        self.submitted += 1
+        INBOUND_ACTIVITIES.inc("queued")
+        INBOUND_QUEUE_DEPTH.set(self._queue.qsize())
+
+    async def _work(self):
+        while True:
+            queued_at, key, args = await self._queue.get()
+            INBOUND_QUEUE_DEPTH.set(self._queue.qsize())
+            entry = self._locks.get(key)
+            if entry is None:
+                entry = self._locks[key] = [asyncio.Lock(), 0]
+            entry[1] += 1
+            try:
+                async with entry[0]:
+                    INBOUND_QUEUE_WAIT.observe(time.perf_counter() - queued_at)
+                    await self.handler(*args)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                INBOUND_ACTIVITIES.inc("failed")
+                logger.error(f"Inbound turn failed: {e}")
+            finally:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+                self._queue.task_done()
+
+    def get_stats(self) -> dict:
+        """获取执行器统计信息"""
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "depth": self.depth,
+            "submitted": self.submitted,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,204 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+from typing import Awaitable, Callable, List, Optional
+
+from redis.exceptions import ResponseError
+
+logger = logging.getLogger(__name__)
+
+
+class DeadLetterError(Exception):
+    """无法重试的投递失败（如找不到对话引用），直接进入死信流"""
+
+
+class OutboundMessageQueue:
+    """基于 Redis Streams 的持久化出站消息队列：消费者组 + ACK + 超时重新认领 + 死信流"""
+
+    def __init__(self, redis_client, handler: Callable[[dict], Awaitable],
+                 stream: str = "bot_outbound", group: str = "bot_senders",
+                 dead_letter_stream: Optional[str] = None, consumer_count: int = 4,
+                 max_deliveries: int = 5, claim_idle_ms: int = 60000, block_ms: int = 5000,
+                 batch_size: int = 10, max_len: int = 100000):
+        """
+        初始化出站消息队列
+
+        Args:
+            redis_client: redis.asyncio 客户端
+            handler: 消息处理函数，参数为入队时的任务字典，失败时抛出异常
+            stream: 消息流名称
+            group: 消费者组名称
+            dead_letter_stream: 死信流名称，默认为 "<stream>:dead"
+            consumer_count: 本进程的消费者数量（即并发投递数）
+            max_deliveries: 最大投递次数，超过后进入死信流
+            claim_idle_ms: 待确认消息空闲超过该时间后被重新认领（消费者崩溃或进程重启）
+            block_ms: XREADGROUP 阻塞等待时间
+            batch_size: 每次读取/认领的消息数
+            max_len: 流的近似最大长度
+        """
+        self.redis_client = redis_client
+        self.handler = handler
+        self.stream = stream
+        self.group = group
+        self.dead_letter_stream = dead_letter_stream or f"{stream}:dead"
+        self.consumer_count = consumer_count
+        self.max_deliveries = max_deliveries
+        self.claim_idle_ms = claim_idle_ms
+        self.block_ms = block_ms
+        self.batch_size = batch_size
+        self.max_len = max_len
+        self.consumer_prefix = f"{socket.gethostname()}-{os.getpid()}"
+
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+
+        self.enqueued = 0
+        self.delivered = 0
+        self.failed_attempts = 0
+        self.dead_lettered = 0
+        self.reclaimed = 0
+
+    async def start(self):
+        """创建消费者组并启动消费者和重新认领任务"""
+        try:
+            await self.redis_client.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._stopping = False
+        for i in range(self.consumer_count):
+            self._tasks.append(asyncio.create_task(self._consume(f"{self.consumer_prefix}-{i}")))
+        self._tasks.append(asyncio.create_task(self._reclaim(f"{self.consumer_prefix}-reclaim")))
+        logger.info(f"Outbound queue started with {self.consumer_count} consumers on {self.stream}")
+
+    async def stop(self, timeout: float = 10.0):
+        """停止消费：等待正在投递的消息完成，未确认的消息留给下次启动重新认领"""
+        self._stopping = True
+        if not self._tasks:
+            return
+        done, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks = []
+        logger.info("Outbound queue stopped")
+
+    async def enqueue(self, job: dict) -> str:
+        """追加一条消息到流中，返回消息ID"""
+        job = dict(job, enqueued_at=time.time())
+        message_id = await self.redis_client.xadd(
+            self.stream, {"job": json.dumps(job, ensure_ascii=False)},
+            maxlen=self.max_len, approximate=True
+        )
+        self.enqueued += 1
+        return message_id
+
+    async def _consume(self, consumer: str):
+        """消费者循环：读取新消息并投递"""
+        while not self._stopping:
+            try:
+                response = await self.redis_client.xreadgroup(
+                    self.group, consumer, {self.stream: ">"},
+                    count=self.batch_size, block=self.block_ms
+                )
+                for _, entries in response or []:
+                    for entry_id, fields in entries:
+                        await self._process(entry_id, fields, deliveries=1)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Outbound queue consumer {consumer} error: {e}")
+                await asyncio.sleep(1)
+
+    async def _reclaim(self, consumer: str):
+        """定期认领空闲过久的待确认消息，超过最大投递次数的转入死信流"""
+        interval = max(self.claim_idle_ms / 2000, 1)
+        while not self._stopping:
+            try:
+                start_id = "0-0"
+                while not self._stopping:
+                    result = await self.redis_client.xautoclaim(
+                        self.stream, self.group, consumer, self.claim_idle_ms,
+                        start_id=start_id, count=self.batch_size
+                    )
+                    start_id, entries = result[0], result[1]
+                    for entry_id, fields in entries:
+                        if fields is None:
+                            # 消息已被删除（如流被裁剪），只需确认
+                            await self.redis_client.xack(self.stream, self.group, entry_id)
+                            continue
+                        self.reclaimed += 1
+                        pending = await self.redis_client.xpending_range(
+                            self.stream, self.group, min=entry_id, max=entry_id, count=1
+                        )
+                        deliveries = pending[0]["times_delivered"] if pending else 1
+                        await self._process(entry_id, fields, deliveries=deliveries)
+                    if start_id in ("0-0", b"0-0"):
+                        break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Outbound queue reclaim error: {e}")
+            await asyncio.sleep(interval)
+
+    async def _process(self, entry_id: str, fields: dict, deliveries: int):
+        """投递一条消息：成功则 ACK，不可重试或超过最大投递次数则转入死信流"""
+        try:
+            job = json.loads(fields["job"])
+        except (KeyError, TypeError, ValueError) as e:
+            await self._dead_letter(entry_id, fields, f"Invalid job payload: {e}")
+            return
+        try:
+            await self.handler(job)
+        except DeadLetterError as e:
+            await self._dead_letter(entry_id, fields, str(e))
+            return
+        except Exception as e:
+            self.failed_attempts += 1
+            logger.warning(f"Delivery of {entry_id} failed (attempt {deliveries}/{self.max_deliveries}): {e}")
+            if deliveries >= self.max_deliveries:
+                await self._dead_letter(entry_id, fields, str(e))
+            # 否则保持待确认状态，由重新认领任务稍后重试
+            return
+        await self.redis_client.xack(self.stream, self.group, entry_id)
+        self.delivered += 1
+
+    async def _dead_letter(self, entry_id: str, fields: dict, reason: str):
+        """写入死信流并确认原消息"""
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.xadd(self.dead_letter_stream,
+                  {**(fields or {}), "source_id": entry_id, "error": reason, "failed_at": time.time()},
+                  maxlen=self.max_len, approximate=True)
+        pipe.xack(self.stream, self.group, entry_id)
+        await pipe.execute()
+        self.dead_lettered += 1
+        logger.error(f"Outbound message {entry_id} moved to dead-letter stream: {reason}")
+
+    async def get_stats(self) -> dict:
+        """获取队列统计信息"""
+        stats = {
+            "stream": self.stream,
+            "consumers": self.consumer_count,
+            "enqueued": self.enqueued,
+            "delivered": self.delivered,
+            "failed_attempts": self.failed_attempts,
+            "dead_lettered": self.dead_lettered,
+            "reclaimed": self.reclaimed,
+        }
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.xlen(self.stream)
+            pipe.xpending(self.stream, self.group)
+            pipe.xlen(self.dead_letter_stream)
+            length, pending, dead_length = await pipe.execute()
+            stats.update({
+                "length": length,
+                "pending": pending["pending"] if pending else 0,
+                "dead_letter_length": dead_length,
+            })
+        except Exception as e:
+            stats["error"] = str(e)
+        return stats
@@ -0,0 +1,190 @@
+import asyncio
+import functools
+import logging
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 记录只在事件循环线程内进行，都是普通的字典/列表操作，不需要加锁
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: Sequence[str], labels: Tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labels)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """单调递增计数器"""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    """可增可减的瞬时值"""
+
+    type = "gauge"
+
+    def set(self, value: float, *labels):
+        self._values[labels] = value
+
+
+class Histogram:
+    """直方图：每个标签组合保存各桶计数、总和与次数"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # 标签 -> [各桶计数..., +Inf 桶计数, 总和]
+        self._values: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, *labels):
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        state[bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def samples(self) -> Iterable[str]:
+        for labels, state in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state[:-1]):
+                cumulative += count
+                label_text = _format_labels(self.labelnames, labels, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{label_text} {cumulative}"
+            label_text = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{label_text} {_format_value(state[-1])}"
+            yield f"{self.name}_count{label_text} {cumulative}"
+
+
+class MetricsRegistry:
+    """指标注册表，输出 Prometheus 文本格式"""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_LATENCY = REGISTRY.histogram(
+    "bot_http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status"))
+STORAGE_LATENCY = REGISTRY.histogram(
+    "bot_storage_operation_duration_seconds", "Redis storage operation latency by method", ("operation",))
+STORAGE_ERRORS = REGISTRY.counter(
+    "bot_storage_errors_total", "Redis storage operations that raised", ("operation",))
+SEND_LATENCY = REGISTRY.histogram(
+    "bot_connector_send_duration_seconds", "Bot Connector send latency by service_url and outcome",
+    ("service_url", "outcome"))
+BROADCAST_SIZE = REGISTRY.histogram(
+    "bot_broadcast_targets", "Number of targets per broadcast", ("kind",), buckets=SIZE_BUCKETS)
+BROADCAST_DURATION = REGISTRY.histogram(
+    "bot_broadcast_duration_seconds", "Broadcast wall-clock duration", ("kind",),
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600))
+REFERENCES_REMOVED = REGISTRY.counter(
+    "bot_conversation_references_removed_total",
+    "Conversation references removed automatically (idle expiry, failed sends, bot removed)", ("reason",))
+COALESCED_CALLS_SAVED = REGISTRY.counter(
+    "bot_coalesced_api_calls_saved_total", "Bot Connector calls avoided by merging messages into one card")
+INBOUND_ACTIVITIES = REGISTRY.counter(
+    "bot_inbound_activities_total",
+    "Inbound activities by outcome (inline, queued, duplicate, rejected, failed)", ("outcome",))
+INBOUND_QUEUE_DEPTH = REGISTRY.gauge(
+    "bot_inbound_queue_depth", "Inbound turns waiting for a background worker")
+INBOUND_QUEUE_WAIT = REGISTRY.histogram(
+    "bot_inbound_queue_wait_seconds", "Time inbound turns spend queued before processing starts")
+EVENT_LOOP_LAG = REGISTRY.histogram(
+    "bot_event_loop_lag_seconds", "Delay between scheduled and actual event loop wake-ups")
+COMPONENT_STATS = REGISTRY.gauge(
+    "bot_component_stat", "Numeric stats reported by bot components", ("component", "stat"))
+
+
+def timed_storage_operation(func: Callable):
+    """装饰存储层的异步方法，记录耗时与异常次数"""
+    operation = func.__name__.lstrip("_")
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            STORAGE_ERRORS.inc(operation)
+            raise
+        finally:
+            STORAGE_LATENCY.observe(time.perf_counter() - started, operation)
+    return wrapper
+
+
+def record_component_stats(component: str, stats: dict):
+    """把组件 get_stats() 中的数值写入 bot_component_stat"""
+    for stat, value in stats.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            COMPONENT_STATS.set(value, component, stat)
+
+
+async def monitor_event_loop_lag(interval: float = 0.5):
+    """定期测量事件循环延迟（实际唤醒时间与预期的差值）"""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, time.perf_counter() - started - interval))
@@ -2,18 +2,30 @@
 # Licensed under the MIT License.
 
 import logging
-from typing import Dict, Optional
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
 from botbuilder.core import ActivityHandler, TurnContext
 from botbuilder.schema import ChannelAccount, ConversationReference, Activity
+from .metrics import REFERENCES_REMOVED
 from .redis_storage import RedisConversationReferences
+from .redis_topology import RedisTopology
+from .reference_expiry import ReferenceSweeper
+from .write_behind import ConversationReferenceWriteBuffer
 
 logger = logging.getLogger(__name__)
 
 
 class ProactiveBot(ActivityHandler):
     def __init__(self, redis_host: str = "localhost", redis_port: str = "6378", 
-                 redis_db: str = "1", redis_password: Optional[str] = None):
+                 redis_db: str = "1", redis_password: Optional[str] = None,
+                 redis_scan_count: int = 1000, write_flush_interval: float = 1.0,
+                 write_batch_size: int = 200, compact_format: bool = True,
+                 reference_cache_max_entries: int = 10000, reference_cache_ttl: float = 300.0,
+                 reference_max_idle: float = 0, reference_sweep_interval: float = 3600.0,
+                 redis_mode: str = "standalone", redis_sentinels: Optional[List[Tuple[str, int]]] = None,
+                 redis_sentinel_master: str = "mymaster", redis_sentinel_password: Optional[str] = None,
+                 redis_cluster_nodes: Optional[List[Tuple[str, int]]] = None,
+                 redis_read_from_replicas: bool = False):
         """
         初始化机器人
         
@@ -22,16 +34,56 @@ class ProactiveBot(ActivityHandler):
             redis_port: Redis端口
             redis_db: Redis数据库编号
             redis_password: Redis密码（可选）
+            redis_scan_count: 批量读取时 SCAN 的 COUNT 提示值
+            write_flush_interval: 对话引用写缓冲的刷新间隔（秒），<= 0 时每次直接写入Redis
+            write_batch_size: 写缓冲积累到该数量时立即刷新
+            compact_format: 是否以紧凑编码写入对话引用（读取兼容旧的哈希结构）
+            reference_cache_max_entries: 进程内对话引用缓存的最大条目数，<= 0 时不启用
+            reference_cache_ttl: 进程内对话引用缓存的有效期（秒）
+            reference_max_idle: 对话引用在最后一次活动后保留的时间（秒），<= 0 时不自动过期
+            reference_sweep_interval: 过期清理的执行周期（秒）
+            redis_mode: Redis部署模式，standalone / sentinel / cluster
+            redis_sentinels: Sentinel 地址列表 [(host, port)]
+            redis_sentinel_master: Sentinel 中的主节点名称
+            redis_sentinel_password: Sentinel 本身的密码（可选）
+            redis_cluster_nodes: Cluster 启动节点列表 [(host, port)]
+            redis_read_from_replicas: 对话引用的读取和批量加载是否从副本读取
             json_backup_file: JSON备份文件路径
         """
         try:
+            topology = RedisTopology(
+                mode=redis_mode,
+                host=redis_host,
+                port=redis_port,
+                db=redis_db,
+                password=redis_password,
+                sentinels=redis_sentinels,
+                sentinel_master=redis_sentinel_master,
+                sentinel_password=redis_sentinel_password,
+                cluster_nodes=redis_cluster_nodes,
+                read_from_replicas=redis_read_from_replicas
+            )
             self.redis_storage = RedisConversationReferences(
-                redis_host=redis_host,
-                redis_port=redis_port,
-                redis_db=redis_db,
-                redis_password=redis_password
+                scan_count=redis_scan_count,
+                compact_format=compact_format,
+                cache_max_entries=reference_cache_max_entries,
+                cache_ttl=reference_cache_ttl,
+                topology=topology
             )
-            print(redis_password, redis_db, redis_host, redis_port, 34)
+            self.write_buffer = None
+            if write_flush_interval > 0:
+                self.write_buffer = ConversationReferenceWriteBuffer(
+                    self.redis_storage,
+                    flush_interval=write_flush_interval,
+                    max_batch=write_batch_size
+                )
+            self.sweeper = None
+            if reference_max_idle > 0:
+                self.sweeper = ReferenceSweeper(
+                    self.redis_storage,
+                    max_idle=reference_max_idle,
+                    interval=reference_sweep_interval
+                )
 
             # 如果是首次启动，尝试从JSON文件迁移数据
             # self.redis_storage.migrate_from_json(json_backup_file)
@@ -42,13 +94,34 @@ class ProactiveBot(ActivityHandler):
             logger.error(f"Failed to initialize Redis storage: {e}")
             raise
     
-    def migrate_from_json_job(self, json_backup_file):
-        print('45, migrating from JSON...')
-        self.redis_storage.migrate_from_json(json_backup_file)
-        logger.info("ProactiveBot initialized with Redis storage")
+    async def connect(self):
+        """连接Redis存储（需在事件循环启动后调用）"""
+        await self.redis_storage.connect()
+        if self.write_buffer:
+            self.write_buffer.start()
+        if self.sweeper:
+            self.sweeper.start()
+
+    async def close(self):
+        """停止过期清理，刷新写缓冲并关闭Redis存储连接"""
+        if self.sweeper:
+            await self.sweeper.close()
+        if self.write_buffer:
+            try:
+                await self.write_buffer.close()
+            except Exception as e:
+                logger.error(f"Failed to flush write buffer on shutdown: {e}")
+        await self.redis_storage.close()
+
+    async def migrate_from_json_job(self, json_backup_file, batch_size: Optional[int] = None,
+                                    resume: bool = True, on_progress=None) -> dict:
+        logger.info(f"Migrating conversation references from {json_backup_file}")
+        return await self.redis_storage.migrate_from_json(
+            json_backup_file, batch_size=batch_size, resume=resume, on_progress=on_progress
+        )
 
     async def on_conversation_update_activity(self, turn_context: TurnContext):
-        self._add_conversation_reference(turn_context.activity)
+        await self._add_conversation_reference(turn_context.activity)
         return await super().on_conversation_update_activity(turn_context)
 
     async def on_members_added_activity(
@@ -60,41 +133,85 @@ class ProactiveBot(ActivityHandler):
                     "Welcome to the group!"
                 )
 
+    async def on_members_removed_activity(
+        self, members_removed: [ChannelAccount], turn_context: TurnContext
+    ):
+        # 机器人被移出团队/群聊时删除对话引用，之后的广播不再发往该对话
+        for member in members_removed:
+            if member.id == turn_context.activity.recipient.id:
+                await self.remove_conversation_reference(turn_context.activity.conversation.id, reason="bot_removed")
+
     async def on_message_activity(self, turn_context: TurnContext):
-        self._add_conversation_reference(turn_context.activity)
+        await self._add_conversation_reference(turn_context.activity)
         
-        message_text = turn_context.activity.text.strip().lower()
-        
-        # 检查消息内容是否为 "myid"
-        if message_text == "myid" or "myid" in message_text:
-            user_id = turn_context.activity.from_property.id
-            await turn_context.send_activity(f"Your ID is: {user_id}")
-        
-        # 检查消息内容是否为 "convid"
-        elif message_text == "convid" or "convid" in message_text:
-            conversation_id = turn_context.activity.conversation.id
-            await turn_context.send_activity(f"Your Conversation ID is: {conversation_id}")
-        
-        # 检查消息内容是否为 "myname"
-        elif message_text == "myname" or "myname" in message_text:
-            user_name = turn_context.activity.from_property.name
-            await turn_context.send_activity(f"Your Name is: {user_name}")
-        
-        # 新增：检查Redis状态
-        elif message_text == "redis" or "redis" in message_text:
-            redis_info = self.redis_storage.get_connection_info()
-            info_text = f"Redis Info: {redis_info}"
-            await turn_context.send_activity(info_text)
-        
-        # 新增：显示所有对话引用数量
-        elif message_text == "count" or "count" in message_text:
-            references = self.redis_storage.get_all_conversation_references()
-            await turn_context.send_activity(f"Total conversation references: {len(references)}")
-        
-        else:
+        # 群聊/频道中的消息以 @机器人 开头，先去掉提及再按第一个词查命令表
+        text = TurnContext.remove_recipient_mention(turn_context.activity) or ""
+        command, _, argument = text.strip().lower().partition(" ")
+        handler = self.COMMANDS.get(command)
+        if handler is None:
             await turn_context.send_activity(f"You sent: {turn_context.activity.text}")
+            return
+        await getattr(self, handler)(turn_context, argument.strip())
+
+    # 命令 -> 处理方法名，处理方法的参数为 (turn_context, 命令后的参数)
+    COMMANDS = {
+        "tag": "_add_tag",
+        "untag": "_remove_tag",
+        "tags": "_list_tags",
+        "myid": "_reply_user_id",
+        "convid": "_reply_conversation_id",
+        "myname": "_reply_user_name",
+        "redis": "_reply_redis_info",
+        "count": "_reply_reference_count",
+    }
 
-    def _add_conversation_reference(self, activity: Activity):
+    async def _reply_user_id(self, turn_context: TurnContext, argument: str):
+        await turn_context.send_activity(f"Your ID is: {turn_context.activity.from_property.id}")
+
+    async def _reply_conversation_id(self, turn_context: TurnContext, argument: str):
+        await turn_context.send_activity(f"Your Conversation ID is: {turn_context.activity.conversation.id}")
+
+    async def _reply_user_name(self, turn_context: TurnContext, argument: str):
+        await turn_context.send_activity(f"Your Name is: {turn_context.activity.from_property.name}")
+
+    async def _reply_redis_info(self, turn_context: TurnContext, argument: str):
+        redis_info = await self.redis_storage.get_connection_info()
+        await turn_context.send_activity(f"Redis Info: {redis_info}")
+
+    async def _reply_reference_count(self, turn_context: TurnContext, argument: str):
+        counts = await self.redis_storage.get_reference_counts()
+        await turn_context.send_activity(
+            f"Total conversation references: {counts['total']} "
+            f"(personal: {counts['personal']}, group: {counts['group']})"
+        )
+
+    async def _add_tag(self, turn_context: TurnContext, tag: str):
+        """给当前对话添加标签"""
+        # 对话引用可能还在写缓冲中，先确保已写入Redis
+        if self.write_buffer:
+            await self.write_buffer.flush()
+        try:
+            await self.redis_storage.add_tags([turn_context.activity.conversation.id], [tag])
+        except ValueError as e:
+            await turn_context.send_activity(f"Invalid tag: {e}")
+            return
+        await turn_context.send_activity(f"Added tag: {tag}")
+
+    async def _remove_tag(self, turn_context: TurnContext, tag: str):
+        """移除当前对话的标签"""
+        try:
+            await self.redis_storage.remove_tags([turn_context.activity.conversation.id], [tag])
+        except ValueError as e:
+            await turn_context.send_activity(f"Invalid tag: {e}")
+            return
+        await turn_context.send_activity(f"Removed tag: {tag}")
+
+    async def _list_tags(self, turn_context: TurnContext, argument: str):
+        """列出当前对话的标签"""
+        tags = await self.redis_storage.get_tags(turn_context.activity.conversation.id)
+        await turn_context.send_activity(f"Tags: {', '.join(tags) if tags else '(none)'}")
+
+    async def _add_conversation_reference(self, activity: Activity):
         """
         添加对话引用到Redis存储
         """
@@ -102,38 +219,118 @@ class ProactiveBot(ActivityHandler):
             conversation_reference = TurnContext.get_conversation_reference(activity)
             conversation_id = conversation_reference.conversation.id
             
-            self.redis_storage.add_conversation_reference(conversation_id, conversation_reference)
+            if self.write_buffer:
+                self.write_buffer.add(conversation_id, conversation_reference)
+            else:
+                await self.redis_storage.add_conversation_reference(conversation_id, conversation_reference)
             logger.debug(f"Added conversation reference for {conversation_id}")
             
         except Exception as e:
             logger.error(f"Failed to add conversation reference: {e}")
 
-    def get_conversation_references(self) -> Dict[str, ConversationReference]:
+    async def remove_conversation_reference(self, conversation_id: str, reason: str = "dead"):
+        """
+        删除失效的对话引用（机器人已被移出对话，或发送返回 403/404），同时丢弃写缓冲中的待写入数据
+        """
+        try:
+            if self.write_buffer:
+                self.write_buffer.discard(conversation_id)
+            await self.redis_storage.remove_conversation_reference(conversation_id)
+            REFERENCES_REMOVED.inc(reason)
+            logger.info(f"Removed conversation reference for {conversation_id} ({reason})")
+        except Exception as e:
+            logger.error(f"Failed to remove conversation reference for {conversation_id}: {e}")
+
+    async def get_conversation_references(self) -> Dict[str, ConversationReference]:
         """
         获取所有对话引用
         """
         try:
-            return self.redis_storage.get_all_conversation_references()
+            return await self.redis_storage.get_all_conversation_references()
         except Exception as e:
             logger.error(f"Failed to get conversation references: {e}")
             return {}
 
-    def get_conversation_reference(self, conversation_id: str) -> Optional[ConversationReference]:
+    async def iter_conversation_references(self) -> AsyncIterator[List[Tuple[str, ConversationReference]]]:
+        """
+        按批次流式获取所有对话引用
+        """
+        async for batch in self.redis_storage.iter_conversation_references():
+            yield batch
+
+    async def iter_audience(self, audience) -> AsyncIterator[List[Tuple[str, ConversationReference]]]:
+        """
+        按批次流式获取受众表达式匹配的对话引用
+        """
+        async for batch in self.redis_storage.iter_audience(audience):
+            yield batch
+
+    async def get_conversation_reference(self, conversation_id: str) -> Optional[ConversationReference]:
         """
         获取特定对话引用
         """
         try:
-            return self.redis_storage.get_conversation_reference(conversation_id)
+            return await self.redis_storage.get_conversation_reference(conversation_id)
         except Exception as e:
             logger.error(f"Failed to get conversation reference for {conversation_id}: {e}")
             return None
 
-    def print_all_conversation_references(self):
+    async def get_conversation_reference_by_user(self, user_id: str,
+                                                 tenant_id: Optional[str] = None) -> Optional[ConversationReference]:
+        """
+        通过用户索引获取一对一对话引用，未命中时按对话ID查找（兼容旧的调用方式）
+        """
+        try:
+            reference = await self.redis_storage.get_conversation_reference_by_user(user_id, tenant_id)
+            if reference:
+                return reference
+            return await self.redis_storage.get_conversation_reference(user_id)
+        except Exception as e:
+            logger.error(f"Failed to get conversation reference for user {user_id}: {e}")
+            return None
+
+    async def resolve_targets(self, targets: List[dict]) -> List[Optional[Tuple[str, ConversationReference]]]:
+        """
+        批量解析发送目标（{"conversation_id": ...} 或 {"user_id": ..., "tenant_id": ...}），
+        用户索引一次 HMGET，对话引用一次 pipeline 读取；无法解析的目标返回 None
+        """
+        users = [(target["user_id"], target.get("tenant_id")) for target in targets if target.get("user_id")]
+        user_conversation_ids = iter(await self.redis_storage.find_conversation_ids_by_users(users))
+        
+        conversation_ids = []
+        for target in targets:
+            if target.get("user_id"):
+                # 用户索引未命中时按对话ID查找（兼容旧的调用方式）
+                conversation_ids.append(next(user_conversation_ids) or target["user_id"])
+            else:
+                conversation_ids.append(target.get("conversation_id"))
+        
+        references = await self.redis_storage.get_conversation_references(
+            [conversation_id for conversation_id in conversation_ids if conversation_id]
+        )
+        return [
+            (conversation_id, references[conversation_id]) if conversation_id in references else None
+            for conversation_id in conversation_ids
+        ]
+
+    async def rebuild_indexes(self) -> int:
+        """
+        重建二级索引（升级后首次运行或索引损坏时使用）
+        """
+        return await self.redis_storage.rebuild_indexes()
+
+    async def migrate_storage_layout(self) -> dict:
+        """
+        将旧的哈希结构在线迁移为紧凑编码
+        """
+        return await self.redis_storage.migrate_storage_layout()
+
+    async def print_all_conversation_references(self):
         """
         打印所有用户的 ConversationReference 记录
         """
         try:
-            references = self.redis_storage.get_all_conversation_references()
+            references = await self.redis_storage.get_all_conversation_references()
             
             if not references:
                 print("No conversation references found.")
@@ -156,22 +353,23 @@ class ProactiveBot(ActivityHandler):
         except Exception as e:
             logger.error(f"Failed to print conversation references: {e}")
 
-    def export_to_json(self, file_path: str = "conversation_references_backup.json"):
+    async def export_to_json(self, file_path: str = "conversation_references_backup.json"):
         """
-        导出对话引用到JSON文件作为备份
+        导出对话引用到文件作为备份（.json 为旧格式，其余按 NDJSON）
         """
         try:
-            self.redis_storage.export_to_json(file_path)
+            await self.redis_storage.export_to_json(file_path)
             logger.info(f"Conversation references exported to {file_path}")
         except Exception as e:
             logger.error(f"Failed to export to JSON: {e}")
+            raise
 
-    def clear_all_references(self):
+    async def clear_all_references(self):
         """
         清空所有对话引用（谨慎使用）
         """
         try:
-            self.redis_storage.clear_all_references()
+            await self.redis_storage.clear_all_references()
             logger.info("All conversation references cleared")
         except Exception as e:
             logger.error(f"Failed to clear references: {e}")
\ No newline at end of file
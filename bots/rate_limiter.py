@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import random
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional
+
+from botbuilder.schema import ConversationReference
+
+logger = logging.getLogger(__name__)
+
+
+def get_status_code(error: Exception) -> Optional[int]:
+    """从 Bot Connector 异常（ErrorResponseException 等）中取出 HTTP 状态码"""
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None) or getattr(response, "status", None)
+    return int(status) if status else None
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """解析 Retry-After 响应头（秒数或 HTTP 日期），返回需要等待的秒数"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("Retry-After") if hasattr(headers, "get") else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """自适应令牌桶：收到 429 时降速，成功发送后逐步恢复"""
+
+    def __init__(self, rate: float, capacity: float, min_rate: float):
+        self.base_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, now: float) -> float:
+        """预占一个令牌，返回需要等待的秒数（令牌可以为负，表示排队中的请求）"""
+        self._refill(now)
+        self.tokens -= 1
+        wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def penalize(self, now: float, retry_after: Optional[float]):
+        """收到 429：速率减半，并在 Retry-After 期间阻塞"""
+        self._refill(now)
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = min(self.tokens, 0.0)
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+
+    def reward(self):
+        """发送成功：速率按基础速率的 5% 线性恢复"""
+        if self.rate < self.base_rate:
+            self.rate = min(self.base_rate, self.rate + self.base_rate * 0.05)
+
+    def is_throttled(self, now: float) -> bool:
+        return self.rate < self.base_rate or self.blocked_until > now
+
+    def get_state(self, now: float) -> dict:
+        self._refill(now)
+        return {
+            "rate": round(self.rate, 3),
+            "base_rate": self.base_rate,
+            "tokens": round(self.tokens, 2),
+            "blocked_for": round(max(0.0, self.blocked_until - now), 2),
+        }
+
+
+class AdaptiveRateLimiter:
+    """出站 Bot Connector 调用限流：按对话和 service_url 分别限速，429 时按 Retry-After 退避重试"""
+
+    RETRYABLE_STATUS = (429, 502, 503, 504)
+
+    def __init__(self, conversation_rate: float = 2.0, conversation_burst: float = 7,
+                 service_url_rate: float = 50.0, service_url_burst: float = 50,
+                 max_retries: int = 5, base_backoff: float = 1.0, max_backoff: float = 60.0,
+                 max_conversation_buckets: int = 50000):
+        """
+        初始化限流器
+
+        Args:
+            conversation_rate: 每个对话每秒允许的发送数
+            conversation_burst: 每个对话的突发容量
+            service_url_rate: 每个 service_url 每秒允许的发送数
+            service_url_burst: 每个 service_url 的突发容量
+            max_retries: 429/5xx 时的最大重试次数
+            base_backoff: 没有 Retry-After 时的指数退避基数（秒）
+            max_backoff: 退避上限（秒）
+            max_conversation_buckets: 最多保留多少个对话的令牌桶（LRU淘汰）
+        """
+        self.conversation_rate = conversation_rate
+        self.conversation_burst = conversation_burst
+        self.service_url_rate = service_url_rate
+        self.service_url_burst = service_url_burst
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.max_conversation_buckets = max_conversation_buckets
+
+        self._conversation_buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._service_url_buckets: Dict[str, TokenBucket] = {}
+
+        self.throttled_responses = 0
+        self.retries = 0
+        self.gave_up = 0
+
+    def _conversation_bucket(self, conversation_id: str) -> TokenBucket:
+        bucket = self._conversation_buckets.get(conversation_id)
+        if bucket is None:
+            bucket = TokenBucket(self.conversation_rate, self.conversation_burst,
+                                 min_rate=self.conversation_rate / 16)
+            self._conversation_buckets[conversation_id] = bucket
+            if len(self._conversation_buckets) > self.max_conversation_buckets:
+                self._conversation_buckets.popitem(last=False)
+        else:
+            self._conversation_buckets.move_to_end(conversation_id)
+        return bucket
+
+    def _service_url_bucket(self, service_url: str) -> TokenBucket:
+        bucket = self._service_url_buckets.get(service_url)
+        if bucket is None:
+            bucket = TokenBucket(self.service_url_rate, self.service_url_burst,
+                                 min_rate=self.service_url_rate / 16)
+            self._service_url_buckets[service_url] = bucket
+        return bucket
+
+    def _buckets(self, reference: ConversationReference):
+        conversation_id = reference.conversation.id if reference.conversation else ""
+        return (self._conversation_bucket(conversation_id),
+                self._service_url_bucket(reference.service_url or ""))
+
+    async def acquire(self, reference: ConversationReference):
+        """等待直到对话和 service_url 两个令牌桶都允许发送"""
+        now = time.monotonic()
+        wait = max(bucket.reserve(now) for bucket in self._buckets(reference))
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        """带抖动的退避时间：有 Retry-After 时以其为下限"""
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.base_backoff)
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+
+    async def call(self, reference: ConversationReference, func: Callable[[], Awaitable]):
+        """在限流保护下执行一次出站调用，遇到 429/5xx 时自动退避重试"""
+        attempt = 0
+        while True:
+            await self.acquire(reference)
+            try:
+                result = await func()
+            except Exception as e:
+                status = get_status_code(e)
+                if status not in self.RETRYABLE_STATUS:
+                    raise
+                retry_after = get_retry_after(e)
+                if status == 429:
+                    self.throttled_responses += 1
+                    now = time.monotonic()
+                    for bucket in self._buckets(reference):
+                        bucket.penalize(now, retry_after)
+                if attempt >= self.max_retries:
+                    self.gave_up += 1
+                    raise
+                delay = self._backoff(attempt, retry_after)
+                attempt += 1
+                self.retries += 1
+                logger.warning(f"Bot Connector returned {status} for {reference.conversation.id}, "
+                               f"retry {attempt}/{self.max_retries} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            for bucket in self._buckets(reference):
+                bucket.reward()
+            return result
+
+    def get_stats(self, max_conversations: int = 100) -> dict:
+        """导出当前限流状态"""
+        now = time.monotonic()
+        throttled = {
+            conversation_id: bucket.get_state(now)
+            for conversation_id, bucket in self._conversation_buckets.items()
+            if bucket.is_throttled(now)
+        }
+        return {
+            "throttled_responses": self.throttled_responses,
+            "retries": self.retries,
+            "gave_up": self.gave_up,
+            "tracked_conversations": len(self._conversation_buckets),
+            "throttled_conversation_count": len(throttled),
+            "throttled_conversations": dict(list(throttled.items())[:max_conversations]),
+            "service_urls": {
+                service_url: bucket.get_state(now)
+                for service_url, bucket in self._service_url_buckets.items()
+            },
+        }
@@ -1,19 +1,158 @@
-import redis
-import json
+import asyncio
+import re
+import time
+import uuid
+import redis.asyncio as redis
 import logging
-from typing import Dict, Optional
+from redis.exceptions import NoScriptError
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
 from botbuilder.schema import ConversationReference, ChannelAccount, ConversationAccount
 
+from .metrics import timed_storage_operation
+from .reference_cache import ConversationReferenceCache
+from .reference_codec import ReferenceCodec
+from .reference_io import ReferenceImporter, export_to_file
+from .redis_topology import RedisTopology
+
 logger = logging.getLogger(__name__)
 
 class RedisConversationReferences:
-    """Redis存储管理类，用于存储和管理对话引用"""
+    """Redis存储管理类（asyncio），用于存储和管理对话引用"""
+    
+    # 分类集合维护：分类为 "类型\x1f渠道\x1f租户"，每个对话记录在分类哈希中，
+    # 并加入 <前缀>kind:<类型>、<前缀>channel:<渠道>、<前缀>tenant:<租户> 集合，
+    # <前缀>channels / <前缀>tenants 记录非空的渠道和租户
+    CATEGORY_LUA = """
+    local function category_sets(prefix, category)
+        local kind, channel, tenant = string.match(category, '^([^\\31]*)\\31([^\\31]*)\\31([^\\31]*)$')
+        local sets = {}
+        if kind and kind ~= '' then
+            table.insert(sets, {prefix .. 'kind:' .. kind})
+        end
+        if channel and channel ~= '' then
+            table.insert(sets, {prefix .. 'channel:' .. channel, prefix .. 'channels', channel})
+        end
+        if tenant and tenant ~= '' then
+            table.insert(sets, {prefix .. 'tenant:' .. tenant, prefix .. 'tenants', tenant})
+        end
+        return sets
+    end
+    local function unindex(prefix, conversation_id, category)
+        for _, set in ipairs(category_sets(prefix, category)) do
+            redis.call('SREM', set[1], conversation_id)
+            if set[2] and redis.call('SCARD', set[1]) == 0 then
+                redis.call('SREM', set[2], set[3])
+            end
+        end
+    end
+    local function index(prefix, conversation_id, category)
+        for _, set in ipairs(category_sets(prefix, category)) do
+            redis.call('SADD', set[1], conversation_id)
+            if set[2] then
+                redis.call('SADD', set[2], set[3])
+            end
+        end
+    end
+    """
+    
+    # 写入对话分类，分类变化时先从旧集合移除
+    # KEYS[1]=分类哈希 KEYS[2]=全部对话集合 ARGV[1]=索引前缀 ARGV[2]=conversation_id ARGV[3]=分类
+    INDEX_SCRIPT = CATEGORY_LUA + """
+    local old = redis.call('HGET', KEYS[1], ARGV[2])
+    if old == ARGV[3] then
+        return 0
+    end
+    if old then
+        unindex(ARGV[1], ARGV[2], old)
+    end
+    index(ARGV[1], ARGV[2], ARGV[3])
+    redis.call('HSET', KEYS[1], ARGV[2], ARGV[3])
+    redis.call('SADD', KEYS[2], ARGV[2])
+    return 1
+    """
+    
+    # 删除对话引用及其分类和标签，并仅移除仍指向该对话的用户索引字段
+    # 指定最后活跃时间上限时，对话在此之后有过活动（或已被删除）则不删除，返回 0
+    # KEYS[1]=用户索引键 KEYS[2]=分类哈希 KEYS[3]=全部对话集合 KEYS[4]=对话标签集合
+    # KEYS[5]=最后活跃时间有序集合 KEYS[6]=对话引用键（可选，Cluster 中与索引不在同一个槽，由调用方另行删除，此时返回 1）
+    # ARGV[1]=conversation_id ARGV[2]=索引前缀 ARGV[3]=最后活跃时间上限（空串表示无条件删除）
+    # ARGV[4..]=用户索引字段
+    REMOVE_SCRIPT = CATEGORY_LUA + """
+    if ARGV[3] ~= '' then
+        local last_seen = redis.call('ZSCORE', KEYS[5], ARGV[1])
+        if not last_seen or tonumber(last_seen) > tonumber(ARGV[3]) then
+            return 0
+        end
+    end
+    local removed = 1
+    if KEYS[6] then
+        removed = redis.call('DEL', KEYS[6])
+    end
+    for i = 4, #ARGV do
+        if redis.call('HGET', KEYS[1], ARGV[i]) == ARGV[1] then
+            redis.call('HDEL', KEYS[1], ARGV[i])
+        end
+    end
+    local old = redis.call('HGET', KEYS[2], ARGV[1])
+    if old then
+        unindex(ARGV[2], ARGV[1], old)
+        redis.call('HDEL', KEYS[2], ARGV[1])
+    end
+    redis.call('SREM', KEYS[3], ARGV[1])
+    for _, tag in ipairs(redis.call('SMEMBERS', KEYS[4])) do
+        redis.call('SREM', ARGV[2] .. 'tag:' .. tag, ARGV[1])
+        if redis.call('SCARD', ARGV[2] .. 'tag:' .. tag) == 0 then
+            redis.call('SREM', ARGV[2] .. 'tags', tag)
+        end
+    end
+    redis.call('DEL', KEYS[4])
+    redis.call('ZREM', KEYS[5], ARGV[1])
+    return removed
+    """
+    
+    # 更新仍存在的对话的最后活跃时间，返回已不存在（被删除）的对话ID
+    # KEYS[1]=最后活跃时间有序集合 ARGV[1]=当前时间 ARGV[2..]=conversation_id
+    TOUCH_SCRIPT = """
+    local missing = {}
+    for i = 2, #ARGV do
+        if redis.call('ZSCORE', KEYS[1], ARGV[i]) then
+            redis.call('ZADD', KEYS[1], ARGV[1], ARGV[i])
+        else
+            table.insert(missing, ARGV[i])
+        end
+    end
+    return missing
+    """
+    
+    # 受众表达式中的集合名称：all、personal、group、channel:<id>、tenant:<id>、tag:<name>
+    TAG_PATTERN = re.compile(r"^[A-Za-z0-9_.\-]{1,64}$")
+    AUDIENCE_OPERATORS = ("union", "intersect", "diff")
+    
+    # 在线迁移：仅当键仍为旧的哈希结构时替换为紧凑编码，避免覆盖并发写入的新数据
+    # KEYS[1]=对话引用键 ARGV[1]=紧凑编码值
+    MIGRATE_SCRIPT = """
+    if redis.call('TYPE', KEYS[1]).ok ~= 'hash' then
+        return 0
+    end
+    redis.call('DEL', KEYS[1])
+    redis.call('SET', KEYS[1], ARGV[1])
+    return 1
+    """
     
     def __init__(self, redis_host: str = "localhost", redis_port: int = 6379, 
                  redis_db: int = 0, redis_password: Optional[str] = None,
-                 key_prefix: str = "bot_conv_ref:"):
+                 key_prefix: str = "bot_conv_ref:", index_prefix: str = "bot_conv_idx:",
+                 max_connections: int = 50,
+                 scan_count: int = 1000, batch_size: int = 500,
+                 compact_format: bool = True,
+                 cache_max_entries: int = 10000, cache_ttl: float = 300.0,
+                 topology: Optional[RedisTopology] = None):
         """
-        初始化Redis连接
+        初始化Redis连接池（不会立即连接，需在事件循环中调用 connect）
+        
+        Cluster 模式下对话引用键为 <key_prefix>{conversation_id}，按对话分散到各分片；
+        二级索引键的前缀加上哈希标签（如 {bot_conv_idx}:），全部索引位于同一个槽，
+        Lua 脚本和 MULTI 中的多键操作仍然是原子的
         
         Args:
             redis_host: Redis服务器地址
@@ -21,95 +160,884 @@ class RedisConversationReferences:
             redis_db: Redis数据库编号
             redis_password: Redis密码（可选）
             key_prefix: Redis键前缀
+            index_prefix: 二级索引键前缀（不能与 key_prefix 重叠，否则会被 SCAN 匹配）
+            max_connections: 连接池最大连接数
+            scan_count: SCAN 每次迭代的 COUNT 提示值
+            batch_size: 批量读取时每个 pipeline 包含的键数量
+            compact_format: 为True时以紧凑编码写入，否则沿用旧的哈希结构（读取始终兼容两种格式）
+            cache_max_entries: 进程内对话引用缓存的最大条目数，<= 0 时不启用缓存
+            cache_ttl: 进程内缓存有效期（秒）
+            topology: Sentinel / Cluster 等部署拓扑，为空时按 redis_host 等参数连接单机 Redis
         """
-        self.redis_client = redis.Redis(
+        self.topology = topology or RedisTopology(
             host=redis_host,
             port=redis_port,
             db=redis_db,
             password=redis_password,
-            decode_responses=True,
-            socket_connect_timeout=5,
-            socket_timeout=5,
-            retry_on_timeout=True
+            max_connections=max_connections
         )
+        # 写入和读后写使用主节点，对话引用的读取和批量加载使用 read_client（可能是副本）
+        self.redis_client = self.topology.client
+        self.read_client = self.topology.read_client
+        self.hash_tags = self.topology.cluster
+        if self.hash_tags:
+            index_prefix = f"{self.topology.hash_tag(index_prefix.rstrip(':'))}:"
         self.key_prefix = key_prefix
-        
-        # 测试连接
+        self.index_prefix = index_prefix
+        self.user_index_key = f"{index_prefix}user"
+        self.category_key = f"{index_prefix}category"
+        self.all_key = f"{index_prefix}all"
+        self.last_seen_key = f"{index_prefix}last_seen"
+        self._index_script = self.redis_client.register_script(self.INDEX_SCRIPT)
+        self._remove_script = self.redis_client.register_script(self.REMOVE_SCRIPT)
+        self._touch_script = self.redis_client.register_script(self.TOUCH_SCRIPT)
+        self._migrate_script = self.redis_client.register_script(self.MIGRATE_SCRIPT)
+        self.codec = ReferenceCodec(self.redis_client, index_prefix)
+        self.compact_format = compact_format
+        self.cache = None
+        if cache_max_entries > 0:
+            self.cache = ConversationReferenceCache(
+                self.redis_client, f"{index_prefix}invalidate",
+                max_entries=cache_max_entries, ttl=cache_ttl
+            )
+        self.scan_count = scan_count
+        self.batch_size = batch_size
+    
+    async def connect(self):
+        """测试Redis连接"""
         try:
-            self.redis_client.ping()
-            logger.info("Redis connection established successfully")
+            await self.redis_client.ping()
+            await self._load_scripts()
+            logger.info(f"Redis connection established successfully ({self.topology.mode})")
+            if self.cache:
+                self.cache.start()
         except redis.ConnectionError as e:
             logger.error(f"Failed to connect to Redis: {e}")
             raise
     
+    async def close(self):
+        """关闭Redis连接池"""
+        if self.cache:
+            await self.cache.close()
+        await self.topology.close()
+        logger.info("Redis connection pool closed")
+    
+    async def _load_scripts(self):
+        """加载 pipeline 中使用的 Lua 脚本（Cluster 故障切换后的新主节点可能没有脚本缓存）"""
+        await self.topology.load_scripts([self._index_script, self._remove_script, self._migrate_script])
+    
+    async def _execute(self, pipe, **kwargs) -> list:
+        """执行包含 Lua 脚本的 pipeline，NOSCRIPT 时重新加载脚本后抛出，由调用方重试"""
+        try:
+            return await pipe.execute(**kwargs)
+        except NoScriptError:
+            await self._load_scripts()
+            raise
+    
     def _get_key(self, conversation_id: str) -> str:
-        """生成Redis键名"""
+        """生成Redis键名（Cluster 中对话ID作为哈希标签）"""
+        if self.hash_tags:
+            return f"{self.key_prefix}{{{conversation_id}}}"
         return f"{self.key_prefix}{conversation_id}"
     
-    def add_conversation_reference(self, conversation_id: str, reference: ConversationReference):
-        """添加或更新对话引用"""
+    def _conversation_id(self, key: str) -> str:
+        """从Redis键名还原对话ID"""
+        conversation_id = key[len(self.key_prefix):]
+        if self.hash_tags:
+            return conversation_id[1:-1]
+        return conversation_id
+    
+    @staticmethod
+    def _user_index_fields(user_id: str, aad_object_id: str = "", tenant_id: str = "") -> List[str]:
+        """生成用户索引字段：user_id、aad:<AAD对象ID>，以及带租户前缀的版本"""
+        fields = []
+        if user_id:
+            fields.append(user_id)
+        if aad_object_id:
+            fields.append(f"aad:{aad_object_id}")
+        if tenant_id:
+            fields.extend(f"{tenant_id}:{field}" for field in list(fields))
+        return fields
+    
+    @staticmethod
+    def _is_personal(serialized_ref: dict) -> bool:
+        """判断是否为一对一对话"""
+        conversation_type = serialized_ref.get("conversation_type")
+        if conversation_type:
+            return conversation_type == "personal"
+        return serialized_ref.get("conversation_is_group") != "true"
+    
+    async def _queue_add(self, pipe, conversation_id: str, serialized_ref: dict):
+        """在 pipeline 中写入对话引用及其索引（紧凑编码需先调用 codec.prepare）"""
+        key = self._get_key(conversation_id)
+        if self.compact_format:
+            pipe.set(key, self.codec.encode(conversation_id, serialized_ref))
+        else:
+            pipe.delete(key)
+            pipe.hset(key, mapping=serialized_ref)
+        await self._queue_indexes(pipe, conversation_id, serialized_ref)
+    
+    def _category(self, serialized_ref: dict) -> str:
+        """对话分类：personal/group、渠道、租户"""
+        kind = "personal" if self._is_personal(serialized_ref) else "group"
+        return "\x1f".join([
+            kind,
+            serialized_ref.get("channel_id") or "",
+            serialized_ref.get("tenant_id") or "",
+        ])
+    
+    async def _queue_indexes(self, pipe, conversation_id: str, serialized_ref: dict, touch: bool = True):
+        """
+        在 pipeline 中维护二级索引：分类集合（计数用）、最后活跃时间，一对一对话写入用户索引
+        
+        Args:
+            touch: 为True时把最后活跃时间更新为当前时间，否则只为缺失的对话补上当前时间
+        """
+        pipe.zadd(self.last_seen_key, {conversation_id: time.time()}, nx=not touch)
+        await self._index_script(
+            keys=[self.category_key, self.all_key],
+            args=[self.index_prefix, conversation_id, self._category(serialized_ref)],
+            client=pipe,
+        )
+        if self._is_personal(serialized_ref):
+            fields = self._user_index_fields(
+                serialized_ref.get("user_id"),
+                serialized_ref.get("user_aad_object_id"),
+                serialized_ref.get("tenant_id"),
+            )
+            if fields:
+                pipe.hset(self.user_index_key, mapping={field: conversation_id for field in fields})
+    
+    @timed_storage_operation
+    async def add_conversation_reference(self, conversation_id: str, reference: ConversationReference):
+        """添加或更新对话引用（引用与用户索引在同一个 MULTI 中原子写入，Cluster 中二者不在同一个槽，按顺序写入）"""
         try:
-            key = self._get_key(conversation_id)
             serialized_ref = self._serialize_conversation_reference(reference)
-            self.redis_client.hset(key, mapping=serialized_ref)
+            if self.compact_format:
+                await self.codec.prepare([serialized_ref])
+            pipe = self.redis_client.pipeline(transaction=not self.hash_tags)
+            await self._queue_add(pipe, conversation_id, serialized_ref)
+            if self.cache:
+                self.cache.publish(pipe, [conversation_id])
+            await self._execute(pipe)
             logger.debug(f"Added conversation reference for {conversation_id}")
         except Exception as e:
             logger.error(f"Failed to add conversation reference: {e} {conversation_id}")
             raise
     
-    def get_conversation_reference(self, conversation_id: str) -> Optional[ConversationReference]:
-        """获取对话引用"""
+    @timed_storage_operation
+    async def add_serialized_references(self, serialized_refs: Dict[str, dict]):
+        """批量写入已序列化的对话引用（一个 MULTI pipeline，Cluster 中为普通 pipeline）"""
+        if not serialized_refs:
+            return
         try:
-            key = self._get_key(conversation_id)
-            data = self.redis_client.hgetall(key)
-            if not data:
-                return None
-            
-            return self._deserialize_conversation_reference(data)
+            if self.compact_format:
+                await self.codec.prepare(serialized_refs.values())
+            pipe = self.redis_client.pipeline(transaction=not self.hash_tags)
+            for conversation_id, serialized_ref in serialized_refs.items():
+                await self._queue_add(pipe, conversation_id, serialized_ref)
+            if self.cache:
+                self.cache.publish(pipe, list(serialized_refs))
+            await self._execute(pipe)
+            logger.debug(f"Added {len(serialized_refs)} conversation references")
+        except Exception as e:
+            logger.error(f"Failed to add {len(serialized_refs)} conversation references: {e}")
+            raise
+    
+    @timed_storage_operation
+    async def get_conversation_reference(self, conversation_id: str) -> Optional[ConversationReference]:
+        """获取对话引用（启用缓存时先查进程内缓存）"""
+        try:
+            return (await self.get_conversation_references([conversation_id])).get(conversation_id)
         except Exception as e:
             logger.error(f"Failed to get conversation reference: {e}")
             return None
     
-    def get_all_conversation_references(self) -> Dict[str, ConversationReference]:
-        """获取所有对话引用"""
+    @timed_storage_operation
+    async def get_conversation_references(self, conversation_ids: List[str]) -> Dict[str, ConversationReference]:
+        """
+        通过一个 pipeline 批量获取多个对话引用，不存在的对话不会出现在结果中
+        
+        未启用缓存时从 read_client（可能是副本）读取；启用缓存时未命中的对话从主节点读取，
+        避免把复制延迟期间的旧数据写入缓存后一直使用到过期
+        """
+        if not conversation_ids:
+            return {}
+        conversation_ids = list(dict.fromkeys(conversation_ids))
+        if not self.cache:
+            return dict(await self._load_batch([self._get_key(cid) for cid in conversation_ids]))
+        
+        references = {}
+        missing = []
+        for conversation_id in conversation_ids:
+            reference = self.cache.get(conversation_id)
+            if reference is None:
+                missing.append(conversation_id)
+            else:
+                references[conversation_id] = reference
+        if missing:
+            version = self.cache.version
+            for conversation_id, reference in await self._load_batch([self._get_key(cid) for cid in missing],
+                                                                     client=self.redis_client):
+                self.cache.put(conversation_id, reference, version)
+                references[conversation_id] = reference
+        return references
+    
+    async def warm_up(self, limit: int) -> Dict[str, ConversationReference]:
+        """加载最近活跃的 limit 个对话引用（启用缓存时写入进程内缓存，最多缓存容量个），返回加载结果"""
+        if self.cache:
+            limit = min(limit, self.cache.max_entries)
+            if not await self.cache.wait_until_subscribed():
+                logger.warning("Cache invalidation channel is not subscribed, warm-up will not fill the cache")
+        conversation_ids = await self.redis_client.zrevrange(self.last_seen_key, 0, limit - 1)
+        references = {}
+        for start in range(0, len(conversation_ids), self.batch_size):
+            references.update(await self.get_conversation_references(conversation_ids[start:start + self.batch_size]))
+        return references
+    
+    @staticmethod
+    def _user_lookup_fields(user_id: str, tenant_id: Optional[str] = None) -> List[str]:
+        """生成查找用户时依次尝试的索引字段"""
+        fields = [user_id, f"aad:{user_id}"]
+        if tenant_id:
+            fields = [f"{tenant_id}:{field}" for field in fields]
+        return fields
+    
+    @timed_storage_operation
+    async def find_conversation_id_by_user(self, user_id: str, tenant_id: Optional[str] = None) -> Optional[str]:
+        """通过用户索引查找一对一对话ID，user_id 可以是 Teams 用户ID或 AAD 对象ID"""
+        for conversation_id in await self.redis_client.hmget(self.user_index_key,
+                                                             self._user_lookup_fields(user_id, tenant_id)):
+            if conversation_id:
+                return conversation_id
+        return None
+    
+    @timed_storage_operation
+    async def find_conversation_ids_by_users(self, users: List[Tuple[str, Optional[str]]]) -> List[Optional[str]]:
+        """批量查找多个用户的一对一对话ID（一次 HMGET），users 为 (user_id, tenant_id) 列表"""
+        if not users:
+            return []
+        fields = [self._user_lookup_fields(user_id, tenant_id) for user_id, tenant_id in users]
+        values = await self.redis_client.hmget(self.user_index_key, [f for group in fields for f in group])
+        
+        results = []
+        offset = 0
+        for group in fields:
+            matches = [value for value in values[offset:offset + len(group)] if value]
+            results.append(matches[0] if matches else None)
+            offset += len(group)
+        return results
+    
+    async def get_conversation_reference_by_user(self, user_id: str,
+                                                 tenant_id: Optional[str] = None) -> Optional[ConversationReference]:
+        """通过用户ID获取一对一对话引用"""
         try:
-            pattern = f"{self.key_prefix}*"
-            keys = self.redis_client.keys(pattern)
-            references = {}
+            conversation_id = await self.find_conversation_id_by_user(user_id, tenant_id)
+        except Exception as e:
+            logger.error(f"Failed to look up user index for {user_id}: {e}")
+            return None
+        if not conversation_id:
+            return None
+        return await self.get_conversation_reference(conversation_id)
+    
+    @timed_storage_operation
+    async def rebuild_indexes(self) -> int:
+        """根据已存储的对话引用重建二级索引和分类计数，返回处理的对话数量（重建期间计数会暂时偏小）"""
+        await self.redis_client.delete(*await self._category_keys())
+        indexed = 0
+        async for keys in self._scan_keys(client=self.redis_client):
+            results = await self._load_serialized(keys, client=self.redis_client)
             
-            for key in keys:
-                conversation_id = key.replace(self.key_prefix, "")
-                data = self.redis_client.hgetall(key)
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key, data in zip(keys, results):
                 if data:
-                    references[conversation_id] = self._deserialize_conversation_reference(data)
+                    await self._queue_indexes(pipe, self._conversation_id(key), data, touch=False)
+                    indexed += 1
+            await self._execute(pipe)
+        logger.info(f"Rebuilt indexes for {indexed} conversation references")
+        return indexed
+    
+    async def get_all_conversation_references(self) -> Dict[str, ConversationReference]:
+        """获取所有对话引用"""
+        try:
+            references = {}
+            async for batch in self.iter_conversation_references():
+                references.update(batch)
             
             return references
         except Exception as e:
             logger.error(f"Failed to get all conversation references: {e}")
             return {}
     
-    def remove_conversation_reference(self, conversation_id: str):
+    async def _scan_keys(self, scan_count: Optional[int] = None, client=None) -> AsyncIterator[List[str]]:
+        """
+        使用 SCAN 按批次遍历所有对话引用键，避免 KEYS 阻塞Redis（Cluster 中逐个分片 SCAN）
+        
+        Args:
+            client: 执行 SCAN 的客户端，默认 read_client；遍历后要写入的操作应传入主节点客户端
+        """
+        batch_size = self.batch_size
+        batch = []
+        async for key in self.topology.scan_iter(client or self.read_client, f"{self.key_prefix}*",
+                                                 scan_count or self.scan_count):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    
+    async def _load_serialized(self, keys: List[str], client=None) -> List[Optional[dict]]:
+        """
+        批量读取多个键的序列化字典，同时兼容紧凑编码与旧的哈希结构：
+        先用一个 pipeline GET 全部键，返回 WRONGTYPE 的键再用一个 pipeline HGETALL
+        
+        Args:
+            client: 读取使用的客户端，默认 read_client（启用副本读取时为副本）
+        """
+        client = client or self.read_client
+        pipe = client.pipeline(transaction=False)
+        for key in keys:
+            pipe.get(key)
+        values = await pipe.execute(raise_on_error=False)
+        
+        results: List[Optional[dict]] = [None] * len(keys)
+        compact = []
+        legacy = []
+        for position, (key, value) in enumerate(zip(keys, values)):
+            if isinstance(value, redis.ResponseError):
+                legacy.append(position)
+            elif isinstance(value, Exception):
+                logger.error(f"Failed to read conversation reference {key}: {value}")
+            elif self.codec.is_compact(value):
+                compact.append((position, self._conversation_id(key), value))
+        
+        if compact:
+            decoded = await self.codec.decode_many([(cid, value) for _, cid, value in compact])
+            for (position, _, _), data in zip(compact, decoded):
+                results[position] = data
+        
+        if legacy:
+            pipe = client.pipeline(transaction=False)
+            for position in legacy:
+                pipe.hgetall(keys[position])
+            for position, data in zip(legacy, await pipe.execute()):
+                results[position] = data or None
+        return results
+    
+    @timed_storage_operation
+    async def _load_batch(self, keys: List[str], client=None) -> List[Tuple[str, ConversationReference]]:
+        """通过 pipeline 批量读取多个键并反序列化（默认从 read_client 读取）"""
+        loaded = []
+        for key, data in zip(keys, await self._load_serialized(keys, client)):
+            if data:
+                loaded.append((self._conversation_id(key), self._deserialize_conversation_reference(data)))
+        return loaded
+    
+    async def iter_conversation_references(
+        self, scan_count: Optional[int] = None, unique: bool = True
+    ) -> AsyncIterator[List[Tuple[str, ConversationReference]]]:
+        """
+        流式读取所有对话引用，每次产出一批 (conversation_id, reference)
+        
+        Args:
+            scan_count: 覆盖默认的 SCAN COUNT
+            unique: SCAN 在rehash期间可能返回重复键，为True时过滤重复
+        """
+        seen = set() if unique else None
+        async for keys in self._scan_keys(scan_count):
+            if seen is not None:
+                keys = [key for key in keys if key not in seen]
+                seen.update(keys)
+                if not keys:
+                    continue
+            batch = await self._load_batch(keys)
+            if batch:
+                yield batch
+    
+    @timed_storage_operation
+    async def page_conversation_references(
+        self, cursor: Optional[str] = None, limit: int = 100,
+        is_group: Optional[bool] = None, channel_id: Optional[str] = None,
+        user_name_prefix: Optional[str] = None,
+        last_seen_min: Optional[float] = None, last_seen_max: Optional[float] = None,
+        max_scan: Optional[int] = None,
+    ) -> Tuple[List[Tuple[str, ConversationReference, Optional[float]]], Optional[str]]:
+        """
+        按游标分页读取对话引用，内存占用只与页大小有关
+        
+        未指定最后活跃时间范围时用 SSCAN 遍历最窄的索引集合（类型或渠道），游标为 "s:<SSCAN游标>"，
+        此时一页可能略多于 limit（同一次 SSCAN 返回的成员不能拆分）；
+        指定时间范围时按最后活跃时间升序遍历有序集合，游标为 "z:<分数>:<同分数已返回数量>"。
+        其余过滤条件在读取后应用，因此一页可能少于 limit，直到 next_cursor 为 None 才表示结束。
+        
+        Args:
+            cursor: 上一页返回的 next_cursor，None 表示第一页（过滤条件需与第一页一致）
+            limit: 每页数量
+            is_group / channel_id / user_name_prefix: 过滤条件（user_name 前缀不区分大小写）
+            last_seen_min / last_seen_max: 最后活跃时间范围（Unix时间戳，闭区间）
+            max_scan: 单页最多检查的对话数量，默认 limit 的 10 倍，避免过滤条件很少命中时一页耗时过长
+        
+        Returns:
+            ([(conversation_id, reference, last_seen)], next_cursor)
+        """
+        max_scan = max_scan or limit * 10
+        name_prefix = user_name_prefix.lower() if user_name_prefix else None
+        
+        def matches(reference: ConversationReference) -> bool:
+            conversation = reference.conversation
+            if is_group is not None and bool(conversation and conversation.is_group) != is_group:
+                return False
+            if channel_id and reference.channel_id != channel_id:
+                return False
+            if name_prefix and not ((reference.user and reference.user.name) or "").lower().startswith(name_prefix):
+                return False
+            return True
+        
+        items = []
+        scanned = 0
+        if last_seen_min is None and last_seen_max is None:
+            if channel_id:
+                key = f"{self.index_prefix}channel:{channel_id}"
+            elif is_group is not None:
+                key = f"{self.index_prefix}kind:{'group' if is_group else 'personal'}"
+            else:
+                key = self.all_key
+            position = int(cursor[2:]) if cursor and cursor.startswith("s:") else 0
+            while True:
+                position, members = await self.redis_client.sscan(key, position, count=limit)
+                scanned += len(members)
+                if members:
+                    loaded = await self._load_batch([self._get_key(member) for member in members])
+                    items.extend((cid, ref) for cid, ref in loaded if matches(ref))
+                if position == 0 or len(items) >= limit or scanned >= max_scan:
+                    break
+            next_cursor = f"s:{position}" if position else None
+            
+            # 补充最后活跃时间
+            if items:
+                pipe = self.redis_client.pipeline(transaction=False)
+                for conversation_id, _ in items:
+                    pipe.zscore(self.last_seen_key, conversation_id)
+                scores = await pipe.execute()
+            else:
+                scores = []
+            return [(cid, ref, score) for (cid, ref), score in zip(items, scores)], next_cursor
+        
+        score_min = last_seen_min if last_seen_min is not None else float("-inf")
+        score_max = last_seen_max if last_seen_max is not None else float("inf")
+        skip = 0
+        if cursor and cursor.startswith("z:"):
+            _, score_text, skip_text = cursor.split(":", 2)
+            score_min, skip = float(score_text), int(skip_text)
+        
+        next_cursor = None
+        while len(items) < limit and scanned < max_scan:
+            members = await self.redis_client.zrangebyscore(
+                self.last_seen_key, score_min, score_max, start=skip, num=limit, withscores=True
+            )
+            if not members:
+                next_cursor = None
+                break
+            scanned += len(members)
+            # 新游标：最后一个分数，以及该分数下已返回的成员数量
+            last_score = members[-1][1]
+            tied = sum(1 for _, score in members if score == last_score)
+            skip = skip + tied if last_score == score_min else tied
+            score_min = last_score
+            next_cursor = f"z:{last_score!r}:{skip}"
+            
+            scores = dict(members)
+            loaded = await self._load_batch([self._get_key(member) for member, _ in members])
+            items.extend((cid, ref, scores[cid]) for cid, ref in loaded if matches(ref))
+            if len(members) < limit:
+                next_cursor = None
+                break
+        return items, next_cursor
+    
+    @timed_storage_operation
+    async def count_conversation_references(self) -> int:
+        """统计对话引用数量（SCARD，O(1)）"""
+        return await self.redis_client.scard(self.all_key)
+    
+    @timed_storage_operation
+    async def get_reference_counts(self) -> dict:
+        """按类型、渠道、租户统计对话引用数量，只读取维护好的分类集合，不遍历键空间"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.scard(self.all_key)
+        pipe.scard(f"{self.index_prefix}kind:personal")
+        pipe.scard(f"{self.index_prefix}kind:group")
+        pipe.smembers(f"{self.index_prefix}channels")
+        pipe.smembers(f"{self.index_prefix}tenants")
+        total, personal, group, channels, tenants = await pipe.execute()
+        
+        channels = sorted(channels)
+        tenants = sorted(tenants)
+        pipe = self.redis_client.pipeline(transaction=False)
+        for channel in channels:
+            pipe.scard(f"{self.index_prefix}channel:{channel}")
+        for tenant in tenants:
+            pipe.scard(f"{self.index_prefix}tenant:{tenant}")
+        sizes = await pipe.execute() if channels or tenants else []
+        return {
+            "total": total,
+            "personal": personal,
+            "group": group,
+            "by_channel": dict(zip(channels, sizes[:len(channels)])),
+            "by_tenant": dict(zip(tenants, sizes[len(channels):])),
+        }
+    
+    async def _category_keys(self) -> List[str]:
+        """分类计数相关的全部键"""
+        channels, tenants = await asyncio.gather(
+            self.redis_client.smembers(f"{self.index_prefix}channels"),
+            self.redis_client.smembers(f"{self.index_prefix}tenants"),
+        )
+        return [
+            self.category_key,
+            self.all_key,
+            f"{self.index_prefix}kind:personal",
+            f"{self.index_prefix}kind:group",
+            f"{self.index_prefix}channels",
+            f"{self.index_prefix}tenants",
+            *(f"{self.index_prefix}channel:{channel}" for channel in channels),
+            *(f"{self.index_prefix}tenant:{tenant}" for tenant in tenants),
+        ]
+    
+    @timed_storage_operation
+    async def remove_conversation_reference(self, conversation_id: str):
         """删除对话引用"""
         try:
-            key = self._get_key(conversation_id)
-            self.redis_client.delete(key)
+            await self.remove_conversation_references([conversation_id])
             logger.debug(f"Removed conversation reference for {conversation_id}")
         except Exception as e:
             logger.error(f"Failed to remove conversation reference: {e}")
             raise
     
-    def clear_all_references(self):
+    @timed_storage_operation
+    async def remove_conversation_references(self, conversation_ids: List[str],
+                                             idle_before: Optional[float] = None) -> List[str]:
+        """
+        批量删除对话引用（一个 pipeline）
+        
+        Args:
+            conversation_ids: 要删除的对话ID
+            idle_before: 只删除最后活跃时间不晚于该时间（Unix时间戳）的对话，删除前有新活动的对话会被跳过
+        
+        Returns:
+            实际删除的对话ID
+        """
+        if not conversation_ids:
+            return []
+        keys = [self._get_key(conversation_id) for conversation_id in conversation_ids]
+        pipe = self.redis_client.pipeline(transaction=False)
+        loaded = await self._load_serialized(keys, client=self.redis_client)
+        for conversation_id, key, data in zip(conversation_ids, keys, loaded):
+            data = data or {}
+            fields = self._user_index_fields(
+                data.get("user_id"), data.get("user_aad_object_id"), data.get("tenant_id")
+            )
+            script_keys = [self.user_index_key, self.category_key, self.all_key,
+                           self._conversation_tags_key(conversation_id), self.last_seen_key]
+            if not self.hash_tags:
+                script_keys.append(key)
+            await self._remove_script(
+                keys=script_keys,
+                args=[conversation_id, self.index_prefix, "" if idle_before is None else idle_before, *fields],
+                client=pipe,
+            )
+        results = await self._execute(pipe)
+        if self.hash_tags:
+            # 对话引用键与索引不在同一个槽：索引移除成功（满足最后活跃时间条件）后再删除引用键
+            confirmed = [index for index, result in enumerate(results) if result]
+            deleted = await self._unlink([keys[index] for index in confirmed])
+            results = [0] * len(keys)
+            for index, result in zip(confirmed, deleted):
+                results[index] = result
+        removed = [conversation_id for conversation_id, result in zip(conversation_ids, results) if result]
+        if self.cache:
+            pipe = self.redis_client.pipeline(transaction=False)
+            self.cache.publish(pipe, list(conversation_ids))
+            await pipe.execute()
+        return removed
+    
+    @timed_storage_operation
+    async def touch_conversation_references(self, conversation_ids: List[str]) -> List[str]:
+        """把对话的最后活跃时间更新为当前时间，返回已不存在（过期或被删除）的对话ID"""
+        missing = []
+        now = time.time()
+        for start in range(0, len(conversation_ids), self.batch_size):
+            missing.extend(await self._touch_script(
+                keys=[self.last_seen_key], args=[now, *conversation_ids[start:start + self.batch_size]]
+            ))
+        return missing
+    
+    @timed_storage_operation
+    async def expire_idle_references(self, max_idle: float) -> int:
+        """删除最后活跃时间早于 max_idle 秒之前的对话引用，返回删除数量"""
+        idle_before = time.time() - max_idle
+        removed = 0
+        while True:
+            conversation_ids = await self.redis_client.zrangebyscore(
+                self.last_seen_key, "-inf", idle_before, start=0, num=self.batch_size
+            )
+            if not conversation_ids:
+                break
+            removed += len(await self.remove_conversation_references(conversation_ids, idle_before=idle_before))
+            if len(conversation_ids) < self.batch_size:
+                break
+        if removed:
+            logger.info(f"Expired {removed} conversation references idle for more than {max_idle:.0f}s")
+        return removed
+    
+    @timed_storage_operation
+    async def clear_all_references(self):
         """清空所有对话引用"""
         try:
-            pattern = f"{self.key_prefix}*"
-            keys = self.redis_client.keys(pattern)
-            if keys:
-                self.redis_client.delete(*keys)
+            async for keys in self._scan_keys(client=self.redis_client):
+                await self._unlink(keys)
+            # 驻留字典表保留：其他实例可能缓存了ID，删除后重新分配会导致解码错误
+            await self._unlink([self.user_index_key, self.last_seen_key, *await self._category_keys(),
+                                *await self._tag_keys()])
+            if self.cache:
+                pipe = self.redis_client.pipeline(transaction=False)
+                self.cache.publish_clear(pipe)
+                await pipe.execute()
             logger.info("Cleared all conversation references")
         except Exception as e:
             logger.error(f"Failed to clear all references: {e}")
             raise
     
+    async def _unlink(self, keys: List[str]) -> List[int]:
+        """
+        逐键 UNLINK（按批次放入 pipeline），返回每个键的删除结果；
+        Cluster 中多键 DEL 要求所有键位于同一个槽，逐键删除对任意键布局都适用
+        """
+        results = []
+        for start in range(0, len(keys), self.batch_size):
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key in keys[start:start + self.batch_size]:
+                pipe.unlink(key)
+            results.extend(await pipe.execute())
+        return results
+    
+    def _conversation_tags_key(self, conversation_id: str) -> str:
+        """记录对话所属标签的集合（删除对话时据此移除标签）"""
+        return f"{self.index_prefix}conv_tags:{conversation_id}"
+    
+    def _tag_key(self, tag: str) -> str:
+        return f"{self.index_prefix}tag:{tag}"
+    
+    async def _tag_keys(self) -> List[str]:
+        """标签相关的全部键"""
+        keys = [f"{self.index_prefix}tags"]
+        keys.extend(self._tag_key(tag) for tag in await self.redis_client.smembers(f"{self.index_prefix}tags"))
+        async for key in self.topology.scan_iter(self.redis_client, self._conversation_tags_key("*"), self.scan_count):
+            keys.append(key)
+        return keys
+    
+    def _validate_tags(self, tags: List[str]) -> List[str]:
+        invalid = [tag for tag in tags if not isinstance(tag, str) or not self.TAG_PATTERN.match(tag)]
+        if invalid:
+            raise ValueError(f"Invalid tag names: {invalid}")
+        return list(dict.fromkeys(tags))
+    
+    @timed_storage_operation
+    async def add_tags(self, conversation_ids: List[str], tags: List[str]) -> Tuple[List[str], List[str]]:
+        """
+        给对话添加标签（一个 MULTI），只处理已存储的对话
+        
+        Returns:
+            (已添加标签的对话ID, 不存在的对话ID)
+        """
+        tags = self._validate_tags(tags)
+        conversation_ids = list(dict.fromkeys(conversation_ids))
+        if not tags or not conversation_ids:
+            return [], conversation_ids
+        
+        pipe = self.redis_client.pipeline(transaction=False)
+        for conversation_id in conversation_ids:
+            pipe.sismember(self.all_key, conversation_id)
+        exists = await pipe.execute()
+        found = [cid for cid, present in zip(conversation_ids, exists) if present]
+        missing = [cid for cid, present in zip(conversation_ids, exists) if not present]
+        
+        if found:
+            pipe = self.redis_client.pipeline(transaction=True)
+            for tag in tags:
+                pipe.sadd(self._tag_key(tag), *found)
+            for conversation_id in found:
+                pipe.sadd(self._conversation_tags_key(conversation_id), *tags)
+            pipe.sadd(f"{self.index_prefix}tags", *tags)
+            await pipe.execute()
+        return found, missing
+    
+    @timed_storage_operation
+    async def remove_tags(self, conversation_ids: List[str], tags: List[str]):
+        """移除对话的标签，标签不再有成员时从标签列表中删除"""
+        tags = self._validate_tags(tags)
+        conversation_ids = list(dict.fromkeys(conversation_ids))
+        if not tags or not conversation_ids:
+            return
+        pipe = self.redis_client.pipeline(transaction=True)
+        for tag in tags:
+            pipe.srem(self._tag_key(tag), *conversation_ids)
+        for conversation_id in conversation_ids:
+            pipe.srem(self._conversation_tags_key(conversation_id), *tags)
+        for tag in tags:
+            pipe.scard(self._tag_key(tag))
+        sizes = (await pipe.execute())[-len(tags):]
+        empty = [tag for tag, size in zip(tags, sizes) if not size]
+        if empty:
+            await self.redis_client.srem(f"{self.index_prefix}tags", *empty)
+    
+    async def get_tags(self, conversation_id: str) -> List[str]:
+        """获取对话的标签"""
+        return sorted(await self.redis_client.smembers(self._conversation_tags_key(conversation_id)))
+    
+    @timed_storage_operation
+    async def list_tags(self) -> Dict[str, int]:
+        """列出所有标签及其对话数量"""
+        tags = sorted(await self.redis_client.smembers(f"{self.index_prefix}tags"))
+        if not tags:
+            return {}
+        pipe = self.redis_client.pipeline(transaction=False)
+        for tag in tags:
+            pipe.scard(self._tag_key(tag))
+        return dict(zip(tags, await pipe.execute()))
+    
+    def _audience_set_key(self, name: str) -> str:
+        """受众表达式中的集合名称转换为Redis键"""
+        if name == "all":
+            return self.all_key
+        if name in ("personal", "group"):
+            return f"{self.index_prefix}kind:{name}"
+        kind, _, value = name.partition(":")
+        if kind in ("channel", "tenant") and value:
+            return f"{self.index_prefix}{kind}:{value}"
+        if kind == "tag" and self.TAG_PATTERN.match(value):
+            return self._tag_key(value)
+        raise ValueError(f"Unknown audience set: {name!r}")
+    
+    def _parse_audience_operator(self, expression) -> Tuple[str, list]:
+        if not isinstance(expression, dict) or len(expression) != 1:
+            raise ValueError("Audience must be a set name or an object with one of: union, intersect, diff")
+        operator, operands = next(iter(expression.items()))
+        if operator not in self.AUDIENCE_OPERATORS or not isinstance(operands, list) or not operands:
+            raise ValueError(f"Invalid audience operator {operator!r}, expected a non-empty list for "
+                             f"one of {self.AUDIENCE_OPERATORS}")
+        return operator, operands
+    
+    def validate_audience(self, expression):
+        """校验受众表达式（不访问Redis），无效时抛出 ValueError"""
+        if isinstance(expression, str):
+            self._audience_set_key(expression)
+            return
+        for operand in self._parse_audience_operator(expression)[1]:
+            self.validate_audience(operand)
+    
+    async def _evaluate_audience(self, expression, temp_keys: List[str], ttl: int) -> str:
+        """递归求值受众表达式，复合表达式的结果写入临时键，返回结果集合的键"""
+        if isinstance(expression, str):
+            return self._audience_set_key(expression)
+        operator, operands = self._parse_audience_operator(expression)
+        
+        keys = [await self._evaluate_audience(operand, temp_keys, ttl) for operand in operands]
+        destination = f"{self.index_prefix}tmp:{uuid.uuid4().hex}"
+        temp_keys.append(destination)
+        pipe = self.redis_client.pipeline(transaction=True)
+        if operator == "union":
+            pipe.sunionstore(destination, keys)
+        elif operator == "intersect":
+            pipe.sinterstore(destination, keys)
+        else:
+            pipe.sdiffstore(destination, keys)
+        pipe.expire(destination, ttl)
+        await pipe.execute()
+        return destination
+    
+    @timed_storage_operation
+    async def count_audience(self, expression) -> int:
+        """计算受众表达式的对话数量"""
+        temp_keys = []
+        try:
+            return await self.redis_client.scard(await self._evaluate_audience(expression, temp_keys, 60))
+        finally:
+            if temp_keys:
+                await self.redis_client.delete(*temp_keys)
+    
+    async def iter_audience(self, expression, ttl: int = 3600) -> AsyncIterator[List[Tuple[str, ConversationReference]]]:
+        """
+        流式读取受众表达式匹配的对话引用，每次产出一批 (conversation_id, reference)
+        
+        表达式为集合名称（all、personal、group、channel:<id>、tenant:<id>、tag:<name>），
+        或 {"union" | "intersect" | "diff": [表达式, ...]}，在Redis中用 SUNIONSTORE/SINTERSTORE/SDIFFSTORE 求值，
+        结果通过 SSCAN 分批读取，开销与受众规模成正比
+        
+        Args:
+            expression: 受众表达式
+            ttl: 临时结果集合的过期时间（秒），进程异常退出时由Redis清理
+        """
+        temp_keys = []
+        try:
+            key = await self._evaluate_audience(expression, temp_keys, ttl)
+            seen = set()
+            batch = []
+            async for conversation_id in self.redis_client.sscan_iter(key, count=self.scan_count):
+                if conversation_id in seen:
+                    continue
+                seen.add(conversation_id)
+                batch.append(self._get_key(conversation_id))
+                if len(batch) >= self.batch_size:
+                    loaded = await self._load_batch(batch)
+                    batch = []
+                    if loaded:
+                        yield loaded
+            if batch:
+                loaded = await self._load_batch(batch)
+                if loaded:
+                    yield loaded
+        finally:
+            if temp_keys:
+                await self.redis_client.delete(*temp_keys)
+    
+    @timed_storage_operation
+    async def migrate_storage_layout(self) -> dict:
+        """
+        在线将旧的哈希结构迁移为紧凑编码，可在服务运行期间重复执行
+        
+        Returns:
+            {"scanned": 扫描的键数量, "migrated": 实际转换的键数量}
+        """
+        scanned = 0
+        migrated = 0
+        async for keys in self._scan_keys(client=self.redis_client):
+            scanned += len(keys)
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key in keys:
+                pipe.type(key)
+            hash_keys = [key for key, key_type in zip(keys, await pipe.execute()) if key_type == "hash"]
+            if not hash_keys:
+                continue
+            
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key in hash_keys:
+                pipe.hgetall(key)
+            serialized = {self._conversation_id(key): data
+                          for key, data in zip(hash_keys, await pipe.execute()) if data}
+            await self.codec.prepare(serialized.values())
+            
+            pipe = self.redis_client.pipeline(transaction=False)
+            for conversation_id, data in serialized.items():
+                await self._migrate_script(
+                    keys=[self._get_key(conversation_id)],
+                    args=[self.codec.encode(conversation_id, data)],
+                    client=pipe,
+                )
+            migrated += sum(await self._execute(pipe))
+        logger.info(f"Migrated {migrated} of {scanned} conversation references to compact encoding")
+        return {"scanned": scanned, "migrated": migrated}
+    
     def _serialize_conversation_reference(self, reference: ConversationReference) -> dict:
         """序列化对话引用为字典，安全处理None值"""
         def safe_str(value):
@@ -133,6 +1061,9 @@ class RedisConversationReferences:
                 "service_url": safe_str(reference.service_url),
                 "user_id": safe_str(reference.user.id if reference.user else None),
                 "user_name": safe_str(reference.user.name if reference.user else None),
+                "user_aad_object_id": safe_str(reference.user.aad_object_id if reference.user else None),
+                "conversation_type": safe_str(reference.conversation.conversation_type if reference.conversation else None),
+                "tenant_id": safe_str(reference.conversation.tenant_id if reference.conversation else None),
             }
         except Exception as e:
             logger.error(f"Failed to serialize conversation reference: {e}")
@@ -147,6 +1078,9 @@ class RedisConversationReferences:
                 "service_url": "",
                 "user_id": "",
                 "user_name": "",
+                "user_aad_object_id": "",
+                "conversation_type": "",
+                "tenant_id": "",
             }
 
     
@@ -159,12 +1093,15 @@ class RedisConversationReferences:
         
         conversation = ConversationAccount(
             id=data.get("conversation_id", ""),
-            is_group=data.get("conversation_is_group", "").lower() == "true" if data.get("conversation_is_group") else None
+            is_group=data.get("conversation_is_group", "").lower() == "true" if data.get("conversation_is_group") else None,
+            conversation_type=data.get("conversation_type") or None,
+            tenant_id=data.get("tenant_id") or None
         )
         
         user = ChannelAccount(
             id=data.get("user_id", ""),
-            name=data.get("user_name", "")
+            name=data.get("user_name", ""),
+            aad_object_id=data.get("user_aad_object_id") or None
         )
         
         return ConversationReference(
@@ -176,70 +1113,53 @@ class RedisConversationReferences:
             user=user
         )
     
-    def migrate_from_json(self, json_file_path: str):
-        """从JSON文件迁移数据到Redis"""
+    @timed_storage_operation
+    async def migrate_from_json(self, json_file_path: str, batch_size: Optional[int] = None,
+                                resume: bool = True, on_progress: Optional[Callable[[dict], None]] = None) -> dict:
+        """
+        从导出文件流式导入数据到Redis（.json 为旧格式，其余按 NDJSON），支持从检查点继续
+        
+        Returns:
+            导入进度统计，文件不存在时返回空字典
+        """
         try:
-            with open(json_file_path, 'r', encoding='utf-8') as file:
-                data = json.load(file)
-            
-            for conversation_id, reference_data in data.items():
-                # 重构引用数据
-                print(169, conversation_id)
-                reference = ConversationReference(
-                    activity_id=reference_data.get("activity_id"),
-                    bot=ChannelAccount(**reference_data.get("bot", {})),
-                    channel_id=reference_data.get("channel_id"),
-                    conversation=ConversationAccount(**reference_data.get("conversation", {})),
-                    service_url=reference_data.get("service_url"),
-                    user=ChannelAccount(**reference_data.get("user", {}))
-                )
-                print(17000000, conversation_id, reference.user)
-                self.add_conversation_reference(conversation_id, reference)
-                print()
-            
-            logger.info(f"Successfully migrated {len(data)} conversation references from JSON to Redis")
-            
+            importer = ReferenceImporter(self, batch_size=batch_size or self.batch_size, on_progress=on_progress)
+            progress = await importer.run(json_file_path, resume=resume)
+            logger.info(f"Successfully migrated {progress['imported']} conversation references from "
+                        f"{json_file_path} to Redis")
+            return progress
         except FileNotFoundError:
             logger.warning(f"JSON file {json_file_path} not found, skipping migration")
+            return {}
         except Exception as e:
             logger.error(f"Failed to migrate from JSON: {e}")
             raise
     
-    def export_to_json(self, json_file_path: str):
-        """导出Redis数据到JSON文件"""
+    @timed_storage_operation
+    async def export_to_json(self, json_file_path: str, fmt: Optional[str] = None) -> int:
+        """流式导出Redis数据到文件（.json 为旧格式，其余按 NDJSON），返回导出数量"""
         try:
-            references = self.get_all_conversation_references()
-            export_data = {}
-            
-            for conversation_id, reference in references.items():
-                export_data[conversation_id] = {
-                    "activity_id": reference.activity_id,
-                    "bot": reference.bot.__dict__ if reference.bot else {},
-                    "channel_id": reference.channel_id,
-                    "conversation": reference.conversation.__dict__ if reference.conversation else {},
-                    "service_url": reference.service_url,
-                    "user": reference.user.__dict__ if reference.user else {}
-                }
-            
-            with open(json_file_path, 'w', encoding='utf-8') as file:
-                json.dump(export_data, file, indent=4, ensure_ascii=False)
-            
-            logger.info(f"Successfully exported {len(export_data)} conversation references to JSON")
-            
+            count = await export_to_file(self, json_file_path, fmt)
+            logger.info(f"Successfully exported {count} conversation references to {json_file_path}")
+            return count
         except Exception as e:
             logger.error(f"Failed to export to JSON: {e}")
             raise
     
-    def get_connection_info(self) -> dict:
+    @timed_storage_operation
+    async def get_connection_info(self) -> dict:
         """获取Redis连接信息"""
         try:
-            info = self.redis_client.info()
-            print(237, info)
+            info = await self.topology.info()
             return {
+                "redis_mode": self.topology.mode,
+                "read_from_replicas": self.read_client is not self.redis_client,
                 "redis_version": info.get("redis_version"),
                 "connected_clients": info.get("connected_clients"),
                 "used_memory_human": info.get("used_memory_human"),
-                "total_keys": len(self.redis_client.keys(f"{self.key_prefix}*"))
+                "storage_format": "compact" if self.compact_format else "hash",
+                "total_keys": await self.count_conversation_references(),
+                "references": await self.get_reference_counts()
             }
         except Exception as e:
             logger.error(f"Failed to get Redis info: {e}")
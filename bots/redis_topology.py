@@ -0,0 +1,158 @@
+import logging
+from typing import AsyncIterator, List, Optional, Tuple
+
+import redis.asyncio as redis
+from redis.asyncio.cluster import ClusterNode, RedisCluster
+from redis.asyncio.sentinel import Sentinel
+from redis.cluster import LoadBalancingStrategy
+
+logger = logging.getLogger(__name__)
+
+MODES = ("standalone", "sentinel", "cluster")
+
+
+def parse_addresses(addresses: str, default_port: int = 6379) -> List[Tuple[str, int]]:
+    """解析 "host:port,host:port" 形式的地址列表，省略端口时使用 default_port"""
+    result = []
+    for address in (addresses or "").split(","):
+        address = address.strip()
+        if not address:
+            continue
+        host, separator, port = address.rpartition(":")
+        if not separator:
+            host, port = address, ""
+        result.append((host.strip("[]"), int(port) if port else default_port))
+    return result
+
+
+class RedisTopology:
+    """
+    按部署模式创建 Redis 客户端
+
+    - standalone：单个 Redis 实例
+    - sentinel：通过 Sentinel 发现主节点，故障切换后自动连接新的主节点
+    - cluster：Redis Cluster，多键操作（Lua 脚本、MULTI、SUNIONSTORE 等）要求所有键位于同一个槽，
+      调用方需使用哈希标签（键名中的 {...}）安排键布局
+
+    client 只连接主节点，用于写入和需要读到最新数据的读取；read_client 在启用副本读取时
+    从副本读取（Sentinel 的 slave_for、Cluster 的副本负载均衡），否则与 client 相同。
+    副本读取存在复制延迟，刚写入的数据可能暂时读不到。
+    """
+
+    def __init__(self, mode: str = "standalone", host: str = "localhost", port: int = 6379, db: int = 0,
+                 password: Optional[str] = None, sentinels: Optional[List[Tuple[str, int]]] = None,
+                 sentinel_master: str = "mymaster", sentinel_password: Optional[str] = None,
+                 cluster_nodes: Optional[List[Tuple[str, int]]] = None,
+                 read_from_replicas: bool = False, max_connections: int = 50):
+        """
+        初始化客户端（不会立即连接）
+
+        Args:
+            mode: 部署模式，standalone / sentinel / cluster
+            host / port / db / password: 单机模式的连接参数（db 和 password 也用于 Sentinel 管理的主从节点，
+                Cluster 只支持 db 0）
+            sentinels: Sentinel 地址列表 [(host, port)]
+            sentinel_master: Sentinel 中的主节点名称
+            sentinel_password: 连接 Sentinel 本身的密码（可选）
+            cluster_nodes: Cluster 启动节点列表 [(host, port)]，为空时使用 host:port
+            read_from_replicas: 为True时批量读取和对话引用读取从副本读取
+            max_connections: 每个连接池（Cluster 为每个节点）的最大连接数
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown Redis mode {mode!r}, expected one of {MODES}")
+        self.mode = mode
+        self.read_from_replicas = read_from_replicas
+        self.connection_pool = None
+        self.sentinel = None
+        connection_kwargs = dict(
+            password=password,
+            decode_responses=True,
+            socket_connect_timeout=5,
+            socket_timeout=5,
+        )
+
+        if mode == "standalone":
+            self.connection_pool = redis.ConnectionPool(
+                host=host, port=port, db=db, max_connections=max_connections, retry_on_timeout=True,
+                **connection_kwargs
+            )
+            self.client = redis.Redis(connection_pool=self.connection_pool)
+            self.read_client = self.client
+            if read_from_replicas:
+                logger.warning("Replica reads need Sentinel or Cluster mode, reading from the primary")
+        elif mode == "sentinel":
+            if not sentinels:
+                raise ValueError("Sentinel mode requires at least one sentinel address")
+            self.sentinel = Sentinel(
+                sentinels,
+                sentinel_kwargs={"password": sentinel_password, "socket_connect_timeout": 5, "socket_timeout": 5},
+            )
+            self.client = self.sentinel.master_for(
+                sentinel_master, db=db, max_connections=max_connections, retry_on_timeout=True, **connection_kwargs
+            )
+            # 没有可用副本时 slave_for 会回退到主节点
+            self.read_client = self.sentinel.slave_for(
+                sentinel_master, db=db, max_connections=max_connections, retry_on_timeout=True, **connection_kwargs
+            ) if read_from_replicas else self.client
+        else:
+            startup_nodes = [ClusterNode(node_host, node_port)
+                             for node_host, node_port in cluster_nodes or [(host, port)]]
+            self.client = RedisCluster(
+                startup_nodes=startup_nodes, max_connections=max_connections, **connection_kwargs
+            )
+            self.read_client = RedisCluster(
+                startup_nodes=startup_nodes, max_connections=max_connections,
+                load_balancing_strategy=LoadBalancingStrategy.ROUND_ROBIN_REPLICAS, **connection_kwargs
+            ) if read_from_replicas else self.client
+
+    @property
+    def cluster(self) -> bool:
+        return self.mode == "cluster"
+
+    def hash_tag(self, name: str) -> str:
+        """Cluster 中给键名加上哈希标签，使 name 与以它为前缀派生的键（如 "<name>:jobs"）位于同一个槽"""
+        return f"{{{name}}}" if self.cluster else name
+
+    def _scan_nodes(self, client) -> List[ClusterNode]:
+        """Cluster 中每个分片选一个节点：副本读取时优先选副本，否则选主节点"""
+        shards = {}
+        for nodes in client.nodes_manager.slots_cache.values():
+            shards.setdefault(nodes[0].name, nodes)
+        replicas = client is not self.client
+        return [nodes[-1] if replicas else nodes[0] for nodes in shards.values()]
+
+    async def scan_iter(self, client, match: str, count: int) -> AsyncIterator[str]:
+        """
+        SCAN 遍历匹配的键；Cluster 中逐个分片执行 SCAN（各分片的键空间互不重叠）
+        """
+        if not self.cluster:
+            async for key in client.scan_iter(match=match, count=count):
+                yield key
+            return
+        # 分片信息在第一次命令时加载，已初始化时不会重复加载
+        await client.initialize()
+        for node in self._scan_nodes(client):
+            async for key in client.scan_iter(match=match, count=count, target_nodes=node):
+                yield key
+
+    async def load_scripts(self, scripts: list):
+        """
+        把 Lua 脚本加载到所有主节点：Cluster 的 pipeline 不会在 NOSCRIPT 时自动重新加载脚本，
+        单机和 Sentinel 模式下加载一次也无害
+        """
+        for script in scripts:
+            await self.client.script_load(script.script)
+
+    async def info(self) -> dict:
+        """服务器信息（Cluster 取默认节点）"""
+        if self.cluster:
+            return await self.client.info(target_nodes=self.client.get_default_node())
+        return await self.client.info()
+
+    async def close(self):
+        """关闭所有客户端和连接池"""
+        if self.read_client is not self.client:
+            await self.read_client.aclose()
+        await self.client.aclose()
+        if self.connection_pool is not None:
+            await self.connection_pool.disconnect()
@@ -0,0 +1,171 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from botbuilder.schema import ConversationReference
+
+logger = logging.getLogger(__name__)
+
+# 清空全部缓存的失效消息
+INVALIDATE_ALL = "*"
+
+
+class ConversationReferenceCache:
+    """
+    对话引用的进程内读穿缓存（LRU + TTL）
+
+    写入方在修改对话引用的同一个 MULTI 中向 pub/sub 频道发布失效消息，
+    每个实例订阅该频道并删除本地条目，从而在多个副本之间保持一致。
+    缓存的 ConversationReference 对象在调用方之间共享，调用方不能修改它们。
+    """
+
+    def __init__(self, redis_client, channel: str, max_entries: int = 10000, ttl: float = 300.0,
+                 reconnect_delay: float = 1.0):
+        """
+        初始化缓存
+
+        Args:
+            redis_client: redis.asyncio 客户端
+            channel: 失效消息的 pub/sub 频道
+            max_entries: 最多缓存的对话引用数量
+            ttl: 缓存有效期（秒），订阅中断时作为一致性的兜底
+            reconnect_delay: 订阅断开后重新订阅前的等待时间（秒）
+        """
+        self.redis_client = redis_client
+        self.channel = channel
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.reconnect_delay = reconnect_delay
+        self._cache: "OrderedDict[str, Tuple[float, ConversationReference]]" = OrderedDict()
+        # 每次失效递增，读穿加载期间发生失效时丢弃加载结果，避免缓存旧数据
+        self._version = 0
+        self._task: Optional[asyncio.Task] = None
+        self._subscribed = asyncio.Event()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    async def wait_until_subscribed(self, timeout: float = 5.0) -> bool:
+        """等待失效频道订阅成功（订阅前不会写入缓存），超时返回 False"""
+        try:
+            await asyncio.wait_for(self._subscribed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def get(self, conversation_id: str) -> Optional[ConversationReference]:
+        """读取缓存，未命中或已过期时返回 None"""
+        entry = self._cache.get(conversation_id)
+        if entry is not None:
+            expires_at, reference = entry
+            if expires_at > time.monotonic():
+                self._cache.move_to_end(conversation_id)
+                self.hits += 1
+                return reference
+            del self._cache[conversation_id]
+        self.misses += 1
+        return None
+
+    def put(self, conversation_id: str, reference: ConversationReference, version: int):
+        """写入缓存；version 为加载前读取的 self.version，期间发生过失效则放弃写入"""
+        if version != self._version or not self._subscribed.is_set():
+            return
+        self._cache[conversation_id] = (time.monotonic() + self.ttl, reference)
+        self._cache.move_to_end(conversation_id)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, conversation_ids: Iterable[str]):
+        """删除本地条目"""
+        self._version += 1
+        for conversation_id in conversation_ids:
+            if self._cache.pop(conversation_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        self._version += 1
+        self.invalidations += len(self._cache)
+        self._cache.clear()
+
+    def publish(self, pipe, conversation_ids: List[str]):
+        """在写入的 pipeline 中追加失效消息，并立即失效本地条目"""
+        pipe.publish(self.channel, json.dumps(conversation_ids))
+        self.invalidate(conversation_ids)
+
+    def publish_clear(self, pipe):
+        """在 pipeline 中追加清空全部缓存的消息"""
+        pipe.publish(self.channel, INVALIDATE_ALL)
+        self.clear()
+
+    def _handle_message(self, data: str):
+        if data == INVALIDATE_ALL:
+            self.clear()
+            return
+        try:
+            self.invalidate(json.loads(data))
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Ignoring malformed cache invalidation message: {e}")
+            self.clear()
+
+    async def _listen(self):
+        """订阅失效频道；订阅中断期间可能错过消息，因此不写入缓存并在恢复时清空"""
+        while True:
+            pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                self.clear()
+                self._subscribed.set()
+                logger.info(f"Subscribed to cache invalidation channel {self.channel}")
+                while True:
+                    message = await pubsub.get_message(timeout=1.0)
+                    if message and message.get("type") == "message":
+                        self._handle_message(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Cache invalidation subscription failed: {e}")
+            finally:
+                self._subscribed.clear()
+                self.clear()
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+            await asyncio.sleep(self.reconnect_delay)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.clear()
+
+    def get_stats(self) -> Dict[str, object]:
+        """获取缓存统计信息"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._cache),
+            "subscribed": self._subscribed.is_set(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_ratio": round(self.hits / total, 4) if total else None,
+        }
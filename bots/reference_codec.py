@@ -0,0 +1,170 @@
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ReferenceCodec:
+    """
+    对话引用的紧凑编码（版本化，单个字符串值）
+
+    格式：MAGIC + 版本号 + SEPARATOR + 按 FIELDS 顺序以 SEPARATOR 连接的字段值
+      - 低基数字段（service_url、bot_id、channel_id 等）驻留为Redis字典表中的短ID
+      - conversation_id 与键名相同时存为空串，读取时由键名补全
+      - Redis客户端使用 decode_responses，因此编码保持为文本而不是二进制
+    """
+
+    MAGIC = "\x01"
+    VERSION = "1"
+    SEPARATOR = "\x1f"
+
+    # 版本 1 的字段顺序，只能在末尾追加字段；调整顺序必须升级版本号
+    FIELDS = (
+        "activity_id",
+        "bot_id",
+        "bot_name",
+        "channel_id",
+        "conversation_id",
+        "conversation_is_group",
+        "service_url",
+        "user_id",
+        "user_name",
+        "user_aad_object_id",
+        "conversation_type",
+        "tenant_id",
+    )
+
+    # 驻留到字典表的低基数字段
+    INTERNED_FIELDS = frozenset({
+        "bot_id",
+        "bot_name",
+        "channel_id",
+        "service_url",
+        "conversation_type",
+        "tenant_id",
+    })
+
+    # 原子分配驻留ID：已存在则返回现有ID
+    # KEYS[1]=值->ID 哈希 KEYS[2]=ID->值 哈希 KEYS[3]=ID计数器 ARGV[1]=值
+    INTERN_SCRIPT = """
+    local id = redis.call('HGET', KEYS[1], ARGV[1])
+    if id then
+        return id
+    end
+    id = tostring(redis.call('INCR', KEYS[3]))
+    redis.call('HSET', KEYS[1], ARGV[1], id)
+    redis.call('HSET', KEYS[2], id, ARGV[1])
+    return id
+    """
+
+    def __init__(self, redis_client, index_prefix: str = "bot_conv_idx:"):
+        """
+        Args:
+            redis_client: redis.asyncio 客户端（decode_responses=True）
+            index_prefix: 字典表键前缀，与二级索引共用
+        """
+        self.redis_client = redis_client
+        self.intern_key = f"{index_prefix}intern"
+        self.intern_reverse_key = f"{index_prefix}intern_rev"
+        self.intern_sequence_key = f"{index_prefix}intern_seq"
+        self._intern_script = redis_client.register_script(self.INTERN_SCRIPT)
+        self._ids: Dict[str, str] = {}
+        self._values: Dict[str, str] = {}
+        self._prefix = self.MAGIC + self.VERSION + self.SEPARATOR
+        self._interned_positions = [i for i, field in enumerate(self.FIELDS) if field in self.INTERNED_FIELDS]
+
+    @classmethod
+    def is_compact(cls, value) -> bool:
+        """判断存储值是否为紧凑编码"""
+        return isinstance(value, str) and value.startswith(cls.MAGIC)
+
+    async def prepare(self, serialized_refs: Iterable[dict]):
+        """为即将编码的引用分配驻留ID（编码前必须调用，encode 本身是同步的）"""
+        missing = {
+            serialized_ref.get(field) or ""
+            for serialized_ref in serialized_refs
+            for field in self.INTERNED_FIELDS
+        }
+        missing = [value for value in missing if value and value not in self._ids]
+        if not missing:
+            return
+
+        ids = await self.redis_client.hmget(self.intern_key, missing)
+        for value, intern_id in zip(missing, ids):
+            if intern_id is None:
+                intern_id = await self._intern_script(
+                    keys=[self.intern_key, self.intern_reverse_key, self.intern_sequence_key],
+                    args=[value],
+                )
+            self._remember(value, str(intern_id))
+
+    def _remember(self, value: str, intern_id: str):
+        self._ids[value] = intern_id
+        self._values[intern_id] = value
+
+    def encode(self, conversation_id: str, serialized_ref: dict) -> str:
+        """将序列化字典编码为单个字符串"""
+        values = []
+        for field in self.FIELDS:
+            value = serialized_ref.get(field) or ""
+            if field == "conversation_id" and value == conversation_id:
+                value = ""
+            elif value and field in self.INTERNED_FIELDS:
+                value = self._ids[value]
+            elif self.SEPARATOR in value:
+                value = value.replace(self.SEPARATOR, " ")
+            values.append(value)
+        return self._prefix + self.SEPARATOR.join(values)
+
+    def _split(self, value: str) -> List[str]:
+        """拆分编码值为字段列表"""
+        version, _, body = value[len(self.MAGIC):].partition(self.SEPARATOR)
+        if version != self.VERSION:
+            raise ValueError(f"Unsupported conversation reference encoding version: {version!r}")
+        tokens = body.split(self.SEPARATOR)
+        # 旧版本写入的记录字段较少时补齐
+        tokens.extend([""] * (len(self.FIELDS) - len(tokens)))
+        return tokens
+
+    async def decode_many(self, items: List[Tuple[str, str]]) -> List[Optional[dict]]:
+        """
+        批量解码 (conversation_id, 编码值)，未知的驻留ID通过一次 HMGET 加载
+        无法解码的记录返回 None
+        """
+        parsed = []
+        unknown = set()
+        for conversation_id, value in items:
+            try:
+                tokens = self._split(value)
+            except ValueError as e:
+                logger.error(f"Failed to decode conversation reference {conversation_id}: {e}")
+                parsed.append(None)
+                continue
+            for position in self._interned_positions:
+                if tokens[position] and tokens[position] not in self._values:
+                    unknown.add(tokens[position])
+            parsed.append(tokens)
+
+        if unknown:
+            unknown = list(unknown)
+            for intern_id, value in zip(unknown, await self.redis_client.hmget(self.intern_reverse_key, unknown)):
+                if value is not None:
+                    self._remember(value, intern_id)
+
+        results = []
+        for (conversation_id, _), tokens in zip(items, parsed):
+            if tokens is None:
+                results.append(None)
+                continue
+            for position in self._interned_positions:
+                if tokens[position]:
+                    tokens[position] = self._values.get(tokens[position], "")
+            data = dict(zip(self.FIELDS, tokens))
+            if not data["conversation_id"]:
+                data["conversation_id"] = conversation_id
+            results.append(data)
+        return results
+
+    def get_stats(self) -> dict:
+        """获取驻留字典缓存统计"""
+        return {"interned_values": len(self._ids)}
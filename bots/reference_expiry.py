@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import uuid
+from typing import Optional
+
+from .metrics import REFERENCES_REMOVED
+from .rate_limiter import get_status_code
+
+logger = logging.getLogger(__name__)
+
+# 说明机器人已不在对话中（被移出团队/群聊、对话已删除、用户卸载了应用）的状态码
+DEAD_CONVERSATION_STATUS = frozenset({403, 404})
+
+
+def is_dead_conversation_error(error: Exception) -> bool:
+    """判断发送失败是否说明对话引用已失效（BotNotInConversationRoster、403、404）"""
+    if "BotNotInConversationRoster" in str(error):
+        return True
+    return get_status_code(error) in DEAD_CONVERSATION_STATUS
+
+
+class ReferenceSweeper:
+    """
+    后台清理长期不活跃的对话引用
+
+    每个周期按最后活跃时间删除超过 max_idle 的对话引用；多个 worker 或副本通过
+    Redis 锁保证同一周期只有一个实例执行清理。
+    """
+
+    def __init__(self, storage, max_idle: float, interval: float = 3600.0):
+        """
+        初始化清理任务
+
+        Args:
+            storage: RedisConversationReferences
+            max_idle: 对话最后活跃后保留的时间（秒）
+            interval: 清理周期（秒）
+        """
+        self.storage = storage
+        self.max_idle = max_idle
+        self.interval = interval
+        self.lock_key = f"{storage.index_prefix}sweep_lock"
+        self._token = uuid.uuid4().hex
+        self._task: Optional[asyncio.Task] = None
+
+        self.runs = 0
+        self.expired = 0
+        self.errors = 0
+
+    def start(self):
+        """启动后台清理任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def sweep(self) -> int:
+        """执行一次清理，返回删除数量"""
+        removed = await self.storage.expire_idle_references(self.max_idle)
+        self.runs += 1
+        self.expired += removed
+        if removed:
+            REFERENCES_REMOVED.inc("idle", amount=removed)
+        return removed
+
+    async def _run(self):
+        """清理循环：锁的有效期等于清理周期，获取失败说明本周期已由其他实例执行"""
+        while True:
+            try:
+                if await self.storage.redis_client.set(self.lock_key, self._token, nx=True,
+                                                       ex=max(1, int(self.interval))):
+                    await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Failed to expire idle conversation references: {e}")
+            await asyncio.sleep(self.interval)
+
+    def get_stats(self) -> dict:
+        """获取清理统计信息"""
+        return {
+            "max_idle_seconds": self.max_idle,
+            "runs": self.runs,
+            "expired": self.expired,
+            "errors": self.errors,
+        }
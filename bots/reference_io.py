@@ -0,0 +1,314 @@
+import json
+import logging
+import os
+import time
+from typing import AsyncIterator, Callable, Iterator, Optional, TextIO, Tuple
+
+from botbuilder.schema import ChannelAccount, ConversationAccount, ConversationReference
+
+logger = logging.getLogger(__name__)
+
+# 导出格式：每行一个对话引用的 NDJSON，以及兼容旧版 migrate_from_json 的单个 JSON 对象
+FORMAT_NDJSON = "ndjson"
+FORMAT_JSON = "json"
+
+
+def detect_format(path: str) -> str:
+    """按扩展名判断文件格式：.json 为旧的单对象格式，其余按 NDJSON 处理"""
+    return FORMAT_JSON if path.lower().endswith(".json") else FORMAT_NDJSON
+
+
+def reference_to_dict(reference: ConversationReference) -> dict:
+    """对话引用转换为导出格式（与旧版 export_to_json 相同的结构）"""
+    return {
+        "activity_id": reference.activity_id,
+        "bot": reference.bot.__dict__ if reference.bot else {},
+        "channel_id": reference.channel_id,
+        "conversation": reference.conversation.__dict__ if reference.conversation else {},
+        "service_url": reference.service_url,
+        "user": reference.user.__dict__ if reference.user else {}
+    }
+
+
+def _model_kwargs(data: Optional[dict]) -> dict:
+    """导出内容来自模型的 __dict__，去掉 additional_properties 以免构造模型时告警"""
+    return {key: value for key, value in (data or {}).items() if key != "additional_properties"}
+
+
+def reference_from_dict(data: dict) -> ConversationReference:
+    """从导出格式重建对话引用"""
+    return ConversationReference(
+        activity_id=data.get("activity_id"),
+        bot=ChannelAccount(**_model_kwargs(data.get("bot"))),
+        channel_id=data.get("channel_id"),
+        conversation=ConversationAccount(**_model_kwargs(data.get("conversation"))),
+        service_url=data.get("service_url"),
+        user=ChannelAccount(**_model_kwargs(data.get("user")))
+    )
+
+
+async def iter_export_chunks(storage, fmt: str = FORMAT_NDJSON,
+                             stats: Optional[dict] = None) -> AsyncIterator[str]:
+    """
+    按 SCAN 批次流式生成导出内容，每批产出一段文本，内存占用与总量无关
+
+    Args:
+        storage: RedisConversationReferences
+        fmt: FORMAT_NDJSON 或 FORMAT_JSON
+        stats: 可选，导出过程中累加 stats["count"]
+    """
+    first = True
+    if fmt == FORMAT_JSON:
+        yield "{"
+    async for batch in storage.iter_conversation_references():
+        lines = []
+        for conversation_id, reference in batch:
+            record = reference_to_dict(reference)
+            if fmt == FORMAT_JSON:
+                prefix = "\n    " if first else ",\n    "
+                lines.append(f"{prefix}{json.dumps(conversation_id, ensure_ascii=False)}: "
+                             f"{json.dumps(record, ensure_ascii=False)}")
+            else:
+                lines.append(json.dumps({"conversation_id": conversation_id, **record}, ensure_ascii=False) + "\n")
+            first = False
+        if stats is not None:
+            stats["count"] = stats.get("count", 0) + len(batch)
+        yield "".join(lines)
+    if fmt == FORMAT_JSON:
+        yield "\n}\n"
+
+
+async def export_to_file(storage, path: str, fmt: Optional[str] = None) -> int:
+    """流式导出到文件（先写临时文件再替换，避免留下不完整的导出），返回导出数量"""
+    fmt = fmt or detect_format(path)
+    stats = {"count": 0}
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        async for chunk in iter_export_chunks(storage, fmt, stats):
+            file.write(chunk)
+    os.replace(temp_path, path)
+    return stats["count"]
+
+
+def iter_json_object_items(file: TextIO, chunk_size: int = 64 * 1024) -> Iterator[Tuple[str, object]]:
+    """
+    增量解析顶层为对象的 JSON 文件，逐个产出 (键, 值)，不把整个文件读入内存
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = file.read(chunk_size)
+        if not chunk:
+            eof = True
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            fill()
+
+    def expect(chars: str) -> str:
+        nonlocal pos
+        skip_whitespace()
+        if pos >= len(buffer):
+            raise ValueError("Unexpected end of JSON file")
+        char = buffer[pos]
+        if char not in chars:
+            raise ValueError(f"Expected one of {chars!r} but found {char!r}")
+        pos += 1
+        return char
+
+    def read_value():
+        nonlocal pos
+        skip_whitespace()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                if eof:
+                    raise
+                fill()
+                continue
+            # 数字可能在块边界被截断，未到文件末尾时读入更多内容再解析
+            if end == len(buffer) and not eof:
+                fill()
+                continue
+            pos = end
+            return value
+
+    expect("{")
+    skip_whitespace()
+    if buffer[pos:pos + 1] == "}":
+        return
+    while True:
+        key = read_value()
+        expect(":")
+        yield key, read_value()
+        if expect(",}") == "}":
+            return
+
+
+class ReferenceImporter:
+    """
+    流式导入对话引用：逐条解析，按批通过 pipeline 写入，每批提交后保存检查点，中断后可从检查点继续
+    """
+
+    def __init__(self, storage, batch_size: int = 500, progress_interval: int = 10000,
+                 on_progress: Optional[Callable[[dict], None]] = None):
+        """
+        初始化导入器
+
+        Args:
+            storage: RedisConversationReferences
+            batch_size: 每个 pipeline 写入的对话引用数量
+            progress_interval: 每导入多少条记录输出一次进度日志
+            on_progress: 每批提交后的回调，参数为当前进度
+        """
+        self.storage = storage
+        self.batch_size = batch_size
+        self.progress_interval = progress_interval
+        self.on_progress = on_progress
+        self.progress = {}
+
+    @staticmethod
+    def checkpoint_path(path: str) -> str:
+        return f"{path}.checkpoint"
+
+    def _load_checkpoint(self, path: str) -> dict:
+        try:
+            with open(self.checkpoint_path(path), "r", encoding="utf-8") as file:
+                checkpoint = json.load(file)
+        except FileNotFoundError:
+            return {}
+        if checkpoint.get("size") != os.path.getsize(path):
+            logger.warning(f"Ignoring checkpoint for {path}: file changed since the checkpoint was written")
+            return {}
+        return checkpoint
+
+    def _save_checkpoint(self, path: str):
+        temp_path = f"{self.checkpoint_path(path)}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(self.progress, file)
+        os.replace(temp_path, self.checkpoint_path(path))
+
+    def _iter_ndjson(self, file, offset: int) -> Iterator[Tuple[str, dict, int]]:
+        """逐行解析 NDJSON，产出 (conversation_id, 记录, 该行结束处的字节偏移)"""
+        file.seek(offset)
+        line_number = 0
+        for line in iter(file.readline, b""):
+            line_number += 1
+            offset += len(line)
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                logger.warning(f"Skipping malformed line {line_number} after offset {offset}: {e}")
+                continue
+            yield record.pop("conversation_id", None), record, offset
+
+    def _iter_json(self, file, skip: int) -> Iterator[Tuple[str, dict, Optional[int]]]:
+        """增量解析旧的单对象 JSON 文件，跳过检查点之前已导入的 skip 条记录"""
+        for index, (conversation_id, record) in enumerate(iter_json_object_items(file)):
+            if index >= skip:
+                yield conversation_id, record, None
+
+    async def run(self, path: str, resume: bool = True) -> dict:
+        """
+        导入文件（.json 为旧格式，其余按 NDJSON），完成后删除检查点
+
+        Args:
+            path: 导入文件路径
+            resume: 是否从检查点继续
+
+        Returns:
+            进度统计：records（已处理记录数）、imported、skipped、bytes、total_bytes
+        """
+        fmt = detect_format(path)
+        checkpoint = self._load_checkpoint(path) if resume else {}
+        total_bytes = os.path.getsize(path)
+        self.progress = {
+            "path": path,
+            "size": total_bytes,
+            "records": checkpoint.get("records", 0),
+            "imported": checkpoint.get("imported", 0),
+            "skipped": checkpoint.get("skipped", 0),
+            "offset": checkpoint.get("offset", 0),
+            "done": False,
+        }
+        if checkpoint:
+            logger.info(f"Resuming import of {path} after {self.progress['records']} records")
+
+        started = time.monotonic()
+        next_report = self.progress["records"] + self.progress_interval
+        if fmt == FORMAT_JSON:
+            file = open(path, "r", encoding="utf-8")
+            records = self._iter_json(file, self.progress["records"])
+        else:
+            file = open(path, "rb")
+            records = self._iter_ndjson(file, self.progress["offset"])
+
+        with file:
+            batch = {}
+            batch_records = 0
+            batch_skipped = 0
+            offset = self.progress["offset"]
+            for conversation_id, record, record_offset in records:
+                batch_records += 1
+                if record_offset is not None:
+                    offset = record_offset
+                try:
+                    reference = reference_from_dict(record)
+                    conversation_id = conversation_id or reference.conversation.id
+                    if not conversation_id:
+                        raise ValueError("missing conversation id")
+                    batch[conversation_id] = self.storage._serialize_conversation_reference(reference)
+                except Exception as e:
+                    logger.warning(f"Skipping invalid conversation reference {conversation_id}: {e}")
+                    batch_skipped += 1
+                if batch_records >= self.batch_size:
+                    await self._commit(path, batch, batch_records, batch_skipped, offset)
+                    batch, batch_records, batch_skipped = {}, 0, 0
+                    if self.progress["records"] >= next_report:
+                        self._log_progress(started)
+                        next_report = self.progress["records"] + self.progress_interval
+            if batch_records:
+                await self._commit(path, batch, batch_records, batch_skipped, offset)
+
+        self.progress["done"] = True
+        try:
+            os.remove(self.checkpoint_path(path))
+        except FileNotFoundError:
+            pass
+        self._log_progress(started)
+        return dict(self.progress)
+
+    async def _commit(self, path: str, batch: dict, records: int, skipped: int, offset: int):
+        """写入一批并保存检查点"""
+        await self.storage.add_serialized_references(batch)
+        self.progress["records"] += records
+        self.progress["imported"] += len(batch)
+        self.progress["skipped"] += skipped
+        self.progress["offset"] = offset
+        self._save_checkpoint(path)
+        if self.on_progress:
+            self.on_progress(dict(self.progress))
+
+    def _log_progress(self, started: float):
+        elapsed = time.monotonic() - started
+        percent = ""
+        if self.progress["offset"] and self.progress["size"]:
+            percent = f" ({self.progress['offset'] * 100 / self.progress['size']:.1f}%)"
+        logger.info(f"Imported {self.progress['imported']} conversation references from "
+                    f"{self.progress['path']}{percent}, skipped {self.progress['skipped']}, "
+                    f"elapsed {elapsed:.1f}s")
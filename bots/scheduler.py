@@ -0,0 +1,244 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from redis.exceptions import NoScriptError
+
+logger = logging.getLogger(__name__)
+
+# 重复发送的最小间隔（秒）
+MIN_RECURRENCE_INTERVAL = 60
+
+
+class MessageScheduler:
+    """
+    基于 Redis 有序集合的定时消息调度器
+
+    任务 ID 按到期时间（score）存放在有序集合中，任务内容存放在哈希中。每个副本定期用一次
+    Lua 调用认领一批到期任务：认领即把 score 改为租约到期时间，其他副本不会再取到；
+    发送完成后按租约确认（删除或按重复规则改为下次到期时间）。副本在发送途中退出时，
+    租约到期后任务会被重新认领（至少一次）。
+    """
+
+    # KEYS[1]=有序集合, KEYS[2]=任务哈希; ARGV[1]=当前时间, ARGV[2]=租约到期时间, ARGV[3]=最大数量
+    # 返回 [id1, job1, id2, job2, ...]
+    CLAIM_SCRIPT = """
+    local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[3]))
+    local result = {}
+    for _, id in ipairs(ids) do
+        local job = redis.call('HGET', KEYS[2], id)
+        if job then
+            redis.call('ZADD', KEYS[1], ARGV[2], id)
+            table.insert(result, id)
+            table.insert(result, job)
+        else
+            redis.call('ZREM', KEYS[1], id)
+        end
+    end
+    return result
+    """
+
+    # KEYS 同上; ARGV[1]=任务ID, ARGV[2]=认领时的租约, ARGV[3]=下次到期时间（'' 表示删除）, ARGV[4]=更新后的任务
+    # 租约已被其他副本重新认领（发送超过租约时间）时不做修改，返回 0
+    COMPLETE_SCRIPT = """
+    local score = redis.call('ZSCORE', KEYS[1], ARGV[1])
+    if not score or tonumber(score) ~= tonumber(ARGV[2]) then
+        return 0
+    end
+    if ARGV[3] == '' then
+        redis.call('ZREM', KEYS[1], ARGV[1])
+        redis.call('HDEL', KEYS[2], ARGV[1])
+    else
+        redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+        redis.call('HSET', KEYS[2], ARGV[1], ARGV[4])
+    end
+    return 1
+    """
+
+    def __init__(self, redis_client, handler: Callable[[dict], Awaitable], key: str = "bot_scheduled",
+                 poll_interval: float = 1.0, batch_size: int = 100, lease: float = 300.0):
+        """
+        初始化调度器
+
+        Args:
+            redis_client: redis.asyncio 客户端
+            handler: 到期任务的发送函数，参数为任务字典，失败时抛出异常
+            key: 有序集合的键名，任务内容存放在 "<key>:jobs"（Cluster 中需带哈希标签，如 "{bot_scheduled}"）
+            poll_interval: 轮询间隔（秒）
+            batch_size: 每次认领的最大任务数
+            lease: 认领后的租约时间（秒），超过后任务可被重新认领
+        """
+        self.redis_client = redis_client
+        self.handler = handler
+        self.key = key
+        self.jobs_key = f"{key}:jobs"
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.lease = lease
+        self._claim_script = redis_client.register_script(self.CLAIM_SCRIPT)
+        self._complete_script = redis_client.register_script(self.COMPLETE_SCRIPT)
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        self.scheduled = 0
+        self.dispatched = 0
+        self.failed = 0
+        self.lost_leases = 0
+
+    async def schedule(self, job: dict, due_at: float, recurrence: Optional[dict] = None) -> str:
+        """
+        添加定时任务，返回任务ID
+
+        Args:
+            job: 发送内容（交给 handler 的字典）
+            due_at: 首次发送时间（Unix 时间戳）
+            recurrence: 重复规则 {"interval": 秒, "count": 总次数, "until": 截止时间戳}，可选
+        """
+        job_id = uuid.uuid4().hex
+        record = dict(job, id=job_id, due_at=due_at, created_at=time.time(), runs=0)
+        if recurrence:
+            record["recurrence"] = recurrence
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.hset(self.jobs_key, job_id, json.dumps(record, ensure_ascii=False))
+        pipe.zadd(self.key, {job_id: due_at})
+        await pipe.execute()
+        self.scheduled += 1
+        return job_id
+
+    async def cancel(self, job_id: str) -> bool:
+        """取消定时任务，任务不存在时返回 False"""
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.zrem(self.key, job_id)
+        pipe.hdel(self.jobs_key, job_id)
+        removed, _ = await pipe.execute()
+        return bool(removed)
+
+    async def list_jobs(self, offset: int = 0, limit: int = 100) -> Tuple[int, List[dict]]:
+        """按到期时间列出任务，返回 (总数, 任务列表)"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.zcard(self.key)
+        pipe.zrange(self.key, offset, offset + limit - 1)
+        total, job_ids = await pipe.execute()
+        if not job_ids:
+            return total, []
+        records = await self.redis_client.hmget(self.jobs_key, job_ids)
+        return total, [json.loads(record) for record in records if record]
+
+    @staticmethod
+    def next_due(record: dict, now: float) -> Optional[float]:
+        """按重复规则计算下次到期时间；没有重复规则或已结束时返回 None（停机期间错过的周期不补发）"""
+        recurrence = record.get("recurrence")
+        if not recurrence:
+            return None
+        if recurrence.get("count") and record["runs"] >= recurrence["count"]:
+            return None
+        interval = recurrence["interval"]
+        due_at = record["due_at"] + interval
+        if due_at <= now:
+            due_at += (int((now - due_at) // interval) + 1) * interval
+        if recurrence.get("until") and due_at > recurrence["until"]:
+            return None
+        return due_at
+
+    async def _dispatch(self, job_id: str, payload: str) -> list:
+        """发送一个任务，返回确认参数 [任务ID, 下次到期时间（'' 表示删除）, 更新后的任务]"""
+        try:
+            record = json.loads(payload)
+        except ValueError as e:
+            logger.error(f"Dropping scheduled job {job_id} with invalid payload: {e}")
+            return [job_id, "", ""]
+        try:
+            await self.handler(record)
+            self.dispatched += 1
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Scheduled job {job_id} failed: {e}")
+        record["runs"] += 1
+        next_due = self.next_due(record, time.time())
+        if next_due is None:
+            return [job_id, "", ""]
+        record["due_at"] = next_due
+        return [job_id, repr(next_due), json.dumps(record, ensure_ascii=False)]
+
+    async def run_due(self) -> int:
+        """认领并发送一批到期任务，返回认领数量"""
+        now = time.time()
+        lease_until = repr(now + self.lease)
+        claimed = await self._claim_script(
+            keys=[self.key, self.jobs_key], args=[repr(now), lease_until, self.batch_size]
+        )
+        if not claimed:
+            return 0
+        completions = await asyncio.gather(*(
+            self._dispatch(claimed[i], claimed[i + 1]) for i in range(0, len(claimed), 2)
+        ))
+        # 一批任务的确认在同一个管道中提交
+        pipe = self.redis_client.pipeline(transaction=False)
+        for job_id, next_due, record in completions:
+            await self._complete_script(keys=[self.key, self.jobs_key],
+                                        args=[job_id, lease_until, next_due, record], client=pipe)
+        for (job_id, _, _), completed in zip(completions, await pipe.execute()):
+            if not completed:
+                self.lost_leases += 1
+                logger.warning(f"Scheduled job {job_id} was reclaimed before it finished")
+        return len(completions)
+
+    async def _run(self):
+        scripts_loaded = False
+        while not self._stopping:
+            try:
+                if not scripts_loaded:
+                    # Cluster 的 pipeline 不会在 NOSCRIPT 时自动加载脚本，确认脚本需预先加载到所有主节点
+                    await self.redis_client.script_load(self.COMPLETE_SCRIPT)
+                    scripts_loaded = True
+                # 认领满一批说明可能还有到期任务，立即继续
+                if await self.run_due() >= self.batch_size:
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except NoScriptError as e:
+                scripts_loaded = False
+                logger.error(f"Scheduler poll failed: {e}")
+            except Exception as e:
+                logger.error(f"Scheduler poll failed: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self):
+        """启动轮询任务（需在事件循环启动后调用）"""
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Message scheduler started, polling {self.key} every {self.poll_interval}s")
+
+    async def stop(self, timeout: float = 10.0):
+        """停止轮询：等待正在发送的任务完成，未完成的在租约到期后由其他副本或下次启动重新认领"""
+        if self._task is None:
+            return
+        self._stopping = True
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def get_stats(self) -> dict:
+        """获取调度统计信息"""
+        stats = {
+            "scheduled": self.scheduled,
+            "dispatched": self.dispatched,
+            "failed": self.failed,
+            "lost_leases": self.lost_leases,
+        }
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.zcard(self.key)
+            pipe.zcount(self.key, "-inf", time.time())
+            pending, due = await pipe.execute()
+            stats.update({"pending": pending, "due": due})
+        except Exception as e:
+            stats["error"] = str(e)
+        return stats
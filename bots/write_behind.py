@@ -0,0 +1,167 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from botbuilder.schema import ConversationReference
+
+from .redis_storage import RedisConversationReferences
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationReferenceWriteBuffer:
+    """
+    对话引用写缓冲：跳过未变化的写入，并按时间间隔或数量批量刷新到Redis
+
+    未变化的对话仍会记录一次活动，刷新时只批量更新最后活跃时间；
+    若对话已被删除（过期清理或发送失败），则重新写入完整引用。
+    """
+
+    # activity_id 每条消息都会变化，但主动发送并不依赖它，因此不计入指纹
+    IGNORED_FIELDS = ("activity_id",)
+
+    def __init__(self, storage: RedisConversationReferences, flush_interval: float = 1.0,
+                 max_batch: int = 200, max_fingerprints: int = 100000):
+        """
+        初始化写缓冲
+
+        Args:
+            storage: Redis对话引用存储
+            flush_interval: 定时刷新间隔（秒）
+            max_batch: 待写入数量达到该值时立即刷新
+            max_fingerprints: 最多记住多少个对话的已持久化指纹（LRU淘汰）
+        """
+        self.storage = storage
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_fingerprints = max_fingerprints
+
+        self._fingerprints: "OrderedDict[str, int]" = OrderedDict()
+        self._pending: Dict[str, Tuple[dict, int]] = {}
+        # 引用未变化、只需更新最后活跃时间的对话
+        self._touched: Dict[str, Tuple[dict, int]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_requested = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        self.writes_skipped = 0
+        self.writes_flushed = 0
+        self.touches_flushed = 0
+        self.flush_count = 0
+        self.flush_errors = 0
+
+    def _fingerprint(self, serialized_ref: dict) -> int:
+        """计算对话引用指纹"""
+        return hash(tuple(value for field, value in serialized_ref.items()
+                          if field not in self.IGNORED_FIELDS))
+
+    def start(self):
+        """启动后台刷新任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """停止后台任务并刷新剩余的写入"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        logger.info(f"Write buffer closed: {self.get_stats()}")
+
+    def add(self, conversation_id: str, reference: ConversationReference):
+        """记录一次对话引用写入，未变化时直接跳过"""
+        serialized_ref = self.storage._serialize_conversation_reference(reference)
+        fingerprint = self._fingerprint(serialized_ref)
+
+        pending = self._pending.get(conversation_id)
+        if pending is not None:
+            if pending[1] == fingerprint:
+                self.writes_skipped += 1
+                return
+        elif self._fingerprints.get(conversation_id) == fingerprint:
+            self._fingerprints.move_to_end(conversation_id)
+            self.writes_skipped += 1
+            self._touched[conversation_id] = (serialized_ref, fingerprint)
+            if len(self._touched) >= self.max_batch:
+                self._flush_requested.set()
+            return
+
+        self._pending[conversation_id] = (serialized_ref, fingerprint)
+        if len(self._pending) >= self.max_batch:
+            self._flush_requested.set()
+
+    def discard(self, conversation_id: str):
+        """丢弃某个对话尚未写入的引用及指纹（删除对话引用时调用）"""
+        self._pending.pop(conversation_id, None)
+        self._touched.pop(conversation_id, None)
+        self._fingerprints.pop(conversation_id, None)
+
+    async def flush(self):
+        """把待写入的引用通过一个 pipeline 写入Redis，并批量更新未变化对话的最后活跃时间"""
+        async with self._flush_lock:
+            if not self._pending and not self._touched:
+                return
+            batch, self._pending = self._pending, {}
+            touched, self._touched = self._touched, {}
+            touched = {conversation_id: item for conversation_id, item in touched.items()
+                       if conversation_id not in batch}
+            try:
+                if touched:
+                    missing = await self.storage.touch_conversation_references(list(touched))
+                    for conversation_id in missing:
+                        batch[conversation_id] = touched.pop(conversation_id)
+                    self.touches_flushed += len(touched)
+                    touched = {}
+                if batch:
+                    await self.storage.add_serialized_references(
+                        {conversation_id: item[0] for conversation_id, item in batch.items()}
+                    )
+            except Exception:
+                self.flush_errors += 1
+                # 写入失败时放回队列，已有更新的引用优先
+                for conversation_id, item in batch.items():
+                    self._pending.setdefault(conversation_id, item)
+                for conversation_id, item in touched.items():
+                    self._touched.setdefault(conversation_id, item)
+                raise
+
+            for conversation_id, (_, fingerprint) in batch.items():
+                self._fingerprints[conversation_id] = fingerprint
+                self._fingerprints.move_to_end(conversation_id)
+            while len(self._fingerprints) > self.max_fingerprints:
+                self._fingerprints.popitem(last=False)
+
+            self.writes_flushed += len(batch)
+            self.flush_count += 1
+            logger.debug(f"Flushed {len(batch)} conversation references")
+
+    async def _run(self):
+        """后台刷新循环"""
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Failed to flush conversation references: {e}")
+
+    def get_stats(self) -> dict:
+        """获取写缓冲统计信息"""
+        return {
+            "writes_skipped": self.writes_skipped,
+            "writes_flushed": self.writes_flushed,
+            "touches_flushed": self.touches_flushed,
+            "flush_count": self.flush_count,
+            "flush_errors": self.flush_errors,
+            "pending": len(self._pending),
+            "pending_touches": len(self._touched),
+            "fingerprints": len(self._fingerprints),
+        }
@@ -20,4 +20,49 @@ class DefaultConfig:
     REDIS_HOST = 
     REDIS_PORT = 
     REDIS_PASSWORD = 
+    REDIS_MODE = os.environ.get("REDIS_MODE", "standalone")
+    REDIS_SENTINELS = os.environ.get("REDIS_SENTINELS", "")
+    REDIS_SENTINEL_MASTER = os.environ.get("REDIS_SENTINEL_MASTER", "mymaster")
+    REDIS_SENTINEL_PASSWORD = os.environ.get("REDIS_SENTINEL_PASSWORD", "")
+    REDIS_CLUSTER_NODES = os.environ.get("REDIS_CLUSTER_NODES", "")
+    REDIS_READ_FROM_REPLICAS = os.environ.get("REDIS_READ_FROM_REPLICAS", "false").lower() == "true"
+    REDIS_SCAN_COUNT = int(os.environ.get("REDIS_SCAN_COUNT", "1000"))
+    STORAGE_COMPACT_FORMAT = os.environ.get("STORAGE_COMPACT_FORMAT", "true").lower() == "true"
+    REFERENCE_CACHE_MAX_ENTRIES = int(os.environ.get("REFERENCE_CACHE_MAX_ENTRIES", "10000"))
+    REFERENCE_CACHE_TTL = float(os.environ.get("REFERENCE_CACHE_TTL", "300"))
+    REFERENCE_MAX_IDLE_DAYS = float(os.environ.get("REFERENCE_MAX_IDLE_DAYS", "0"))
+    REFERENCE_SWEEP_INTERVAL = float(os.environ.get("REFERENCE_SWEEP_INTERVAL", "3600"))
+    REMOVE_DEAD_REFERENCES = os.environ.get("REMOVE_DEAD_REFERENCES", "true").lower() == "true"
+    WRITE_FLUSH_INTERVAL = float(os.environ.get("WRITE_FLUSH_INTERVAL", "1.0"))
+    WRITE_BATCH_SIZE = int(os.environ.get("WRITE_BATCH_SIZE", "200"))
+    INBOUND_FAST_ACK = os.environ.get("INBOUND_FAST_ACK", "false").lower() == "true"
+    INBOUND_WORKERS = int(os.environ.get("INBOUND_WORKERS", "16"))
+    INBOUND_QUEUE_SIZE = int(os.environ.get("INBOUND_QUEUE_SIZE", "1000"))
+    INBOUND_DEDUPE_TTL = int(os.environ.get("INBOUND_DEDUPE_TTL", "600"))
+    BROADCAST_CONCURRENCY = int(os.environ.get("BROADCAST_CONCURRENCY", "64"))
+    BROADCAST_PER_SERVICE_URL_CONCURRENCY = int(os.environ.get("BROADCAST_PER_SERVICE_URL_CONCURRENCY", "16"))
+    BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "1000"))
+    CARD_CACHE_MAX_ENTRIES = int(os.environ.get("CARD_CACHE_MAX_ENTRIES", "1024"))
+    CARD_CACHE_MAX_BYTES = int(os.environ.get("CARD_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+    CARD_CACHE_TTL = float(os.environ.get("CARD_CACHE_TTL", "600"))
+    COALESCE_WINDOW_MS = float(os.environ.get("COALESCE_WINDOW_MS", "0"))
+    COALESCE_DEFAULT = os.environ.get("COALESCE_DEFAULT", "false").lower() == "true"
+    COALESCE_MAX_CARD_BYTES = int(os.environ.get("COALESCE_MAX_CARD_BYTES", str(24 * 1024)))
+    TOKEN_REFRESH_MARGIN = float(os.environ.get("TOKEN_REFRESH_MARGIN", "300"))
+    RATE_LIMIT_CONVERSATION_RATE = float(os.environ.get("RATE_LIMIT_CONVERSATION_RATE", "2"))
+    RATE_LIMIT_CONVERSATION_BURST = float(os.environ.get("RATE_LIMIT_CONVERSATION_BURST", "7"))
+    RATE_LIMIT_SERVICE_URL_RATE = float(os.environ.get("RATE_LIMIT_SERVICE_URL_RATE", "50"))
+    RATE_LIMIT_SERVICE_URL_BURST = float(os.environ.get("RATE_LIMIT_SERVICE_URL_BURST", "50"))
+    RATE_LIMIT_MAX_RETRIES = int(os.environ.get("RATE_LIMIT_MAX_RETRIES", "5"))
+    OUTBOUND_QUEUE_WORKERS = int(os.environ.get("OUTBOUND_QUEUE_WORKERS", "4"))
+    OUTBOUND_QUEUE_DEFAULT = os.environ.get("OUTBOUND_QUEUE_DEFAULT", "false").lower() == "true"
+    OUTBOUND_QUEUE_MAX_DELIVERIES = int(os.environ.get("OUTBOUND_QUEUE_MAX_DELIVERIES", "5"))
+    SCHEDULER_POLL_INTERVAL = float(os.environ.get("SCHEDULER_POLL_INTERVAL", "1.0"))
+    SCHEDULER_BATCH_SIZE = int(os.environ.get("SCHEDULER_BATCH_SIZE", "100"))
     JSON_BACKUP_FILE = os.environ.get("JSON_BACKUP_FILE", "conversation_references.json")
+    IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", "500"))
+    WARMUP_REFERENCES = int(os.environ.get("WARMUP_REFERENCES", "0"))
+    WARMUP_TIMEOUT = float(os.environ.get("WARMUP_TIMEOUT", "60"))
+    READINESS_TIMEOUT = float(os.environ.get("READINESS_TIMEOUT", "1.0"))
+    WORKERS = int(os.environ.get("WORKERS", "1"))
+    SHUTDOWN_TIMEOUT = float(os.environ.get("SHUTDOWN_TIMEOUT", "30"))